@@ -0,0 +1,577 @@
+"""
+Asynchronous order acceptance for the gateway (checkout_acceptance=async).
+
+POST /checkout validates the order, appends it to a local journal (SQLite,
+group commit) and answers 202 with the order id once the append is
+committed. A pool of asyncio workers takes accepted orders in arrival order
+and runs each through the normal checkout path to order_service, passing
+the id along (X-Order-Id) so the order gets the id the client was given.
+Clients poll GET /checkout/{order_id}, or long-poll with ?wait=seconds.
+
+Several gateway processes may share one journal (launcher workers). Each
+unfinished row is leased to the process running it (owner, lease_until),
+renewed by a heartbeat while it lives; a process only takes over rows whose
+lease has expired, so a sibling's in-flight orders are never run twice.
+Orders of a process that stopped or died are run again once their lease is
+released or runs out; order_service answers an id it has already completed
+from its store, and refuses one still in flight, instead of charging again.
+"""
+from __future__ import annotations
+import asyncio
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from common.config import config, get_config_value, get_int_setting
+from common.deadline import Deadline
+from common.metrics import metrics
+from common.models import CreateOrderRequest, OrderResponse
+from common.request_log import request_log
+from common.resilience import current_deadline
+
+ACCEPTED, PROCESSING, COMPLETED, FAILED = "ACCEPTED", "PROCESSING", "COMPLETED", "FAILED"
+
+metrics.describe("gateway_async_checkout_pending", "Accepted checkouts not yet finished")
+metrics.describe("gateway_async_checkout_total", "Asynchronous checkouts by result (completed, failed, retried)")
+metrics.describe("gateway_async_checkout_queue_ms", "Time from acceptance until a worker picks the checkout up")
+metrics.describe("gateway_async_checkout_ms", "Time from acceptance until the checkout is finished")
+metrics.describe("gateway_async_checkout_journal_batch", "Journal writes per group commit")
+
+Processor = Callable[[CreateOrderRequest, str], Awaitable[OrderResponse]]
+
+
+class CheckoutAccepted(BaseModel):
+    order_id: str
+    status: str = ACCEPTED
+    status_url: str
+
+
+class CheckoutState(BaseModel):
+    order_id: str
+    status: str
+    attempts: int = 0
+    order: Optional[OrderResponse] = None
+    error: Optional[str] = None
+
+
+class _Job:
+    __slots__ = ("order_id", "request", "status", "attempts", "order", "error", "accepted_at", "done")
+
+    def __init__(self, order_id: str, request: CreateOrderRequest, accepted_at: float, attempts: int = 0) -> None:
+        self.order_id = order_id
+        self.request = request
+        self.status = ACCEPTED
+        self.attempts = attempts
+        self.order: Optional[OrderResponse] = None
+        self.error: Optional[str] = None
+        self.accepted_at = accepted_at  # wall clock, as journalled
+        self.done: Optional[asyncio.Event] = None  # created by the first long-poll
+
+    def state(self) -> CheckoutState:
+        return CheckoutState(
+            order_id=self.order_id, status=self.status, attempts=self.attempts, order=self.order, error=self.error
+        )
+
+
+# ---- Journal ----
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkouts (
+    order_id    TEXT PRIMARY KEY,
+    request     TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    attempts    INTEGER NOT NULL,
+    result      TEXT,
+    error       TEXT,
+    accepted_at REAL NOT NULL,
+    finished_at REAL,
+    owner       TEXT,
+    lease_until REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS checkouts_by_status ON checkouts (status, accepted_at);
+"""
+# Journals written before leases existed
+_MIGRATIONS = {
+    "owner": "ALTER TABLE checkouts ADD COLUMN owner TEXT",
+    "lease_until": "ALTER TABLE checkouts ADD COLUMN lease_until REAL NOT NULL DEFAULT 0",
+}
+
+
+class CheckoutJournal:
+    """
+    Accepted checkouts in SQLite (WAL), on one dedicated thread like
+    SqliteOrderRepository. write() applies a batch of appends and final
+    states in one transaction. synchronous=FULL by default: a 202 is a
+    promise, so an accepted order must survive power loss as well.
+
+    Unfinished rows carry a lease: appends are leased to `owner`, renew()
+    extends all of its leases, claim_expired() takes over rows whose lease
+    ran out and release() hands them back on shutdown. Each runs in one
+    transaction, so processes sharing the file never both hold a row.
+    """
+
+    def __init__(self, path: str, owner: str, synchronous: str = "FULL", lease_seconds: float = 15.0) -> None:
+        self.path = path
+        self.owner = owner
+        self.synchronous = synchronous
+        self.lease_seconds = lease_seconds
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _open(self) -> None:
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.executescript(_SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(checkouts)")}
+        for column, ddl in _MIGRATIONS.items():
+            if column not in columns:
+                conn.execute(ddl)
+        self._conn = conn
+
+    async def start(self) -> None:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkout-journal")
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._open)
+
+    async def _run(self, fn, *args):
+        if self._executor is None:
+            await self.start()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _write(self, appends: List[_Job], finishes: List[_Job]) -> None:
+        conn = self._conn
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO checkouts (order_id, request, status, attempts, accepted_at, owner, lease_until) "
+                "VALUES (?, ?, ?, 0, ?, ?, ?)",
+                [
+                    (j.order_id, j.request.model_dump_json(), ACCEPTED, j.accepted_at, self.owner,
+                     now + self.lease_seconds)
+                    for j in appends
+                ],
+            )
+            conn.executemany(
+                "UPDATE checkouts SET status = ?, attempts = ?, result = ?, error = ?, finished_at = ? "
+                "WHERE order_id = ?",
+                [
+                    (j.status, j.attempts, j.order.model_dump_json() if j.order else None, j.error, now, j.order_id)
+                    for j in finishes
+                ],
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _claim_expired(self) -> List[Tuple[str, str, int, float]]:
+        conn = self._conn
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE checkouts SET owner = ?, lease_until = ? WHERE status = ? AND lease_until < ?",
+                (self.owner, now + self.lease_seconds, ACCEPTED, now),
+            )
+            rows = conn.execute(
+                "SELECT order_id, request, attempts, accepted_at FROM checkouts "
+                "WHERE status = ? AND owner = ? ORDER BY accepted_at",
+                (ACCEPTED, self.owner),
+            ).fetchall()
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return rows
+
+    def _renew(self) -> int:
+        return self._conn.execute(
+            "UPDATE checkouts SET lease_until = ? WHERE status = ? AND owner = ?",
+            (time.time() + self.lease_seconds, ACCEPTED, self.owner),
+        ).rowcount
+
+    def _release(self) -> int:
+        return self._conn.execute(
+            "UPDATE checkouts SET lease_until = 0 WHERE status = ? AND owner = ?", (ACCEPTED, self.owner)
+        ).rowcount
+
+    def _get(self, order_id: str) -> Optional[CheckoutState]:
+        row = self._conn.execute(
+            "SELECT status, attempts, result, error FROM checkouts WHERE order_id = ?", (order_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, attempts, result, error = row
+        return CheckoutState(
+            order_id=order_id, status=status, attempts=attempts,
+            order=OrderResponse.model_validate_json(result) if result else None, error=error,
+        )
+
+    def _purge(self, before: float) -> int:
+        return self._conn.execute(
+            "DELETE FROM checkouts WHERE status != ? AND finished_at < ?", (ACCEPTED, before)
+        ).rowcount
+
+    async def write(self, appends: List[_Job], finishes: List[_Job]) -> None:
+        await self._run(self._write, appends, finishes)
+
+    async def claim_expired(self) -> List[Tuple[str, str, int, float]]:
+        """Takes over unfinished rows whose lease expired; returns every unfinished row this owner holds."""
+        return await self._run(self._claim_expired)
+
+    async def renew(self) -> int:
+        return await self._run(self._renew)
+
+    async def release(self) -> int:
+        """Expires this owner's leases so another process picks its unfinished rows up at once."""
+        return await self._run(self._release)
+
+    async def get(self, order_id: str) -> Optional[CheckoutState]:
+        return await self._run(self._get, order_id)
+
+    async def purge(self, before: float) -> int:
+        return await self._run(self._purge, before)
+
+    async def close(self) -> None:
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            await asyncio.get_running_loop().run_in_executor(executor, conn.close)
+        executor.shutdown(wait=True)
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """Failures worth another attempt: transport errors, 429 and 5xx from order_service."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        # 409: order_service is still running this id for an earlier attempt;
+        # the retry gets the stored order once that one finishes.
+        return exc.response.status_code in (409, 429) or exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+# ---- Queue and workers ----
+class AsyncCheckouts:
+    """
+    Accepted checkouts: journal writer, worker pool and status lookups.
+
+    submit() waits for the group commit that journals the order, so a 202
+    is only sent for an order that will be run even if the gateway dies
+    right after. Final states are journalled without waiting. Past
+    `max_pending` unfinished orders submit() answers 503 with Retry-After
+    instead of accepting work the workers cannot reach in time.
+
+    Failed attempts that may succeed later (transport errors, 409, 429, 5xx)
+    are retried with exponential backoff (at most 5 s apart) up to
+    `max_attempts`; anything else, and an order_service answer of FAILED,
+    finishes the order.
+    """
+
+    def __init__(
+        self,
+        journal: CheckoutJournal,
+        workers: int = 32,
+        max_pending: int = 10_000,
+        max_attempts: int = 8,
+        retry_base_ms: float = 100.0,
+        batch_size: int = 256,
+        max_finished: int = 10_000,
+        retention_seconds: float = 86_400.0,
+        max_wait_seconds: float = 30.0,
+        recover_delay_ms: float = 1000.0,
+    ) -> None:
+        self.journal = journal
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_base_ms = retry_base_ms
+        self.batch_size = batch_size
+        self.max_finished = max_finished
+        self.retention_seconds = retention_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.recover_delay_ms = recover_delay_ms
+        self.lease_seconds = journal.lease_seconds
+        # Runs one order through order_service; set by create_app() for its mode.
+        self.processor: Optional[Processor] = None
+        self._active: Dict[str, _Job] = {}
+        self._finished: "OrderedDict[str, _Job]" = OrderedDict()
+        self._ready: Optional[asyncio.Queue] = None
+        self._writes: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+        self._pending_gauge = metrics.gauge("gateway_async_checkout_pending")
+        self._results = {
+            result: metrics.counter("gateway_async_checkout_total", result=result)
+            for result in ("completed", "failed", "retried")
+        }
+        self._queue_ms = metrics.histogram("gateway_async_checkout_queue_ms")
+        self._total_ms = metrics.histogram("gateway_async_checkout_ms")
+        self._journal_batch = metrics.histogram("gateway_async_checkout_journal_batch")
+
+    # -- lifecycle --
+    async def start(self) -> None:
+        """Opens the journal, starts the workers and re-queues orders a previous run did not finish."""
+        if self._writer is not None:
+            return
+        await self.journal.start()
+        self._ready = asyncio.Queue()
+        self._writes = asyncio.Queue()
+        self._stopping = False
+        loop = asyncio.get_running_loop()
+        self._writer = loop.create_task(self._write_loop())
+        self._tasks = [loop.create_task(self._work_loop()) for _ in range(self.workers)]
+        self._tasks += [
+            loop.create_task(self._recover_loop()),
+            loop.create_task(self._heartbeat_loop()),
+            loop.create_task(self._purge_loop()),
+        ]
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """
+        Stops the workers and journals the final states reached so far
+        (waiting up to `timeout`). Orders still in flight stay ACCEPTED in
+        the journal with their leases released, so a sibling process or the
+        next start runs them.
+        """
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        tasks, self._tasks = self._tasks, []
+        # Checked by the workers too: a cancellation absorbed somewhere in
+        # the HTTP stack must not send a worker back to the queue.
+        self._stopping = True
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await asyncio.wait_for(self._writes.join(), timeout)
+        except asyncio.TimeoutError:
+            request_log.event("AsyncCheckouts", "closed with unjournalled results", writes=self._writes.qsize())
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+        try:
+            await self.journal.release()
+        except Exception as e:
+            request_log.event("AsyncCheckouts", "lease release failed", error=repr(e))
+        self._active.clear()
+        self._pending_gauge.set(0)
+        self._ready = self._writes = None
+        await self.journal.close()
+
+    async def _recover_loop(self) -> None:
+        # First pass after a delay: when the whole stack restarts,
+        # order_service may come up after the gateway. Then once per lease
+        # period, for the orders of sibling processes that died since.
+        await asyncio.sleep(self.recover_delay_ms / 1000.0)
+        while True:
+            try:
+                await self._recover()
+            except Exception as e:
+                request_log.event("AsyncCheckouts", "recovery failed", error=repr(e))
+            await asyncio.sleep(self.lease_seconds)
+
+    async def _recover(self) -> None:
+        recovered = 0
+        for order_id, request, attempts, accepted_at in await self.journal.claim_expired():
+            if order_id in self._active:
+                continue  # accepted or already recovered by this process
+            if order_id in self._finished:
+                continue  # finished here; the final state is still queued for the journal
+            job = _Job(order_id, CreateOrderRequest.model_validate_json(request), accepted_at, attempts)
+            self._active[order_id] = job
+            self._pending_gauge.inc()
+            self._ready.put_nowait(job)
+            recovered += 1
+        if recovered:
+            request_log.event("AsyncCheckouts", "re-queued unfinished checkouts", orders=recovered)
+
+    async def _heartbeat_loop(self) -> None:
+        # Renews this process's leases well before they run out.
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3.0)
+            try:
+                await self.journal.renew()
+            except Exception as e:
+                request_log.event("AsyncCheckouts", "lease renewal failed", error=repr(e))
+
+    # -- accepting --
+    async def submit(self, req: CreateOrderRequest) -> CheckoutAccepted:
+        if self._writer is None:
+            # Switched to async acceptance while running: start on first use.
+            await self.start()
+        if len(self._active) >= self.max_pending:
+            raise HTTPException(status_code=503, detail="Checkout queue full", headers={"Retry-After": "1"})
+        job = _Job(str(uuid.uuid4()), req, time.time())
+        self._active[job.order_id] = job
+        self._pending_gauge.inc()
+        done = asyncio.get_running_loop().create_future()
+        self._writes.put_nowait((job, True, done))
+        try:
+            await done
+        except Exception:
+            self._active.pop(job.order_id, None)
+            self._pending_gauge.dec()
+            raise HTTPException(status_code=503, detail="Checkout journal unavailable", headers={"Retry-After": "1"})
+        return CheckoutAccepted(order_id=job.order_id, status_url=f"/checkout/{job.order_id}")
+
+    # -- status --
+    async def status(self, order_id: str, wait: float = 0.0) -> Optional[CheckoutState]:
+        """Current state of an order; with `wait`, until it finishes or `wait` seconds pass."""
+        job = self._active.get(order_id)
+        if job is not None and wait > 0:
+            if job.done is None:
+                job.done = asyncio.Event()
+            try:
+                await asyncio.wait_for(job.done.wait(), min(wait, self.max_wait_seconds))
+            except asyncio.TimeoutError:
+                pass
+        job = job or self._finished.get(order_id)
+        if job is not None:
+            return job.state()
+        if self._writer is None:
+            return None
+        return await self.journal.get(order_id)
+
+    # -- workers --
+    async def _work_loop(self) -> None:
+        ready = self._ready
+        while not self._stopping:
+            job = await ready.get()
+            self._queue_ms.observe((time.time() - job.accepted_at) * 1000.0)
+            await self._run(job)
+
+    async def _run(self, job: _Job) -> None:
+        job.status = PROCESSING
+        while True:
+            job.attempts += 1
+            # A full budget per attempt; workers are not inside any request.
+            token = current_deadline.set(Deadline(config.current.http_timeout_seconds))
+            try:
+                order = await self.processor(job.request, job.order_id)
+            except asyncio.CancelledError:
+                job.status = ACCEPTED
+                raise
+            except Exception as e:
+                if self._stopping:
+                    job.status = ACCEPTED
+                    return
+                if _is_transient(e) and job.attempts < self.max_attempts:
+                    self._results["retried"].inc()
+                    await asyncio.sleep(min(self.retry_base_ms / 1000.0 * 2 ** (job.attempts - 1), 5.0))
+                    continue
+                job.error = f"{type(e).__name__}: {e}"
+                self._finish(job, FAILED)
+                return
+            finally:
+                current_deadline.reset(token)
+            job.order = order
+            self._finish(job, COMPLETED if order.status == COMPLETED else FAILED)
+            return
+
+    def _finish(self, job: _Job, status: str) -> None:
+        job.status = status
+        self._results["completed" if status == COMPLETED else "failed"].inc()
+        self._total_ms.observe((time.time() - job.accepted_at) * 1000.0)
+        self._active.pop(job.order_id, None)
+        self._pending_gauge.dec()
+        self._finished[job.order_id] = job
+        if len(self._finished) > self.max_finished:
+            self._finished.popitem(last=False)
+        if job.done is not None:
+            job.done.set()
+        self._writes.put_nowait((job, False, None))
+
+    # -- journal writer --
+    async def _write_loop(self) -> None:
+        """
+        Group commit: takes whatever writes are queued (up to batch_size) and
+        journals them in one transaction, so appends that arrive during a
+        commit share the next one.
+        """
+        writes = self._writes
+        while True:
+            batch = [await writes.get()]
+            while len(batch) < self.batch_size and not writes.empty():
+                batch.append(writes.get_nowait())
+            appends = [(job, done) for job, append, done in batch if append]
+            finishes = [job for job, append, _ in batch if not append]
+            delay = 0.05
+            while True:
+                try:
+                    await self.journal.write([job for job, _ in appends], finishes)
+                    self._journal_batch.observe(len(appends) + len(finishes))
+                    for job, done in appends:
+                        # Queued for the workers here, not in submit(): an order
+                        # whose client went away after the commit still runs.
+                        self._ready.put_nowait(job)
+                        if not done.done():
+                            done.set_result(None)
+                    break
+                except Exception as e:
+                    request_log.event("AsyncCheckouts", "journal write failed", writes=len(batch), error=repr(e))
+                    # Appends fail (the caller gets 503 and may retry); final states are retried.
+                    for _, done in appends:
+                        if not done.done():
+                            done.set_exception(e)
+                    appends = []
+                    if not finishes:
+                        break
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 2.0)
+            for _ in batch:
+                writes.task_done()
+
+    async def _purge_loop(self) -> None:
+        interval = min(60.0, self.retention_seconds)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.journal.purge(time.time() - self.retention_seconds)
+            except Exception as e:
+                request_log.event("AsyncCheckouts", "journal purge failed", error=repr(e))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "running": self._writer is not None,
+            "pending": len(self._active),
+            "queued": self._ready.qsize() if self._ready is not None else 0,
+            **{result: c.value for result, c in self._results.items()},
+        }
+
+
+def async_checkouts_from_config() -> AsyncCheckouts:
+    path = get_config_value("checkout_queue_path", "data/checkout_queue.db")
+    if path != ":memory:" and not Path(path).is_absolute():
+        path = str(config.path.parent / path)
+    return AsyncCheckouts(
+        CheckoutJournal(
+            path,
+            owner=uuid.uuid4().hex,
+            synchronous=get_config_value("checkout_queue_synchronous", "FULL").upper(),
+            lease_seconds=float(get_int_setting("checkout_queue_lease_seconds", 15)),
+        ),
+        workers=get_int_setting("checkout_queue_workers", 32),
+        max_pending=get_int_setting("checkout_queue_max_pending", 10_000),
+        max_attempts=get_int_setting("checkout_queue_max_attempts", 8),
+        retry_base_ms=float(get_int_setting("checkout_queue_retry_base_ms", 100)),
+        batch_size=get_int_setting("checkout_queue_batch_size", 256),
+        max_finished=get_int_setting("checkout_queue_finished_cache", 10_000),
+        retention_seconds=float(get_int_setting("checkout_queue_retention_seconds", 86_400)),
+        max_wait_seconds=float(get_int_setting("checkout_queue_max_wait_seconds", 30)),
+        recover_delay_ms=float(get_int_setting("checkout_queue_recover_delay_ms", 1000)),
+    )
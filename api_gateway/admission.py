@@ -0,0 +1,313 @@
+"""
+Admission control for the gateway's checkout endpoints.
+
+Requests are admitted or rejected on arrival, never queued:
+
+- per-user rate limit: a token bucket per user_id (GCRA: one float per
+  user). Over the limit -> 429 with Retry-After.
+- adaptive concurrency limit: an AIMD limit on checkouts in flight to
+  order_service, steered by their latency. Over the limit -> 503 with
+  Retry-After, so overload turns into fast rejections instead of queues in
+  every service behind the gateway.
+- priority lanes: a lane may only fill its share of the limit, so "low"
+  traffic (bulk /checkout/batch by default) is shed first and "critical"
+  keeps some headroom. Requests pick a lane with the X-Priority header.
+
+With asynchronous acceptance the per-user rate limit applies to /checkout
+on arrival, and the concurrency limit to the workers' calls to
+order_service; a worker waits for a slot instead of being rejected, since
+its order has already been accepted.
+"""
+from __future__ import annotations
+import asyncio
+import math
+import time
+from contextlib import nullcontext
+from typing import Dict, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+from common.config import get_config_value, get_int_setting
+from common.metrics import Counter, metrics
+
+PRIORITY_HEADER = "X-Priority"
+CRITICAL, NORMAL, LOW = "critical", "normal", "low"
+# Share of the concurrency limit each lane may fill.
+LANES: Dict[str, float] = {CRITICAL: 1.0, NORMAL: 0.9, LOW: 0.6}
+
+metrics.describe("gateway_admission_limit", "Current adaptive concurrency limit for checkouts")
+metrics.describe("gateway_admission_in_flight", "Admitted checkouts in flight")
+metrics.describe("gateway_admission_rejections_total", "Checkouts rejected on arrival, per lane and reason")
+metrics.describe("gateway_admission_users", "Users with a non-full token bucket")
+
+
+def lane_of(priority: Optional[str], default: str = NORMAL) -> str:
+    if priority is None:
+        return default
+    priority = priority.strip().lower()
+    return priority if priority in LANES else default
+
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit driven by the latency gradient.
+
+    Latency is smoothed (EWMA over completions); the no-load latency is the
+    lowest smoothed value over the last two windows of `window` completions,
+    so it is re-learned as the system changes. While the smoothed latency
+    exceeds `tolerance` times the no-load latency, or when a call fails,
+    the limit is multiplied by `backoff`; only completions that started
+    after the last decrease count, so one slow burst cuts it once, not once
+    per response. Otherwise each completion adds 1/limit (about +1 per
+    limit's worth) while more than half the limit is in use; an idle limit
+    does not grow.
+    """
+
+    def __init__(self, initial: float = 64, min_limit: float = 8, max_limit: float = 1024,
+                 tolerance: float = 2.0, backoff: float = 0.9, window: int = 500,
+                 smoothing: float = 0.1) -> None:
+        self.limit = float(initial)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.window = window
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self.latency = 0.0  # smoothed, seconds
+        self._samples = 0
+        self._window_min = math.inf
+        self._prev_window_min = math.inf
+        self._last_decrease = 0.0
+        self._limit_gauge = metrics.gauge("gateway_admission_limit")
+        self._in_flight_gauge = metrics.gauge("gateway_admission_in_flight")
+        self._limit_gauge.set(self.limit)
+
+    @property
+    def baseline(self) -> float:
+        return min(self._window_min, self._prev_window_min)
+
+    def try_acquire(self, share: float) -> bool:
+        if self.in_flight >= max(1, int(self.limit * share)):
+            return False
+        self.in_flight += 1
+        self._in_flight_gauge.inc()
+        return True
+
+    def release(self, started_at: float, ok: bool) -> None:
+        now = time.monotonic()
+        in_use = self.in_flight
+        self.in_flight -= 1
+        self._in_flight_gauge.dec()
+        if ok:
+            sample = now - started_at
+            self.latency = sample if not self._samples and self.latency == 0.0 else (
+                self.latency + self.smoothing * (sample - self.latency)
+            )
+            self._samples += 1
+            if self.latency < self._window_min:
+                self._window_min = self.latency
+            if self._samples >= self.window:
+                self._prev_window_min, self._window_min, self._samples = self._window_min, math.inf, 0
+
+        if not ok or self.latency > self.baseline * self.tolerance:
+            if started_at >= self._last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+                self._limit_gauge.set(self.limit)
+        elif in_use * 2 > self.limit:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._limit_gauge.set(self.limit)
+
+    def retry_after(self) -> float:
+        """Seconds a rejected caller should wait: about one request's worth of latency."""
+        return self.latency or 1.0
+
+
+class UserRateLimiter:
+    """
+    Token bucket per user, kept as GCRA: each user's entry is a single
+    float, the time at which the bucket would be full again (theoretical
+    arrival time). An entry in the past is the same as no entry, so entries
+    expire on their own and are dropped lazily from the front of the table,
+    which stays ordered by last update. Past `max_users` the oldest entries
+    are dropped early, which only ever errs towards admitting.
+    """
+
+    def __init__(self, rate_per_s: float, burst: int, max_users: int = 100_000) -> None:
+        self.interval = 1.0 / rate_per_s
+        self.tolerance = self.interval * max(0, burst - 1)
+        self.max_users = max_users
+        self._tat: Dict[str, float] = {}
+        self._users_gauge = metrics.gauge("gateway_admission_users")
+
+    def acquire(self, user_id: str) -> Tuple[bool, float]:
+        """(admitted, seconds until a token is available)."""
+        now = time.monotonic()
+        tat = self._tat.pop(user_id, now)
+        if tat < now:
+            tat = now
+        wait = tat - now - self.tolerance
+        if wait > 0:
+            self._tat[user_id] = tat
+            return False, wait
+        self._tat[user_id] = tat + self.interval
+        self._sweep(now)
+        return True, 0.0
+
+    def refund(self, user_id: str) -> None:
+        """Returns the token of an admitted request that was then turned away."""
+        tat = self._tat.get(user_id)
+        if tat is not None:
+            self._tat[user_id] = tat - self.interval
+
+    def _sweep(self, now: float) -> None:
+        # Amortised O(1): every acquire pushes one entry to the back, and
+        # expired or surplus entries are popped from the front.
+        tat = self._tat
+        while tat:
+            user_id = next(iter(tat))
+            if tat[user_id] > now and len(tat) <= self.max_users:
+                break
+            del tat[user_id]
+        self._users_gauge.set(len(tat))
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+
+class _Admitted:
+    """Context manager for one admitted request; feeds its outcome back to the limit."""
+
+    __slots__ = ("limit", "started_at")
+
+    def __init__(self, limit: AdaptiveLimit) -> None:
+        self.limit = limit
+        self.started_at = time.monotonic()
+
+    def __enter__(self) -> "_Admitted":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.limit.release(self.started_at, not _is_congestion(exc))
+
+
+class _RateAdmitted:
+    """Context manager for a request past the rate limit only; refunds its token on a 503."""
+
+    __slots__ = ("users", "user_id")
+
+    def __init__(self, users: UserRateLimiter, user_id: str) -> None:
+        self.users = users
+        self.user_id = user_id
+
+    def __enter__(self) -> "_RateAdmitted":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if isinstance(exc, HTTPException) and exc.status_code == 503:
+            self.users.refund(self.user_id)
+
+
+def _is_congestion(exc: Optional[BaseException]) -> bool:
+    """Upstream failures that suggest overload; client errors and our own 4xx do not."""
+    if exc is None:
+        return False
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+def _retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+class AdmissionController:
+    """Per-user rate limit, then the concurrency limit for the request's lane."""
+
+    def __init__(self, limit: AdaptiveLimit, users: Optional[UserRateLimiter] = None) -> None:
+        self.limit = limit
+        self.users = users
+        self._rejections: Dict[Tuple[str, str], Counter] = {
+            (lane, reason): metrics.counter("gateway_admission_rejections_total", lane=lane, reason=reason)
+            for lane in LANES for reason in ("rate_limited", "overloaded")
+        }
+
+    def admit(self, user_id: Optional[str], lane: str = NORMAL) -> _Admitted:
+        """
+        Admits a request or raises HTTPException (429 rate limited, 503
+        overloaded). Use as `with admission.admit(...):` around the
+        downstream call.
+        """
+        self._take_token(user_id, lane)
+        if not self.limit.try_acquire(LANES[lane]):
+            if self.users is not None and user_id is not None:
+                # Not served, so it does not count against the user's rate.
+                self.users.refund(user_id)
+            self._rejections[lane, "overloaded"].inc()
+            raise HTTPException(status_code=503, detail="Gateway overloaded",
+                                headers=_retry_after_header(self.limit.retry_after()))
+        return _Admitted(self.limit)
+
+    def rate_limit(self, user_id: Optional[str], lane: str = NORMAL):
+        """
+        The per-user rate limit alone (429), for asynchronous acceptance.
+        Use as `with admission.rate_limit(...):` around the enqueue; a 503
+        raised inside gives the token back.
+        """
+        self._take_token(user_id, lane)
+        if self.users is None or user_id is None:
+            return _UNGUARDED
+        return _RateAdmitted(self.users, user_id)
+
+    async def admit_waiting(self, lane: str = NORMAL) -> _Admitted:
+        """A concurrency slot for a background worker, waiting for one instead of raising."""
+        while not self.limit.try_acquire(LANES[lane]):
+            # About one request's latency, polled at least every 50 ms
+            await asyncio.sleep(min(self.limit.retry_after(), 0.05))
+        return _Admitted(self.limit)
+
+    def _take_token(self, user_id: Optional[str], lane: str) -> None:
+        if self.users is not None and user_id is not None:
+            ok, wait = self.users.acquire(user_id)
+            if not ok:
+                self._rejections[lane, "rate_limited"].inc()
+                raise HTTPException(status_code=429, detail="Rate limit exceeded",
+                                    headers=_retry_after_header(wait))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "limit": self.limit.limit,
+            "in_flight": self.limit.in_flight,
+            "baseline_ms": self.limit.baseline * 1000.0 if self.limit.baseline < math.inf else 0.0,
+            "users": len(self.users) if self.users is not None else 0,
+            **{f"rejected_{lane}_{reason}": c.value for (lane, reason), c in self._rejections.items()},
+        }
+
+
+_UNGUARDED = nullcontext()
+
+
+def unguarded(user_id: Optional[str], lane: str = NORMAL):
+    """Stand-in for AdmissionController.admit when admission control is off."""
+    return _UNGUARDED
+
+
+def admission_from_config() -> AdmissionController:
+    rate = float(get_config_value("admission_user_rate_per_s", "0") or 0)
+    return AdmissionController(
+        AdaptiveLimit(
+            initial=get_int_setting("admission_initial_limit", 64),
+            min_limit=get_int_setting("admission_min_limit", 8),
+            max_limit=get_int_setting("admission_max_limit", 1024),
+            tolerance=float(get_config_value("admission_latency_tolerance", "2.0") or 2.0),
+            backoff=float(get_config_value("admission_backoff", "0.9") or 0.9),
+            window=get_int_setting("admission_window", 500),
+        ),
+        UserRateLimiter(
+            rate,
+            burst=get_int_setting("admission_user_burst", 20),
+            max_users=get_int_setting("admission_max_users", 100_000),
+        ) if rate > 0 else None,
+    )
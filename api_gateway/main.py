@@ -1,66 +1,305 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 import httpx
 
-from common.models import CreateOrderRequest, OrderResponse
-from common.config import get_oop_enabled
-from common.middleware import LoggingMiddleware, install_logging_middleware
+from typing import List, Optional
+
+from common.batching import MicroBatcher
+from common.models import (
+    DEFAULT_RESPONSE_CLASS,
+    ORDER_ID_HEADER,
+    BatchCreateOrderRequest,
+    BatchOrderResponse,
+    CreateOrderRequest,
+    OrderResponse,
+    json_body,
+)
+from common.config import config, get_oop_enabled
+from common.http_client import close_http_clients
+from common.idempotency import REPLAYED_HEADER, IdempotencyConflict, fingerprint, store_from_config
+from common.metrics import hop_histogram, install_metrics
+from common.middleware import install_timing_middleware
+from common.resilience import install_resilience, upstream_error_headers, upstream_error_status
+from common.tracing import install_tracing
+from common.profiling import install_profiler
+from common.reloadable import REBUILD_KEYS, ReloadableApp
+from .acceptance import CheckoutAccepted, CheckoutState, async_checkouts_from_config
+from .admission import LOW, PRIORITY_HEADER, admission_from_config, lane_of, unguarded
+from .routing import (
+    MicroBatchingRoutingStrategy,
+    RoutingStrategy,
+    create_routing_strategy,
+    make_picker,
+    pool_from_config,
+)
+
+# Idempotency-Key results: a retried checkout replays the first result.
+# Process-wide so cached results survive a live rebuild of the app.
+idempotency = store_from_config("gateway_checkout")
+
+# order_service replicas with their load, latency and health; also
+# process-wide so routing statistics survive a rebuild.
+order_upstreams = pool_from_config()
+
+# Adaptive concurrency limit and per-user token buckets for checkouts;
+# process-wide so the learned limit survives a rebuild.
+admission = admission_from_config()
+
+# Journal and workers for asynchronously accepted checkouts; process-wide
+# so accepted orders keep running across a rebuild.
+async_checkouts = async_checkouts_from_config()
+
+
+def _checkout_result(result, replayed: bool, response: Response):
+    """
+    Models go out through the route's response_model; raw bytes from the
+    trusted pass-through are sent as they are, in a Response of their own.
+    """
+    if isinstance(result, bytes):
+        return Response(result, media_type="application/json", headers={REPLAYED_HEADER: "true"} if replayed else None)
+    if replayed:
+        response.headers[REPLAYED_HEADER] = "true"
+    return result
 
-ORDER_SERVICE_URL = "http://localhost:8001"
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await order_upstreams.start()
+    if config.current.checkout_acceptance == "async":
+        # Also re-queues orders accepted but not finished before a restart.
+        await async_checkouts.start()
+    yield
+    await async_checkouts.close()
+    await order_upstreams.close()
+    await close_http_clients()
 
-def create_app() -> FastAPI:
-    oop_enabled = get_oop_enabled(default=True)
 
-    app = FastAPI(title="API Gateway")
+def create_app(oop_enabled: Optional[bool] = None) -> FastAPI:
+    if oop_enabled is None:
+        oop_enabled = get_oop_enabled(default=True)
+    settings = config.current
+    # Opt-in: coalesce concurrent single /checkout calls into /orders/batch.
+    microbatch = settings.gateway_microbatch
+    microbatch_window_ms = settings.microbatch_window_ms
+    microbatch_max_size = settings.microbatch_max_size
+    # Opt-in: relay the validated /checkout body and order_service's answer
+    # as raw bytes instead of re-encoding and re-validating them. Only for
+    # deployments where order_service is trusted to return a valid
+    # OrderResponse; not combined with micro-batching, which needs models.
+    trusted = settings.trusted_internal and not microbatch
+    # Opt-in: reject checkouts on arrival (429/503 + Retry-After) past the
+    # per-user rate or the adaptive concurrency limit, instead of queueing.
+    admit = admission.admit if settings.gateway_admission else unguarded
+    rate_limit = admission.rate_limit if settings.gateway_admission else unguarded
+    # Opt-in: answer /checkout with 202 once the order is journalled and run
+    # it from a worker pool; clients poll GET /checkout/{order_id}.
+    async_acceptance = settings.checkout_acceptance == "async"
+
+    app = FastAPI(title="API Gateway", lifespan=lifespan, default_response_class=DEFAULT_RESPONSE_CLASS)
+    order_hop = hop_histogram("order", oop_enabled)
+    order_batch_hop = hop_histogram("order_batch", oop_enabled)
 
     # Middleware: OOP vs procedural
-    if oop_enabled:
-        app.add_middleware(LoggingMiddleware)
-    else:
-        install_logging_middleware(app)
+    install_timing_middleware(app, oop_enabled)
+    install_metrics(app)
+    install_resilience(app, edge=True)
+    install_tracing(app, "api_gateway")
+    install_profiler(app)
 
     if oop_enabled:
         # ---- OOP/Strategy version (your existing design) ----
-        from abc import ABC, abstractmethod
+        current_strategy: RoutingStrategy = create_routing_strategy(
+            settings.gateway_routing, order_upstreams, order_hop, order_batch_hop
+        )
+        if microbatch:
+            current_strategy = MicroBatchingRoutingStrategy(
+                current_strategy, window_ms=microbatch_window_ms, max_batch=microbatch_max_size
+            )
 
-        class RoutingStrategy(ABC):
-            @abstractmethod
-            async def route_order(self, req: CreateOrderRequest) -> OrderResponse:
-                ...
+        if trusted:
+            async def route(req: CreateOrderRequest, request: Request):
+                # The body was already read (and cached) by json_body().
+                return await current_strategy.forward_order(await request.body(), req.user_id)
+        else:
+            async def route(req: CreateOrderRequest, request: Request):
+                return await current_strategy.route_order(req)
 
-        class SimpleRoutingStrategy(RoutingStrategy):
-            async def route_order(self, req: CreateOrderRequest) -> OrderResponse:
-                async with httpx.AsyncClient() as client:
-                    r = await client.post(f"{ORDER_SERVICE_URL}/orders", json=req.model_dump(), timeout=5.0)
-                r.raise_for_status()
-                return OrderResponse(**r.json())
+        async def process(req: CreateOrderRequest, order_id: str) -> OrderResponse:
+            return await current_strategy.route_order(req, order_id)
 
-        current_strategy: RoutingStrategy = SimpleRoutingStrategy()
+        if not async_acceptance:
+            @app.post("/checkout", response_model=OrderResponse)
+            async def checkout(
+                request: Request,
+                response: Response,
+                req: CreateOrderRequest = json_body(CreateOrderRequest),
+                idempotency_key: Optional[str] = Header(None),
+                priority: Optional[str] = Header(None, alias=PRIORITY_HEADER),
+            ):
+                try:
+                    with admit(req.user_id, lane_of(priority)):
+                        if idempotency_key is None:
+                            return _checkout_result(await route(req, request), False, response)
+                        result, replayed = await idempotency.run(
+                            idempotency_key, fingerprint(req), lambda: route(req, request)
+                        )
+                    return _checkout_result(result, replayed, response)
+                except IdempotencyConflict:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+                except httpx.HTTPError as e:
+                    raise HTTPException(
+                        status_code=upstream_error_status(e), detail=str(e), headers=upstream_error_headers(e)
+                    )
 
-        @app.post("/checkout", response_model=OrderResponse)
-        async def checkout(req: CreateOrderRequest):
+        @app.post("/checkout/batch", response_model=BatchOrderResponse)
+        async def checkout_batch(
+            batch: BatchCreateOrderRequest = json_body(BatchCreateOrderRequest),
+            priority: Optional[str] = Header(None, alias=PRIORITY_HEADER),
+        ):
             try:
-                return await current_strategy.route_order(req)
+                # Bulk traffic: no per-user buckets, shed first by default.
+                with admit(None, lane_of(priority, default=LOW)):
+                    return BatchOrderResponse(results=await current_strategy.route_batch(batch.orders))
             except httpx.HTTPError as e:
-                raise HTTPException(status_code=502, detail=str(e))
+                raise HTTPException(
+                    status_code=upstream_error_status(e), detail=str(e), headers=upstream_error_headers(e)
+                )
 
     else:
         # ---- Procedural version (no Strategy classes) ----
-        @app.post("/checkout", response_model=OrderResponse)
-        async def checkout(req: CreateOrderRequest):
-            try:
-                async with httpx.AsyncClient() as client:
-                    r = await client.post(
-                        f"{ORDER_SERVICE_URL}/orders",
-                        json=req.model_dump(),
-                        timeout=5.0,
-                    )
+        pick = make_picker(settings.gateway_routing)
+
+        async def _forward_batch(reqs: List[CreateOrderRequest]) -> List[OrderResponse]:
+            r = await order_upstreams.post(
+                pick(order_upstreams, reqs[0].user_id if reqs else ""),
+                "/orders/batch",
+                {"orders": reqs},
+                order_batch_hop,
+            )
+            r.raise_for_status()
+            return BatchOrderResponse.model_validate_json(r.content).results
+
+        batcher = None
+        if microbatch:
+            batcher = MicroBatcher(_forward_batch, window_ms=microbatch_window_ms, max_batch=microbatch_max_size)
+
+        async def _forward(req: CreateOrderRequest, request: Request):
+            if batcher is not None:
+                return await batcher.submit(req)
+            if trusted:
+                # Raw pass-through; the body was already read by json_body().
+                r = await order_upstreams.post(
+                    pick(order_upstreams, req.user_id), "/orders", await request.body(), order_hop
+                )
                 r.raise_for_status()
-                return OrderResponse(**r.json())
+                return r.content
+            r = await order_upstreams.post(pick(order_upstreams, req.user_id), "/orders", req, order_hop)
+            r.raise_for_status()
+            return OrderResponse.model_validate_json(r.content)
+
+        async def process(req: CreateOrderRequest, order_id: str) -> OrderResponse:
+            # Always one order per call with its id; no batcher, no pass-through.
+            r = await order_upstreams.post(
+                pick(order_upstreams, req.user_id), "/orders", req, order_hop, {ORDER_ID_HEADER: order_id}
+            )
+            r.raise_for_status()
+            return OrderResponse.model_validate_json(r.content)
+
+        if not async_acceptance:
+            @app.post("/checkout", response_model=OrderResponse)
+            async def checkout(
+                request: Request,
+                response: Response,
+                req: CreateOrderRequest = json_body(CreateOrderRequest),
+                idempotency_key: Optional[str] = Header(None),
+                priority: Optional[str] = Header(None, alias=PRIORITY_HEADER),
+            ):
+                try:
+                    with admit(req.user_id, lane_of(priority)):
+                        if idempotency_key is None:
+                            return _checkout_result(await _forward(req, request), False, response)
+                        result, replayed = await idempotency.run(
+                            idempotency_key, fingerprint(req), lambda: _forward(req, request)
+                        )
+                    return _checkout_result(result, replayed, response)
+                except IdempotencyConflict:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+                except httpx.HTTPError as e:
+                    raise HTTPException(
+                        status_code=upstream_error_status(e), detail=str(e), headers=upstream_error_headers(e)
+                    )
+
+        @app.post("/checkout/batch", response_model=BatchOrderResponse)
+        async def checkout_batch(
+            batch: BatchCreateOrderRequest = json_body(BatchCreateOrderRequest),
+            priority: Optional[str] = Header(None, alias=PRIORITY_HEADER),
+        ):
+            try:
+                # Bulk traffic: no per-user buckets, shed first by default.
+                with admit(None, lane_of(priority, default=LOW)):
+                    return BatchOrderResponse(results=await _forward_batch(batch.orders))
             except httpx.HTTPError as e:
-                raise HTTPException(status_code=502, detail=str(e))
+                raise HTTPException(
+                    status_code=upstream_error_status(e), detail=str(e), headers=upstream_error_headers(e)
+                )
+
+    if settings.gateway_admission:
+        # Workers call order_service like synchronous checkouts do, so they
+        # hold a concurrency slot for the call; they wait for one rather than
+        # fail an order that has already been accepted.
+        unadmitted = process
+
+        async def process(req: CreateOrderRequest, order_id: str) -> OrderResponse:
+            with await admission.admit_waiting():
+                return await unadmitted(req, order_id)
+
+    # Accepted orders (re-queued ones included) run through this build's path.
+    async_checkouts.processor = process
+
+    if async_acceptance:
+        @app.post("/checkout", status_code=202, response_model=CheckoutAccepted)
+        async def checkout(
+            response: Response,
+            req: CreateOrderRequest = json_body(CreateOrderRequest),
+            idempotency_key: Optional[str] = Header(None),
+            priority: Optional[str] = Header(None, alias=PRIORITY_HEADER),
+        ):
+            try:
+                # Rate limit only: the concurrency limit applies to the workers.
+                with rate_limit(req.user_id, lane_of(priority)):
+                    if idempotency_key is None:
+                        accepted, replayed = await async_checkouts.submit(req), False
+                    else:
+                        accepted, replayed = await idempotency.run(
+                            idempotency_key, fingerprint(req), lambda: async_checkouts.submit(req)
+                        )
+            except IdempotencyConflict:
+                raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+            response.headers["Location"] = accepted.status_url
+            return _checkout_result(accepted, replayed, response)
+
+    @app.get("/checkout/{order_id}", response_model=CheckoutState)
+    async def checkout_status(order_id: str, wait: float = Query(0.0, ge=0.0)):
+        """Status of an asynchronously accepted checkout; `wait` long-polls until it finishes."""
+        state = await async_checkouts.status(order_id, wait)
+        if state is None:
+            raise HTTPException(status_code=404, detail="Checkout not found")
+        return state
+
+    @app.get("/admission")
+    def admission_stats():
+        return {"enabled": settings.gateway_admission, **admission.stats()}
 
     return app
 
 
-app = create_app()
+# Rebuilt in place when the OOP switch, routing, micro-batching, trusted mode, admission or
+# checkout acceptance changes.
+app = ReloadableApp(
+    create_app,
+    keys=REBUILD_KEYS + (
+        "gateway_routing", "gateway_microbatch", "microbatch_window_ms", "microbatch_max_size", "trusted_internal",
+        "gateway_admission", "checkout_acceptance",
+    ),
+)
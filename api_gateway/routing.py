@@ -0,0 +1,442 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import itertools
+import random
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from common.batching import MicroBatcher
+from common.config import config, get_config_value, get_int_setting
+from common.http_client import HttpClientRegistry, get_client
+from common.metrics import Histogram, metrics
+from common.models import JSON_HEADERS, ORDER_ID_HEADER, BatchOrderResponse, CreateOrderRequest, OrderResponse, dumps
+from common.resilience import FAILURE_STATUSES
+
+metrics.describe("gateway_upstream_outstanding", "Requests in flight per order_service replica")
+metrics.describe("gateway_upstream_ejected", "1 while a replica is ejected as an outlier or failing health checks")
+metrics.describe("gateway_upstream_ejections_total", "Outlier ejections per order_service replica")
+
+EWMA_ALPHA = 0.3
+HASH_VNODES = 100
+
+
+# ---- Upstream pool (shared by both paths) ----
+class Upstream:
+    """One order_service replica and its live load/health statistics."""
+
+    __slots__ = (
+        "url", "outstanding", "ewma_ms", "healthy", "consecutive_failures",
+        "ejections", "ejected_until", "_outstanding_gauge", "_ejected_gauge", "_ejections_counter",
+    )
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.outstanding = 0
+        self.ewma_ms = 0.0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self._outstanding_gauge = metrics.gauge("gateway_upstream_outstanding", upstream=url)
+        self._ejected_gauge = metrics.gauge("gateway_upstream_ejected", upstream=url)
+        self._ejections_counter = metrics.counter("gateway_upstream_ejections_total", upstream=url)
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+    def _refresh_gauges(self, now: float) -> None:
+        self._outstanding_gauge.set(self.outstanding)
+        self._ejected_gauge.set(0.0 if self.available(now) else 1.0)
+
+
+class UpstreamPool:
+    """
+    The order_service replicas the gateway routes to.
+
+    Membership comes from a static list (order_service_urls) or from a file
+    with one URL per line (order_service_upstreams_file), whose mtime is
+    polled every file_poll_interval seconds, with or without health checks.
+    Replicas leave rotation when an active /healthz probe
+    fails, or when they are ejected as outliers after consecutive failed
+    requests (ejection time grows with each repeat, and at most
+    max_ejection_percent of the pool is ejected at once). If nothing is
+    available, every replica is used rather than failing all requests.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        upstreams_file: Optional[str] = None,
+        health_interval: float = 2.0,
+        health_path: str = "/healthz",
+        consecutive_failures: int = 5,
+        base_ejection_seconds: float = 10.0,
+        max_ejection_percent: int = 50,
+        file_poll_interval: float = 1.0,
+    ) -> None:
+        self.upstreams: List[Upstream] = []
+        self.upstreams_file = Path(upstreams_file) if upstreams_file else None
+        self.file_poll_interval = file_poll_interval
+        self.health_interval = health_interval
+        self.health_path = health_path
+        self.consecutive_failures = consecutive_failures
+        self.base_ejection_seconds = base_ejection_seconds
+        self.max_ejection_percent = max_ejection_percent
+        self._file_mtime: Optional[float] = None
+        self._static_urls = list(urls)
+        self._task: Optional[asyncio.Task] = None
+        self._watch_task: Optional[asyncio.Task] = None
+        self._probe_clients: Optional[HttpClientRegistry] = None
+        self.set_urls(self._discover())
+
+    # -- membership --
+    def _discover(self) -> List[str]:
+        if self.upstreams_file is not None:
+            try:
+                self._file_mtime = self.upstreams_file.stat().st_mtime
+                lines = self.upstreams_file.read_text(encoding="utf-8").splitlines()
+                urls = [ln.strip() for ln in lines if ln.strip() and not ln.strip().startswith("#")]
+                if urls:
+                    return urls
+            except FileNotFoundError:
+                self._file_mtime = None
+        return self._static_urls
+
+    def set_urls(self, urls: Sequence[str]) -> None:
+        """Replaces the member list, keeping the statistics of replicas that stay."""
+        current = {u.url: u for u in self.upstreams}
+        self.upstreams = [current.get(url) or Upstream(url) for url in dict.fromkeys(urls)]
+
+    def set_static_urls(self, urls: Sequence[str]) -> None:
+        self._static_urls = list(urls)
+        self.set_urls(self._discover())
+
+    def _file_changed(self) -> bool:
+        if self.upstreams_file is None:
+            return False
+        try:
+            return self.upstreams_file.stat().st_mtime != self._file_mtime
+        except FileNotFoundError:
+            return self._file_mtime is not None
+
+    async def _watch_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.file_poll_interval)
+            if self._file_changed():
+                self.set_urls(self._discover())
+
+    def available(self) -> List[Upstream]:
+        now = time.monotonic()
+        live = [u for u in self.upstreams if u.available(now)]
+        return live or self.upstreams
+
+    # -- passive outlier detection --
+    def record(self, upstream: Upstream, ok: Optional[bool], elapsed_ms: float) -> None:
+        upstream.outstanding -= 1
+        now = time.monotonic()
+        if ok is not None:
+            upstream.ewma_ms = (
+                elapsed_ms if upstream.ewma_ms == 0.0
+                else EWMA_ALPHA * elapsed_ms + (1.0 - EWMA_ALPHA) * upstream.ewma_ms
+            )
+            if ok:
+                upstream.consecutive_failures = 0
+            else:
+                upstream.consecutive_failures += 1
+                if upstream.consecutive_failures >= self.consecutive_failures:
+                    self._eject(upstream, now)
+        upstream._refresh_gauges(now)
+
+    def _eject(self, upstream: Upstream, now: float) -> None:
+        ejected = sum(1 for u in self.upstreams if now < u.ejected_until)
+        if (ejected + 1) * 100 > self.max_ejection_percent * len(self.upstreams):
+            return
+        upstream.ejections += 1
+        upstream.ejected_until = now + self.base_ejection_seconds * upstream.ejections
+        upstream.consecutive_failures = 0
+        upstream._ejections_counter.inc()
+
+    async def post(self, upstream: Upstream, path: str, payload, hop: Histogram,
+                   headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """
+        POSTs to one replica, feeding its outstanding count, EWMA and outlier
+        stats. `payload` is encoded with dumps(), or sent as-is when it is
+        already JSON bytes (trusted pass-through). `headers` are sent in
+        addition to the JSON content type.
+        """
+        upstream.outstanding += 1
+        start = time.perf_counter_ns()
+        ok: Optional[bool] = None
+        try:
+            r = await get_client(upstream.url).post(
+                path,
+                content=payload if isinstance(payload, bytes) else dumps(payload),
+                headers=JSON_HEADERS if headers is None else {**JSON_HEADERS, **headers},
+                timeout=config.current.http_timeout_seconds,
+            )
+            ok = r.status_code not in FAILURE_STATUSES
+            return r
+        except httpx.TransportError:
+            ok = False
+            raise
+        finally:
+            hop.observe_since(start)
+            self.record(upstream, ok, (time.perf_counter_ns() - start) / 1_000_000)
+
+    # -- active health checks --
+    async def check_health(self) -> None:
+        clients = self._probe_clients
+        if clients is None:
+            return
+        timeout = min(1.0, self.health_interval)
+
+        async def probe(upstream: Upstream) -> None:
+            try:
+                r = await clients.get(upstream.url).get(self.health_path, timeout=timeout)
+                upstream.healthy = r.status_code == 200
+            except httpx.HTTPError:
+                upstream.healthy = False
+            upstream._refresh_gauges(time.monotonic())
+
+        await asyncio.gather(*(probe(u) for u in self.upstreams))
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.upstreams_file is not None and self.file_poll_interval > 0 and self._watch_task is None:
+            self._watch_task = loop.create_task(self._watch_loop())
+        if self.health_interval <= 0 or self._task is not None:
+            return
+        # Separate clients: probes must not trip the request-path breakers.
+        self._probe_clients = HttpClientRegistry(max_connections=2, max_keepalive=2, resilient=False)
+        self._task = loop.create_task(self._health_loop())
+
+    async def close(self) -> None:
+        tasks = [t for t in (self._task, self._watch_task) if t is not None]
+        self._task = self._watch_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._probe_clients is not None:
+            await self._probe_clients.aclose()
+            self._probe_clients = None
+
+
+def _configured_urls() -> List[str]:
+    urls = [u.strip() for u in (get_config_value("order_service_urls") or "").split(",") if u.strip()]
+    return urls or [config.current.order_service_url]
+
+
+def pool_from_config() -> UpstreamPool:
+    pool = UpstreamPool(
+        _configured_urls(),
+        upstreams_file=get_config_value("order_service_upstreams_file") or None,
+        health_interval=float(get_config_value("health_check_interval_seconds", "2") or 2),
+        health_path=get_config_value("health_check_path", "/healthz") or "/healthz",
+        consecutive_failures=get_int_setting("outlier_consecutive_failures", 5),
+        base_ejection_seconds=float(get_int_setting("outlier_base_ejection_seconds", 10)),
+        max_ejection_percent=get_int_setting("outlier_max_ejection_percent", 50),
+        file_poll_interval=float(get_config_value("order_service_upstreams_poll_seconds", "1") or 1),
+    )
+    config.on_change(
+        lambda old, new, changed: pool.set_static_urls(_configured_urls()),
+        keys=("order_service_urls", "order_service_url"),
+    )
+    return pool
+
+
+def _p2c_cost(u: Upstream) -> float:
+    # Replicas with no samples yet (EWMA 0) win, so new members get traffic.
+    return u.ewma_ms * (u.outstanding + 1)
+
+
+# ---- Consistent hashing ring ----
+def _hash64(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Ring with HASH_VNODES virtual nodes per replica, rebuilt only when membership changes."""
+
+    def __init__(self) -> None:
+        self._members: Tuple[str, ...] = ()
+        self._points: List[int] = []
+        self._owners: List[Upstream] = []
+
+    def _rebuild(self, upstreams: Sequence[Upstream]) -> None:
+        ring = sorted(
+            (_hash64(f"{u.url}#{i}"), u) for u in upstreams for i in range(HASH_VNODES)
+        )
+        self._points = [p for p, _ in ring]
+        self._owners = [u for _, u in ring]
+        self._members = tuple(u.url for u in upstreams)
+
+    def lookup(self, upstreams: Sequence[Upstream], key: str) -> Upstream:
+        if tuple(u.url for u in upstreams) != self._members:
+            self._rebuild(upstreams)
+        i = bisect(self._points, _hash64(key)) % len(self._points)
+        return self._owners[i]
+
+
+# ---- OOP/Strategy version ----
+class RoutingStrategy(ABC):
+    @abstractmethod
+    async def route_order(self, req: CreateOrderRequest, order_id: Optional[str] = None) -> OrderResponse:
+        """`order_id`, when given, is the id order_service must use for the order (X-Order-Id)."""
+
+    @abstractmethod
+    async def route_batch(self, reqs: List[CreateOrderRequest]) -> List[OrderResponse]:
+        ...
+
+
+class SimpleRoutingStrategy(RoutingStrategy):
+    """Sends everything to the first replica; subclasses override choose()."""
+
+    def __init__(self, pool: UpstreamPool, order_hop: Histogram, order_batch_hop: Histogram) -> None:
+        self.pool = pool
+        self.order_hop = order_hop
+        self.order_batch_hop = order_batch_hop
+
+    def choose(self, key: str) -> Upstream:
+        return self.pool.available()[0]
+
+    async def route_order(self, req: CreateOrderRequest, order_id: Optional[str] = None) -> OrderResponse:
+        r = await self.pool.post(
+            self.choose(req.user_id), "/orders", req, self.order_hop,
+            None if order_id is None else {ORDER_ID_HEADER: order_id},
+        )
+        r.raise_for_status()
+        return OrderResponse.model_validate_json(r.content)
+
+    async def route_batch(self, reqs: List[CreateOrderRequest]) -> List[OrderResponse]:
+        r = await self.pool.post(
+            self.choose(reqs[0].user_id if reqs else ""),
+            "/orders/batch",
+            {"orders": reqs},
+            self.order_batch_hop,
+        )
+        r.raise_for_status()
+        return BatchOrderResponse.model_validate_json(r.content).results
+
+    async def forward_order(self, body: bytes, key: str) -> bytes:
+        """
+        Trusted pass-through: relays an already validated /checkout body and
+        returns order_service's JSON as-is, without re-encoding either side.
+        """
+        r = await self.pool.post(self.choose(key), "/orders", body, self.order_hop)
+        r.raise_for_status()
+        return r.content
+
+
+class RoundRobinRoutingStrategy(SimpleRoutingStrategy):
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
+        self._counter = itertools.count()
+
+    def choose(self, key: str) -> Upstream:
+        live = self.pool.available()
+        return live[next(self._counter) % len(live)]
+
+
+class LeastOutstandingRoutingStrategy(SimpleRoutingStrategy):
+    def choose(self, key: str) -> Upstream:
+        return min(self.pool.available(), key=lambda u: u.outstanding)
+
+
+class PowerOfTwoEwmaRoutingStrategy(SimpleRoutingStrategy):
+    """Picks two replicas at random and keeps the one with the lower EWMA latency x load."""
+
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
+        self._rng = random.Random()
+
+    def choose(self, key: str) -> Upstream:
+        live = self.pool.available()
+        if len(live) == 1:
+            return live[0]
+        a, b = self._rng.sample(live, 2)
+        return a if _p2c_cost(a) <= _p2c_cost(b) else b
+
+
+class ConsistentHashRoutingStrategy(SimpleRoutingStrategy):
+    """Same user_id -> same replica while membership is stable (cache affinity)."""
+
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
+        self._ring = HashRing()
+
+    def choose(self, key: str) -> Upstream:
+        return self._ring.lookup(self.pool.available(), key)
+
+
+class MicroBatchingRoutingStrategy(RoutingStrategy):
+    """Decorates another strategy, sending single orders through its batch route."""
+
+    def __init__(self, inner: RoutingStrategy, window_ms: float, max_batch: int) -> None:
+        self._inner = inner
+        self._batcher = MicroBatcher(inner.route_batch, window_ms=window_ms, max_batch=max_batch)
+
+    async def route_order(self, req: CreateOrderRequest, order_id: Optional[str] = None) -> OrderResponse:
+        if order_id is not None:
+            # /orders/batch cannot carry per-order ids; these go one by one.
+            return await self._inner.route_order(req, order_id)
+        return await self._batcher.submit(req)
+
+    async def route_batch(self, reqs: List[CreateOrderRequest]) -> List[OrderResponse]:
+        return await self._inner.route_batch(reqs)
+
+
+_STRATEGIES: Dict[str, type] = {
+    "round_robin": RoundRobinRoutingStrategy,
+    "least_outstanding": LeastOutstandingRoutingStrategy,
+    "p2c_ewma": PowerOfTwoEwmaRoutingStrategy,
+    "consistent_hash": ConsistentHashRoutingStrategy,
+}
+
+
+def create_routing_strategy(
+    kind: str, pool: UpstreamPool, order_hop: Histogram, order_batch_hop: Histogram
+) -> SimpleRoutingStrategy:
+    return _STRATEGIES.get(kind, SimpleRoutingStrategy)(pool, order_hop, order_batch_hop)
+
+
+# ---- Procedural version (plain picker functions) ----
+def make_picker(kind: str) -> Callable[[UpstreamPool, str], Upstream]:
+    """Returns pick(pool, key) for a routing kind; each call gets its own state."""
+    if kind == "round_robin":
+        counter = itertools.count()
+
+        def pick(pool: UpstreamPool, key: str) -> Upstream:
+            live = pool.available()
+            return live[next(counter) % len(live)]
+    elif kind == "least_outstanding":
+        def pick(pool: UpstreamPool, key: str) -> Upstream:
+            return min(pool.available(), key=lambda u: u.outstanding)
+    elif kind == "p2c_ewma":
+        rng = random.Random()
+
+        def pick(pool: UpstreamPool, key: str) -> Upstream:
+            live = pool.available()
+            if len(live) == 1:
+                return live[0]
+            a, b = rng.sample(live, 2)
+            return a if _p2c_cost(a) <= _p2c_cost(b) else b
+    elif kind == "consistent_hash":
+        ring = HashRing()
+
+        def pick(pool: UpstreamPool, key: str) -> Upstream:
+            return ring.lookup(pool.available(), key)
+    else:
+        def pick(pool: UpstreamPool, key: str) -> Upstream:
+            return pool.available()[0]
+    return pick
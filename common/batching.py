@@ -0,0 +1,63 @@
+from __future__ import annotations
+import asyncio
+from typing import Awaitable, Callable, Generic, List, Optional, Set, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Coalesces concurrent single calls into one batched call.
+
+    Items submitted within `window_ms` of the first pending item (or until
+    `max_batch` items are pending) are handed to `flush` as one list; each
+    caller receives the result at its own position.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[T]], Awaitable[List[R]]],
+        window_ms: float = 2.0,
+        max_batch: int = 64,
+    ) -> None:
+        self._flush = flush
+        self._window = window_ms / 1000.0
+        self._max_batch = max_batch
+        self._pending: List[Tuple[T, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def submit(self, item: T) -> R:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((item, fut))
+        if len(self._pending) >= self._max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._window, self._dispatch)
+        return await fut
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _run(self, batch: List[Tuple[T, asyncio.Future]]) -> None:
+        try:
+            results = await self._flush([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
@@ -1,6 +1,11 @@
 from __future__ import annotations
+import asyncio
+import dataclasses
+import os
+from dataclasses import dataclass, field
 from pathlib import Path
-from functools import lru_cache
+from threading import Lock
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
 
 
 def _find_project_root(start: Path) -> Path:
@@ -16,20 +21,13 @@ def _find_project_root(start: Path) -> Path:
     return Path.cwd().resolve()
 
 
-@lru_cache(maxsize=1)
-def get_oop_enabled(default: bool = True) -> bool:
+def _parse(text: str) -> Dict[str, str]:
     """
-    Reads config.txt and returns True if oop_enabled=1, else False.
+    Parses config.txt into a dict of lower-cased keys to raw string values.
 
-    config.txt is expected to be located in src/ (project root).
-    Example: oop_enabled=1
+    Lines are 'key=value'; blank lines and '#' comments are ignored.
     """
-    root = _find_project_root(Path(__file__).parent)
-    cfg = root / "config.txt"
-    if not cfg.exists():
-        return default
-
-    text = cfg.read_text(encoding="utf-8", errors="ignore")
+    values: Dict[str, str] = {}
     for raw in text.splitlines():
         line = raw.strip()
         if not line or line.startswith("#"):
@@ -37,6 +35,235 @@ def get_oop_enabled(default: bool = True) -> bool:
         if "=" not in line:
             continue
         k, v = [x.strip() for x in line.split("=", 1)]
-        if k.lower() == "oop_enabled":
-            return v in ("1", "true", "yes", "on", "True", "TRUE")
-    return default
+        values[k.lower()] = v
+    return values
+
+
+def _coerce(kind: str, raw: str, default):
+    try:
+        if kind == "bool":
+            return raw.lower() in ("1", "true", "yes", "on")
+        if kind == "int":
+            return int(raw)
+        if kind == "float":
+            return float(raw)
+    except ValueError:
+        return default
+    return raw
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Immutable, typed snapshot of config.txt plus environment overrides.
+
+    A new Settings object is built on every reload and swapped in whole, so a
+    handler that reads `config.current` once sees one consistent version.
+    Keys without a typed field are still available through `raw`.
+    """
+
+    oop_enabled: bool = True
+
+    # Upstream services
+    order_service_url: str = "http://localhost:8001"
+    payment_service_url: str = "http://localhost:8002"
+    inventory_service_url: str = "http://localhost:8003"
+    notification_service_url: str = "http://localhost:8004"
+
+    # Outbound HTTP
+    http_timeout_seconds: float = 5.0
+    http_pool_size: int = 100
+    http_max_keepalive: int = 20
+    http2_enabled: bool = False
+
+    # Feature switches
+    checkout_mode: str = "sequential"
+    gateway_routing: str = "round_robin"
+    order_events: str = "bus"
+    gateway_microbatch: bool = False
+    microbatch_window_ms: float = 2.0
+    microbatch_max_size: int = 64
+    trusted_internal: bool = False
+    gateway_admission: bool = False
+    checkout_acceptance: str = "sync"
+
+    # Seconds between config.txt mtime checks (0 = no live reload)
+    config_reload_interval_seconds: float = 2.0
+
+    raw: Dict[str, str] = field(default_factory=dict, compare=False)
+
+    @classmethod
+    def from_values(cls, values: Dict[str, str], environ: Optional[Dict[str, str]] = None) -> "Settings":
+        """
+        Environment variables (upper-cased key, e.g. OOP_ENABLED=0) override
+        config.txt, so one process can be started in a different mode.
+        """
+        environ = os.environ if environ is None else environ
+        raw = dict(values)
+        for f in dataclasses.fields(cls):
+            if f.name != "raw" and f.name.upper() in environ:
+                raw[f.name] = environ[f.name.upper()]
+
+        typed = {}
+        for f in dataclasses.fields(cls):
+            if f.name == "raw" or f.name not in raw:
+                continue
+            typed[f.name] = _coerce(f.type, raw[f.name], f.default)
+        return cls(raw=raw, **typed)
+
+    def diff(self, other: "Settings") -> FrozenSet[str]:
+        """Keys whose effective value differs between two snapshots."""
+        changed = {
+            f.name for f in dataclasses.fields(self)
+            if f.name != "raw" and getattr(self, f.name) != getattr(other, f.name)
+        }
+        for key in self.raw.keys() | other.raw.keys():
+            if self.raw.get(key) != other.raw.get(key):
+                changed.add(key)
+        return frozenset(changed)
+
+
+ChangeCallback = Callable[[Settings, Settings, FrozenSet[str]], None]
+
+
+class ConfigManager:
+    """
+    Owns the current Settings snapshot and reloads it when config.txt changes.
+
+    Readers on the hot path only do `config.current.<field>`: an attribute
+    load on an immutable object, no locking or parsing. reload() builds a
+    new snapshot off to the side, swaps the reference and then runs the
+    change callbacks registered for the keys that actually changed, so
+    services can rebuild strategy/factory objects without a restart.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._mtime: Optional[float] = None
+        self._callbacks: List[Tuple[Optional[FrozenSet[str]], ChangeCallback]] = []
+        self._lock = Lock()
+        self._watcher: Optional[asyncio.Task] = None
+        self.current = self._load()
+
+    def _load(self) -> Settings:
+        try:
+            self._mtime = self.path.stat().st_mtime
+            values = _parse(self.path.read_text(encoding="utf-8", errors="ignore"))
+        except FileNotFoundError:
+            self._mtime = None
+            values = {}
+        return Settings.from_values(values)
+
+    def on_change(self, callback: ChangeCallback, keys: Optional[Iterable[str]] = None) -> None:
+        """
+        Registers callback(old, new, changed_keys). With `keys`, it only fires
+        when one of those keys changed.
+        """
+        watched = frozenset(k.lower() for k in keys) if keys is not None else None
+        with self._lock:
+            self._callbacks.append((watched, callback))
+
+    def remove_callback(self, callback: ChangeCallback) -> None:
+        with self._lock:
+            self._callbacks = [(k, cb) for k, cb in self._callbacks if cb is not callback]
+
+    def reload(self) -> FrozenSet[str]:
+        """Re-reads config.txt and the environment; returns the changed keys."""
+        with self._lock:
+            old = self.current
+            new = self._load()
+            changed = old.diff(new)
+            if not changed:
+                return changed
+            self.current = new
+            callbacks = list(self._callbacks)
+
+        for watched, callback in callbacks:
+            if watched is not None and not (watched & changed):
+                continue
+            try:
+                callback(old, new, changed)
+            except Exception as e:
+                # Imported here: request_log itself reads its settings from config.
+                from common.request_log import request_log
+                request_log.event("Config", "change callback failed", callback=repr(callback), error=repr(e))
+        return changed
+
+    def changed_on_disk(self) -> bool:
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        return mtime != self._mtime
+
+    async def watch(self, interval: Optional[float] = None) -> None:
+        """Polls the config file's mtime and reloads when it moves."""
+        while True:
+            await asyncio.sleep(interval or self.current.config_reload_interval_seconds)
+            if self.changed_on_disk():
+                self.reload()
+
+    def start_watching(self) -> Optional[asyncio.Task]:
+        """Starts the watcher on the running loop (idempotent; no-op when disabled)."""
+        if self.current.config_reload_interval_seconds <= 0:
+            return None
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.get_running_loop().create_task(self.watch())
+        return self._watcher
+
+    async def stop_watching(self) -> None:
+        watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            watcher.cancel()
+            try:
+                await watcher
+            except asyncio.CancelledError:
+                pass
+
+
+# Process-wide configuration; config.txt is looked up from the project root.
+config = ConfigManager(_find_project_root(Path(__file__).parent) / "config.txt")
+
+
+def read_config() -> Dict[str, str]:
+    """Raw key/value view of the current snapshot (env overrides applied)."""
+    return config.current.raw
+
+
+def get_config_value(key: str, default: Optional[str] = None) -> Optional[str]:
+    """
+    Environment variables (upper-cased key, e.g. OOP_ENABLED=0) override
+    config.txt, so one process can be started in a different mode.
+    """
+    env = os.environ.get(key.upper())
+    if env is not None:
+        return env
+    return config.current.raw.get(key.lower(), default)
+
+
+def get_bool_setting(key: str, default: bool) -> bool:
+    v = get_config_value(key)
+    if v is None:
+        return default
+    return v.lower() in ("1", "true", "yes", "on")
+
+
+def get_int_setting(key: str, default: int) -> int:
+    v = get_config_value(key)
+    if v is None:
+        return default
+    try:
+        return int(v)
+    except ValueError:
+        return default
+
+
+def get_oop_enabled(default: bool = True) -> bool:
+    """
+    Returns the current oop_enabled switch (oop_enabled=1 in config.txt).
+
+    Reads the live snapshot, so it reflects the latest reload.
+    """
+    if "oop_enabled" not in config.current.raw:
+        return default
+    return config.current.oop_enabled
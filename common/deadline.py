@@ -0,0 +1,49 @@
+from __future__ import annotations
+import math
+import time
+from typing import Optional
+
+# Remaining time budget of the caller, in milliseconds. Relative rather than
+# an absolute timestamp so hosts do not need synchronised clocks.
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+
+class Deadline:
+    """
+    Point in time by which a request must be answered.
+
+    Created from the caller's X-Deadline-Ms (or a default budget) when the
+    request arrives; every downstream wait uses remaining() instead of a
+    fixed timeout, so time already spent upstream is not granted again.
+    """
+
+    __slots__ = ("expires_at",)
+
+    def __init__(self, timeout_s: float) -> None:
+        self.expires_at = time.monotonic() + timeout_s
+
+    @classmethod
+    def from_header(cls, value: Optional[str], default_s: float, max_s: Optional[float] = None) -> "Deadline":
+        """
+        `default_s` when the header is missing or not a finite number;
+        `max_s` caps the budget a caller may ask for.
+        """
+        if value:
+            try:
+                ms = float(value)
+            except ValueError:
+                ms = math.nan
+            if math.isfinite(ms):
+                timeout = max(0.0, ms / 1000.0)
+                return cls(timeout if max_s is None else min(timeout, max_s))
+        return cls(default_s)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def header_value(self) -> str:
+        return str(int(self.remaining() * 1000.0))
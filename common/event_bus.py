@@ -1,23 +1,440 @@
-from typing import Callable, Dict, List, Any
+from __future__ import annotations
+import asyncio
+import json
+import os
+import socket
+from abc import ABC, abstractmethod
 from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
+from common.config import get_config_value, get_int_setting
+from common.metrics import metrics
+from common.request_log import request_log
+
+Handler = Callable[[Any], Any]  # sync or async; gets a list when batch_size > 1
+# (topic, group, payload): offered to the local subscriptions of that group
+Deliver = Callable[[str, Optional[str], Any], Awaitable[None]]
+
+# Backpressure policies for a full subscriber queue
+BLOCK = "block"              # publisher waits for room, up to block_timeout, then drops
+DROP_OLDEST = "drop_oldest"  # evict the oldest queued event
+DROP_NEWEST = "drop_newest"  # discard the event being published
+_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+metrics.describe("event_bus_events_total", "Events per subscriber by result (delivered, dropped, failed)")
+
+
+# ---- Transports ----
+class Transport(ABC):
+    """
+    Carries published events to the bus's local subscribers. Subscriptions
+    without a group see every event; subscriptions in a group share the
+    events with the same group in other processes, each event going to one.
+    """
+
+    @abstractmethod
+    async def start(self, deliver: Deliver) -> None:
+        ...
+
+    @abstractmethod
+    async def subscribe(self, topic: str, group: Optional[str] = None) -> None:
+        """Starts delivering `topic` to `group`; repeated calls are no-ops."""
+        ...
+
+    @abstractmethod
+    async def publish(self, topic: str, payload: Any) -> None:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+class InProcessTransport(Transport):
+    """Hands events straight to local subscribers (no serialization)."""
 
-class EventBus:
-    """Simple in-memory event bus implementing Observer pattern."""
     def __init__(self) -> None:
-        self._subscribers: Dict[str, List[Callable[[Any], None]]] = {}
+        self._deliver: Optional[Deliver] = None
+        # topic -> groups subscribed; one process, so every group gets every event
+        self._groups: Dict[str, Tuple[Optional[str], ...]] = {}
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def subscribe(self, topic: str, group: Optional[str] = None) -> None:
+        groups = self._groups.get(topic, ())
+        if group not in groups:
+            self._groups[topic] = groups + (group,)
+
+    async def publish(self, topic: str, payload: Any) -> None:
+        if self._deliver is not None:
+            for group in self._groups.get(topic, ()):
+                await self._deliver(topic, group, payload)
+
+
+class RedisTransport(Transport):
+    """
+    Minimal Redis-protocol (RESP) client carrying events on Redis streams
+    (XADD / XREAD / XREADGROUP, Redis 5+). Payloads are JSON-encoded and
+    each stream is capped at about `maxlen` entries.
+
+    Subscriptions without a group read the stream in every process.
+    Subscriptions with a group join a consumer group of that name, so each
+    event is handled by one process only; that is what a handler with side
+    effects (like forwarding notifications) needs when several workers run.
+    Grouped events are acknowledged once queued on the local subscription;
+    entries a dead consumer left pending are not reclaimed.
+
+    Every (topic, group) has its own reader task and connection, which
+    reconnects after a failure and resumes after the last event it read.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, maxlen: int = 100_000) -> None:
+        self.host = host
+        self.port = port
+        self.maxlen = maxlen
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._deliver: Optional[Deliver] = None
+        self._pub: Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = None
+        self._pub_lock = asyncio.Lock()
+        self._readers: Dict[Tuple[str, Optional[str]], asyncio.Task] = {}
+
+    @classmethod
+    def from_url(cls, url: str, maxlen: int = 100_000) -> "RedisTransport":
+        # redis://host:port
+        hostport = url.split("://", 1)[-1].rstrip("/")
+        host, _, port = hostport.partition(":")
+        return cls(host or "127.0.0.1", int(port or 6379), maxlen)
+
+    @staticmethod
+    def _encode(*parts: str) -> bytes:
+        out = [f"*{len(parts)}\r\n".encode()]
+        for p in parts:
+            b = p.encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(b), b))
+        return b"".join(out)
+
+    @classmethod
+    async def _read_reply(cls, reader: asyncio.StreamReader) -> Any:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise ConnectionError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            data = await reader.readexactly(n + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            n = int(rest)
+            if n < 0:
+                return None
+            return [await cls._read_reply(reader) for _ in range(n)]
+        raise ConnectionError(f"Unexpected reply: {line!r}")
+
+    @classmethod
+    async def _call(cls, conn: Tuple[asyncio.StreamReader, asyncio.StreamWriter], *parts: str) -> Any:
+        reader, writer = conn
+        writer.write(cls._encode(*parts))
+        await writer.drain()
+        return await cls._read_reply(reader)
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+        self._pub = await asyncio.open_connection(self.host, self.port)
+
+    async def subscribe(self, topic: str, group: Optional[str] = None) -> None:
+        if self._deliver is None:
+            raise RuntimeError("Transport not started")
+        if (topic, group) not in self._readers:
+            self._readers[(topic, group)] = asyncio.create_task(self._read_loop(topic, group))
+
+    async def publish(self, topic: str, payload: Any) -> None:
+        if self._deliver is None:
+            raise RuntimeError("Transport not started")
+        async with self._pub_lock:
+            if self._pub is None:
+                self._pub = await asyncio.open_connection(self.host, self.port)
+            try:
+                await self._call(
+                    self._pub, "XADD", topic, "MAXLEN", "~", str(self.maxlen), "*", "data", json.dumps(payload)
+                )
+            except BaseException:
+                # Reconnect on the next publish rather than reuse a broken stream.
+                self._pub[1].close()
+                self._pub = None
+                raise
+
+    async def _read_loop(self, topic: str, group: Optional[str]) -> None:
+        last_id: Optional[str] = None
+        delay = 0.1
+        while True:
+            conn = None
+            try:
+                conn = await asyncio.open_connection(self.host, self.port)
+                if group is not None:
+                    await self._create_group(conn, topic, group)
+                elif last_id is None:
+                    # Start after the newest entry, then follow by id so events
+                    # added between two reads (or during a reconnect) are not missed.
+                    newest = await self._call(conn, "XREVRANGE", topic, "+", "-", "COUNT", "1")
+                    last_id = newest[0][0] if newest else "0-0"
+                delay = 0.1
+                while True:
+                    if group is None:
+                        reply = await self._call(
+                            conn, "XREAD", "COUNT", "256", "BLOCK", "1000", "STREAMS", topic, last_id
+                        )
+                    else:
+                        reply = await self._call(
+                            conn, "XREADGROUP", "GROUP", group, self.consumer,
+                            "COUNT", "256", "BLOCK", "1000", "STREAMS", topic, ">",
+                        )
+                    for _, entries in reply or ():
+                        for entry_id, fields in entries:
+                            last_id = entry_id
+                            data = dict(zip(fields[::2], fields[1::2]))["data"]
+                            await self._deliver(topic, group, json.loads(data))
+                        if group is not None and entries:
+                            await self._call(conn, "XACK", topic, group, *(e[0] for e in entries))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                request_log.event(
+                    "RedisTransport", "stream reader failed, reconnecting",
+                    topic=topic, group=group, error=repr(e), retry_in_s=delay,
+                )
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+            finally:
+                if conn is not None:
+                    conn[1].close()
+
+    async def _create_group(self, conn, topic: str, group: str) -> None:
+        try:
+            await self._call(conn, "XGROUP", "CREATE", topic, group, "$", "MKSTREAM")
+        except ConnectionError as e:
+            if not str(e).startswith("BUSYGROUP"):
+                raise
+
+    async def close(self) -> None:
+        readers, self._readers = list(self._readers.values()), {}
+        for t in readers:
+            t.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        if self._pub is not None:
+            self._pub[1].close()
+        self._pub = None
+        self._deliver = None
+
+
+# ---- Subscriptions ----
+class Subscription:
+    """A handler with its own bounded queue and worker tasks."""
+
+    def __init__(
+        self,
+        topic: str,
+        handler: Handler,
+        workers: int,
+        queue_size: int,
+        policy: str,
+        batch_size: int,
+        block_timeout: float = 0.1,
+        group: Optional[str] = None,
+    ) -> None:
+        if policy not in _POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.topic = topic
+        self.handler = handler
+        # Shares events with same-group subscriptions of other processes
+        self.group = group
+        self.name = group or getattr(handler, "__qualname__", repr(handler))
+        self.is_async = asyncio.iscoroutinefunction(handler)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.policy = policy
+        self.batch_size = batch_size
+        # Longest a BLOCK publisher waits for room; a slow subscriber must
+        # not stall the request that publishes.
+        self.block_timeout = block_timeout
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+        labels = {"topic": topic, "subscriber": self.name}
+        self._delivered = metrics.counter("event_bus_events_total", result="delivered", **labels)
+        self._dropped = metrics.counter("event_bus_events_total", result="dropped", **labels)
+        self._failed = metrics.counter("event_bus_events_total", result="failed", **labels)
+
+    def start(self) -> None:
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def offer(self, payload: Any) -> None:
+        q = self.queue
+        if q is None:
+            self._dropped.inc()
+            return
+        if self.policy == BLOCK:
+            if not q.full():
+                q.put_nowait(payload)
+                return
+            try:
+                await asyncio.wait_for(q.put(payload), self.block_timeout)
+            except asyncio.TimeoutError:
+                self._dropped.inc()
+            return
+        if q.full():
+            self._dropped.inc()
+            if self.policy == DROP_NEWEST:
+                return
+            q.get_nowait()
+            q.task_done()
+        q.put_nowait(payload)
+
+    async def _work(self) -> None:
+        q = self.queue
+        while True:
+            batch = [await q.get()]
+            while len(batch) < self.batch_size and not q.empty():
+                batch.append(q.get_nowait())
+            arg = batch if self.batch_size > 1 else batch[0]
+            try:
+                result = self.handler(arg)
+                if self.is_async:
+                    await result
+                self._delivered.inc(len(batch))
+            except Exception as e:
+                self._failed.inc(len(batch))
+                request_log.event("EventBus", "handler failed", topic=self.topic, subscriber=self.name,
+                                  events=len(batch), error=repr(e))
+            finally:
+                for _ in batch:
+                    q.task_done()
+
+    async def close(self, timeout: float) -> None:
+        if self.queue is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        tasks, self._tasks = self._tasks, []
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.queue = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "topic": self.topic,
+            "depth": self.queue.qsize() if self.queue is not None else 0,
+            "subscriber": self.name,
+            "delivered": self._delivered.value,
+            "dropped": self._dropped.value,
+            "failed": self._failed.value,
+        }
+
+
+class EventBus:
+    """
+    Asyncio-native event bus implementing the Observer pattern.
+
+    publish() only hands the event to the transport, which enqueues it on
+    each subscriber's bounded queue; handlers run on the subscriber's worker
+    tasks, never in the publisher. Full queues apply the subscriber's
+    backpressure policy.
+    """
+
+    def __init__(self, transport: Optional[Transport] = None) -> None:
+        self.transport = transport or InProcessTransport()
+        # topic -> subscriptions; replaced (never mutated) under the lock so
+        # publishers can read it without locking.
+        self._subscribers: Dict[str, Tuple[Subscription, ...]] = {}
         self._lock = Lock()
+        self._started = False
+
+    def subscribe(
+        self,
+        event_type: str,
+        handler: Handler,
+        workers: int = 1,
+        queue_size: int = 1000,
+        policy: str = BLOCK,
+        batch_size: int = 1,
+        block_timeout_ms: float = 100.0,
+        group: Optional[str] = None,
+    ) -> Subscription:
+        """
+        `group`: across processes sharing a transport, each event goes to one
+        subscription of the group instead of to all of them.
+        """
+        sub = Subscription(
+            event_type, handler, workers, queue_size, policy, batch_size, block_timeout_ms / 1000.0, group
+        )
+        with self._lock:
+            self._subscribers[event_type] = self._subscribers.get(event_type, ()) + (sub,)
+        if self._started:
+            sub.start()
+            asyncio.ensure_future(self.transport.subscribe(event_type, group))
+        return sub
 
-    def subscribe(self, event_type: str, handler: Callable[[Any], None]) -> None:
+    async def unsubscribe(self, sub: Subscription) -> None:
         with self._lock:
-            self._subscribers.setdefault(event_type, []).append(handler)
+            remaining = tuple(s for s in self._subscribers.get(sub.topic, ()) if s is not sub)
+            if remaining:
+                self._subscribers[sub.topic] = remaining
+            else:
+                self._subscribers.pop(sub.topic, None)
+        await sub.close(timeout=0)
+
+    async def start(self) -> None:
+        if self._started:
+            return
+        await self.transport.start(self._deliver)
+        self._started = True
+        for topic, subs in self._subscribers.items():
+            for sub in subs:
+                sub.start()
+                await self.transport.subscribe(topic, sub.group)
+
+    async def publish(self, event_type: str, payload: Any) -> None:
+        await self.transport.publish(event_type, payload)
+
+    async def _deliver(self, event_type: str, group: Optional[str], payload: Any) -> None:
+        for sub in self._subscribers.get(event_type, ()):
+            if sub.group == group:
+                await sub.offer(payload)
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """Drains subscriber queues (up to `timeout`), then stops workers."""
+        if not self._started:
+            return
+        for subs in self._subscribers.values():
+            for sub in subs:
+                await sub.close(timeout)
+        await self.transport.close()
+        self._started = False
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [sub.stats() for subs in self._subscribers.values() for sub in subs]
+
 
-    def publish(self, event_type: str, payload: Any) -> None:
-        # In a real microservice world, this would be a message broker.
-        handlers = self._subscribers.get(event_type, [])
-        for h in handlers:
-            h(payload)
+def _transport_from_config() -> Transport:
+    kind = get_config_value("event_bus_transport", "inprocess")
+    if kind == "redis":
+        return RedisTransport.from_url(
+            get_config_value("event_bus_url", "redis://127.0.0.1:6379"),
+            get_int_setting("event_bus_stream_maxlen", 100_000),
+        )
+    return InProcessTransport()
 
 
 # Global singleton bus for demo (each service could have its own client).
-event_bus = EventBus()
+event_bus = EventBus(_transport_from_config())
@@ -0,0 +1,186 @@
+from __future__ import annotations
+import asyncio
+from threading import Lock
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import quote, unquote
+
+import httpx
+
+from common.config import config, get_bool_setting
+from common.models import JSON_HEADERS, dumps
+from common.resilience import resilience
+from common.tracing import TracingTransport, tracer
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+UNIX_SCHEME = "http+unix://"
+
+
+def unix_socket_url(path: str) -> str:
+    """Base URL for a service listening on a Unix domain socket, e.g. http+unix://%2Frun%2Forder.sock"""
+    return UNIX_SCHEME + quote(path, safe="")
+
+
+def split_unix_url(base_url: str) -> Tuple[Optional[str], str]:
+    """(socket path, HTTP base URL) for http+unix:// URLs; (None, base_url) otherwise."""
+    if not base_url.startswith(UNIX_SCHEME):
+        return None, base_url
+    return unquote(base_url[len(UNIX_SCHEME):]), "http://localhost"
+
+
+class FastJSONClient(httpx.AsyncClient):
+    """AsyncClient whose json= bodies are encoded by common.models.dumps (orjson) instead of stdlib json."""
+
+    def build_request(self, method, url, *, json=None, **kwargs) -> httpx.Request:
+        if json is not None:
+            kwargs["content"] = dumps(json)
+            kwargs["headers"] = {**JSON_HEADERS, **(kwargs.get("headers") or {})}
+        return super().build_request(method, url, **kwargs)
+
+
+class HttpClientRegistry:
+    """
+    Per-process registry of pooled httpx.AsyncClient instances, one per
+    upstream base URL. Clients keep connections alive across requests so a
+    checkout does not pay a TCP connect/teardown for every hop.
+
+    Clients are created lazily on first use and closed by the service lifespan.
+    Base URLs of the form http+unix://<quoted path> (see unix_socket_url)
+    connect over a Unix domain socket instead of TCP.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        http2: bool = False,
+        resilient: bool = True,
+    ) -> None:
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+        )
+        self._http2 = http2 and _http2_available()
+        self._resilient = resilient
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        # Clients replaced by reconfigure(); still serving in-flight requests
+        # until _close_retired() closes them.
+        self._retired: List[httpx.AsyncClient] = []
+        self._closers: Set[asyncio.Task] = set()
+        self._transports: Dict[str, httpx.AsyncBaseTransport] = {}
+        self._lock = Lock()
+
+    def mount(self, base_url: str, transport: httpx.AsyncBaseTransport) -> None:
+        """
+        Routes a base URL through a custom transport, e.g. httpx.ASGITransport
+        to call another app in the same process. Applies to clients created
+        after the call.
+        """
+        with self._lock:
+            self._transports[base_url] = transport
+
+    def unmount_all(self) -> None:
+        with self._lock:
+            self._transports.clear()
+
+    def reconfigure(self, max_connections: int, max_keepalive: int, http2: bool) -> None:
+        """
+        Applies new pool settings. Existing clients are retired rather than
+        closed, so in-flight requests finish; new requests get fresh pools.
+        Retired clients are closed once the request timeout has passed.
+        """
+        with self._lock:
+            self._limits = httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+            )
+            self._http2 = http2 and _http2_available()
+            retired = list(self._clients.values())
+            self._retired.extend(retired)
+            self._clients = {}
+        if not retired:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # reloaded outside the event loop: aclose() closes them at shutdown
+        task = loop.create_task(self._close_retired(retired, config.current.http_timeout_seconds))
+        self._closers.add(task)
+        task.add_done_callback(self._closers.discard)
+
+    async def _close_retired(self, clients: List[httpx.AsyncClient], grace: float) -> None:
+        # No request on the old pools outlives its timeout.
+        await asyncio.sleep(grace)
+        for client in clients:
+            await client.aclose()
+        with self._lock:
+            self._retired = [c for c in self._retired if c not in clients]
+
+    def get(self, base_url: str) -> httpx.AsyncClient:
+        client = self._clients.get(base_url)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(base_url)
+            if client is None:
+                uds, http_base = split_unix_url(base_url)
+                transport = self._transports.get(base_url)
+                if transport is None:
+                    transport = httpx.AsyncHTTPTransport(limits=self._limits, http2=self._http2, uds=uds)
+                if self._resilient:
+                    # Deadline, circuit breaker and bulkhead for this upstream
+                    transport = resilience.wrap(base_url, transport)
+                if tracer.enabled:
+                    # Client span + traceparent; outside resilience so it includes bulkhead waits
+                    transport = TracingTransport(transport, base_url)
+                client = FastJSONClient(
+                    base_url=http_base,
+                    transport=transport,
+                    timeout=config.current.http_timeout_seconds,
+                )
+                self._clients[base_url] = client
+            return client
+
+    async def aclose(self) -> None:
+        for task in list(self._closers):
+            task.cancel()
+        with self._lock:
+            clients = list(self._clients.values()) + self._retired
+            self._clients.clear()
+            self._retired = []
+        for client in clients:
+            await client.aclose()
+
+
+# Process-wide registry; pool sizing comes from config.txt.
+http_clients = HttpClientRegistry(
+    max_connections=config.current.http_pool_size,
+    max_keepalive=config.current.http_max_keepalive,
+    http2=config.current.http2_enabled,
+    resilient=get_bool_setting("resilience_enabled", True),
+)
+
+
+def _resize_pools(old, new, changed) -> None:
+    http_clients.reconfigure(new.http_pool_size, new.http_max_keepalive, new.http2_enabled)
+
+
+config.on_change(
+    _resize_pools,
+    keys=("http_pool_size", "http_max_keepalive", "http2_enabled", "http_timeout_seconds"),
+)
+
+
+def get_client(base_url: str) -> httpx.AsyncClient:
+    return http_clients.get(base_url)
+
+
+async def close_http_clients() -> None:
+    await http_clients.aclose()
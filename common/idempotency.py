@@ -0,0 +1,174 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+from pydantic import BaseModel
+
+from common.config import get_int_setting
+from common.metrics import metrics
+
+T = TypeVar("T")
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+metrics.describe("idempotency_requests_total", "Keyed requests by result (hit, miss, coalesced)")
+metrics.describe("idempotency_evictions_total", "Cached results evicted to stay under the entry or memory cap")
+metrics.describe("idempotency_entries", "Cached results held")
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used with a different request body."""
+
+
+def charge_key(order_id: str) -> str:
+    """Idempotency-Key order_service sends with the charge of a caller-identified order."""
+    return f"charge:{order_id}"
+
+
+def fingerprint(req: BaseModel) -> str:
+    return hashlib.blake2b(req.model_dump_json().encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _approx_size(obj: Any) -> int:
+    if isinstance(obj, BaseModel):
+        return sys.getsizeof(obj) + _approx_size(obj.__dict__)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(_approx_size(k) + _approx_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(_approx_size(v) for v in obj)
+    return sys.getsizeof(obj)
+
+
+@dataclass
+class _Entry(Generic[T]):
+    value: T
+    fingerprint: str
+    expires_at: float
+    size: int
+
+
+class IdempotencyStore(Generic[T]):
+    """
+    Result cache keyed by Idempotency-Key.
+
+    - Completed results are kept with LRU + TTL eviction under an entry
+      count and approximate memory cap.
+    - Concurrent calls with the same key wait for the first one instead of
+      executing again.
+    - Failures are not cached, so a retry after an error runs again.
+    """
+
+    def __init__(
+        self, name: str, max_entries: int = 10_000, ttl_seconds: float = 600.0, max_bytes: int = 16 << 20
+    ) -> None:
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _Entry[T]]" = OrderedDict()
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self._bytes = 0
+
+        self._hits = metrics.counter("idempotency_requests_total", store=name, result="hit")
+        self._misses = metrics.counter("idempotency_requests_total", store=name, result="miss")
+        self._coalesced = metrics.counter("idempotency_requests_total", store=name, result="coalesced")
+        self._evictions = metrics.counter("idempotency_evictions_total", store=name)
+        self._entries_gauge = metrics.gauge("idempotency_entries", store=name)
+
+    async def run(self, key: str, fp: str, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Returns (result, replayed). `fp` fingerprints the request so a key
+        reused for a different request is rejected with IdempotencyConflict.
+        """
+        while True:
+            entry = self._get(key)
+            if entry is not None:
+                if entry.fingerprint != fp:
+                    raise IdempotencyConflict(key)
+                self._hits.inc()
+                return entry.value, True
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            if inflight[0] != fp:
+                raise IdempotencyConflict(key)
+            self._coalesced.inc()
+            try:
+                return await asyncio.shield(inflight[1]), True
+            except asyncio.CancelledError:
+                if not inflight[1].cancelled():
+                    raise
+                # The first caller was cancelled before finishing; try again.
+
+        self._misses.inc()
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (fp, fut)
+        try:
+            value = await fn()
+        except Exception as e:
+            fut.set_exception(e)
+            # Mark retrieved; waiters (if any) re-raise it themselves.
+            fut.exception()
+            raise
+        except BaseException:
+            fut.cancel()
+            raise
+        else:
+            fut.set_result(value)
+            self._put(key, _Entry(value, fp, time.monotonic() + self.ttl_seconds, _approx_size(value)))
+            return value, False
+        finally:
+            self._inflight.pop(key, None)
+
+    def _get(self, key: str) -> Optional[_Entry[T]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key: str, entry: _Entry[T]) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self._evictions.inc()
+        self._entries_gauge.set(len(self._entries))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        self._entries_gauge.set(len(self._entries))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "inflight": len(self._inflight),
+            "hits": self._hits.value,
+            "misses": self._misses.value,
+            "coalesced": self._coalesced.value,
+            "evictions": self._evictions.value,
+        }
+
+
+def store_from_config(name: str) -> IdempotencyStore:
+    """`name` labels the store's metrics (one store per service)."""
+    return IdempotencyStore(
+        name,
+        max_entries=get_int_setting("idempotency_max_entries", 10_000),
+        ttl_seconds=float(get_int_setting("idempotency_ttl_seconds", 600)),
+        max_bytes=get_int_setting("idempotency_max_bytes", 16 << 20),
+    )
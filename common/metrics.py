@@ -0,0 +1,193 @@
+from __future__ import annotations
+import bisect
+import math
+import time
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _log_linear_bounds(lowest: float = 0.001, highest: float = 100_000.0) -> List[float]:
+    """
+    HDR-style bucket bounds: each decade is split into the same relative
+    steps, so the error is bounded as a fraction of the value (~25%).
+    """
+    steps = (1.0, 1.25, 1.5, 2.0, 2.5, 3.0, 4.0, 5.0, 6.0, 8.0)
+    bounds = []
+    decade = lowest
+    while decade < highest:
+        bounds.extend(round(decade * s, 12) for s in steps)
+        decade *= 10.0
+    bounds.append(highest)
+    return bounds
+
+
+DEFAULT_BOUNDS_MS = _log_linear_bounds()
+
+
+class Counter:
+    """
+    Monotonic counter. inc() is a plain attribute update: under the GIL an
+    increment can at worst be lost in a thread race, never corrupted, which
+    is an acceptable trade for not taking a lock on the hot path.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, n: int = 1) -> None:
+        self.value += n
+
+
+class Gauge:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, n: float = 1.0) -> None:
+        self.value += n
+
+    def dec(self, n: float = 1.0) -> None:
+        self.value -= n
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (milliseconds)."""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Optional[List[float]] = None) -> None:
+        self.bounds = bounds or DEFAULT_BOUNDS_MS
+        # one extra slot for values above the highest bound (+Inf)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def observe_since(self, start_ns: int) -> None:
+        self.observe((time.perf_counter_ns() - start_ns) / 1_000_000)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th value (0 if empty)."""
+        if self.count == 0:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else math.inf
+        return math.inf
+
+
+class MetricsRegistry:
+    """
+    Get-or-create store of named, labelled metrics. Look a metric up once
+    and keep the handle; recording through the handle costs no lookup.
+    """
+
+    def __init__(self) -> None:
+        self._counters: Dict[Tuple[str, Labels], Counter] = {}
+        self._gauges: Dict[Tuple[str, Labels], Gauge] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Labels]:
+        return name, tuple(sorted(labels.items()))
+
+    def _get(self, table: Dict, factory, name: str, labels: Dict[str, str]):
+        key = self._key(name, labels)
+        metric = table.get(key)
+        if metric is None:
+            with self._lock:
+                metric = table.setdefault(key, factory())
+        return metric
+
+    def counter(self, name: str, **labels: str) -> Counter:
+        return self._get(self._counters, Counter, name, labels)
+
+    def gauge(self, name: str, **labels: str) -> Gauge:
+        return self._get(self._gauges, Gauge, name, labels)
+
+    def histogram(self, name: str, **labels: str) -> Histogram:
+        return self._get(self._histograms, Histogram, name, labels)
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    # ---- Prometheus text exposition ----
+    @staticmethod
+    def _fmt_labels(labels: Iterable[Tuple[str, str]]) -> str:
+        parts = [f'{k}="{v}"' for k, v in labels]
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def _header(self, lines: List[str], name: str, kind: str, seen: set) -> None:
+        if name in seen:
+            return
+        seen.add(name)
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def render(self) -> str:
+        lines: List[str] = []
+        seen: set = set()
+        for (name, labels), c in sorted(self._counters.items()):
+            self._header(lines, name, "counter", seen)
+            lines.append(f"{name}{self._fmt_labels(labels)} {c.value}")
+        for (name, labels), g in sorted(self._gauges.items()):
+            self._header(lines, name, "gauge", seen)
+            lines.append(f"{name}{self._fmt_labels(labels)} {g.value}")
+        for (name, labels), h in sorted(self._histograms.items()):
+            self._header(lines, name, "histogram", seen)
+            cumulative = 0
+            for bound, c in zip(h.bounds, h.counts):
+                cumulative += c
+                le = self._fmt_labels(labels + (("le", repr(bound)),))
+                lines.append(f"{name}_bucket{le} {cumulative}")
+            le = self._fmt_labels(labels + (("le", "+Inf"),))
+            lines.append(f"{name}_bucket{le} {h.count}")
+            lines.append(f"{name}_sum{self._fmt_labels(labels)} {h.sum}")
+            lines.append(f"{name}_count{self._fmt_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry.
+metrics = MetricsRegistry()
+metrics.describe("http_request_duration_ms", "Inbound request latency per route and mode")
+metrics.describe("downstream_duration_ms", "Outbound call latency per hop and mode")
+
+
+def mode_label(oop_enabled: bool) -> str:
+    return "oop" if oop_enabled else "procedural"
+
+
+def hop_histogram(hop: str, oop_enabled: bool) -> Histogram:
+    return metrics.histogram("downstream_duration_ms", hop=hop, mode=mode_label(oop_enabled))
+
+
+def install_metrics(app: FastAPI) -> None:
+    """Adds GET /metrics in Prometheus text format and GET /healthz for probes."""
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def _metrics():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/healthz", response_class=PlainTextResponse, include_in_schema=False)
+    async def _healthz():
+        return PlainTextResponse("ok")
@@ -1,15 +1,118 @@
 import time
 from fastapi import FastAPI, Request
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from common.metrics import Histogram, metrics, mode_label
+from common.request_log import request_log
 
+
+# Route label for requests no route matched (404s, scanners).
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def route_label(scope: Scope) -> str:
+    """
+    Route template (e.g. /reservations/{reservation_id}) the router matched,
+    so timings and metric labels stay bounded whatever the concrete paths.
+    """
+    return getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+
+
+def _route_histogram(cache: dict, mode: str, scope: Scope, status: int) -> Histogram:
+    path = route_label(scope)
+    key = (scope["method"], path, status)
+    h = cache.get(key)
+    if h is None:
+        h = cache[key] = metrics.histogram(
+            "http_request_duration_ms", route=path, method=scope["method"], status=str(status), mode=mode
+        )
+    return h
+
+
+# ---- Pure ASGI timing middleware (used by all services) ----
+class TimingMiddleware:
+    """
+    Raw ASGI middleware: wraps `send` to capture the status from the
+    http.response.start message and times the request with perf_counter_ns.
+    Unlike BaseHTTPMiddleware it adds no extra task or body stream per request.
+    """
+
+    def __init__(self, app: ASGIApp, mode: str = "oop") -> None:
+        self.app = app
+        self.mode = mode
+        self._histograms: dict = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter_ns()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter_ns() - start) / 1_000_000
+            _route_histogram(self._histograms, self.mode, scope, status).observe(duration_ms)
+            request_log.log_request(scope["method"], route_label(scope), status, duration_ms)
+
+
+def timing_middleware(app: ASGIApp, mode: str = "procedural") -> ASGIApp:
+    """
+    Procedural (closure-based) equivalent of TimingMiddleware.
+    """
+    histograms: dict = {}
+
+    async def _timing_app(scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await app(scope, receive, send)
+            return
+
+        start = time.perf_counter_ns()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter_ns() - start) / 1_000_000
+            _route_histogram(histograms, mode, scope, status).observe(duration_ms)
+            request_log.log_request(scope["method"], route_label(scope), status, duration_ms)
+
+    return _timing_app
+
+
+def install_timing_middleware(app: FastAPI, oop_enabled: bool) -> None:
+    """
+    Installs the timing middleware the same way in every service: the class
+    in OOP mode, the closure in procedural mode.
+    """
+    if oop_enabled:
+        app.add_middleware(TimingMiddleware, mode=mode_label(True))
+    else:
+        app.add_middleware(timing_middleware, mode=mode_label(False))
+
+
+# ---- BaseHTTPMiddleware variants (kept for comparison benchmarks) ----
 class LoggingMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         start = time.time()
         response = await call_next(request)
         duration_ms = (time.time() - start) * 1000.0
-        # Consider disabling prints for benchmark runs
-        print(f"{request.method} {request.url.path} -> {response.status_code} in {duration_ms:.2f} ms")
+        request_log.log_request(request.method, route_label(request.scope), response.status_code, duration_ms)
         return response
 
 
@@ -23,6 +126,5 @@ def install_logging_middleware(app: FastAPI) -> None:
         start = time.time()
         response = await call_next(request)
         duration_ms = (time.time() - start) * 1000.0
-        # Consider disabling prints for benchmark runs
-        print(f"{request.method} {request.url.path} -> {response.status_code} in {duration_ms:.2f} ms")
+        request_log.log_request(request.method, route_label(request.scope), response.status_code, duration_ms)
         return response
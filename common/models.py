@@ -1,10 +1,27 @@
-from pydantic import BaseModel
-from typing import List
+from fastapi import Depends, Request
+from fastapi.datastructures import Default
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, List, Optional, Type, TypeVar
+import pydantic_core
+
+try:
+    import orjson
+except ImportError:  # pydantic-core does the work instead, a bit slower
+    orjson = None
+
+M = TypeVar("M", bound=BaseModel)
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+# Internal: the gateway's asynchronous checkout tells order_service which
+# order id to use, so the id returned with 202 is the id of the order.
+ORDER_ID_HEADER = "X-Order-Id"
 
 
 class OrderItem(BaseModel):
     product_id: str
-    quantity: int
+    quantity: int = Field(gt=0)
 
 
 class CreateOrderRequest(BaseModel):
@@ -17,3 +34,80 @@ class OrderResponse(BaseModel):
     order_id: str
     status: str
     total_amount: float
+
+
+class BatchCreateOrderRequest(BaseModel):
+    orders: List[CreateOrderRequest]
+
+
+class BatchOrderResponse(BaseModel):
+    results: List[OrderResponse]
+
+
+class OrderDetail(BaseModel):
+    order_id: str
+    user_id: str
+    status: str
+    total_amount: float
+    payment_method: str
+    items: List[OrderItem]
+    created_at: float
+
+
+class UserOrdersPage(BaseModel):
+    orders: List[OrderDetail]
+    next_cursor: Optional[str] = None
+
+
+# ---- Serialization ----
+def dumps(obj: Any) -> bytes:
+    """
+    Encodes a request/response body. Plain dicts/lists go through orjson;
+    models, or containers holding models (e.g. {"items": req.items}), through
+    pydantic-core, which serializes them natively without model_dump().
+    """
+    if orjson is not None and not isinstance(obj, BaseModel):
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    return pydantic_core.to_json(obj)
+
+
+def loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return pydantic_core.from_json(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by dumps(): orjson, or pydantic-core without it."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# Used as default_response_class on every service. Wrapped in Default() so
+# routes with a response_model keep FastAPI's own fast path (pydantic-core
+# straight to bytes); routes returning plain dicts are rendered by orjson.
+DEFAULT_RESPONSE_CLASS = Default(FastJSONResponse)
+
+
+def json_body(model_cls: Type[M]) -> Any:
+    """
+    Request-body dependency that parses and validates in one pass with
+    model_validate_json, instead of FastAPI's json.loads() followed by
+    validation of the resulting dict. Errors are reported as the usual 422;
+    the body schema is no longer part of the route's OpenAPI document.
+
+        async def create_order(req: CreateOrderRequest = json_body(CreateOrderRequest)): ...
+    """
+    async def parse(request: Request) -> M:
+        try:
+            return model_cls.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(
+                [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+            )
+
+    return Depends(parse)
@@ -0,0 +1,112 @@
+"""
+On-demand sampling profiler.
+
+GET /debug/profile?seconds=N samples the Python stacks of the process
+every interval_ms for N seconds from a background thread (no tracing hook,
+so the service runs at normal speed in between samples) and answers with
+collapsed stacks, one line per distinct stack:
+
+    thread;outer_func (file.py:line);...;leaf_func (file.py:line) <samples>
+
+which flamegraph.pl, speedscope or inferno read directly. By default only
+the thread serving the request (the event loop) is sampled and samples
+where it is idle in the selector are dropped; ?threads=all includes every
+thread, ?idle=1 keeps the idle samples. One profile runs at a time.
+"""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from common.config import get_bool_setting, get_int_setting
+
+# Leaf frames of a thread that is waiting for work rather than running.
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+def _frame_label(code) -> str:
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval: float, thread_id: Optional[int] = None,
+                  keep_idle: bool = False) -> Counter:
+    """
+    Collapsed stack -> sample count over `seconds`; `thread_id` limits
+    sampling to one thread. Blocks the calling thread.
+    """
+    own = threading.get_ident()
+    names: Dict[int, str] = {}
+    stacks: Counter = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (thread_id is not None and ident != thread_id):
+                continue
+            code = frame.f_code
+            if not keep_idle and (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if ident not in names:
+                names.update((t.ident, t.name.replace(";", "_").replace(" ", "_")) for t in threading.enumerate())
+            labels.append(names.get(ident, str(ident)))
+            labels.reverse()
+            stacks[";".join(labels)] += 1
+        time.sleep(interval)
+    return stacks
+
+
+class Profiler:
+    """Runs one sampling profile at a time."""
+
+    def __init__(self, enabled: bool = False, max_seconds: int = 60) -> None:
+        self.enabled = enabled
+        self.max_seconds = max_seconds
+        self._busy = threading.Lock()
+
+    async def profile(self, seconds: float, interval: float, all_threads: bool, keep_idle: bool) -> str:
+        if not self._busy.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail="a profile is already running")
+        try:
+            thread_id = None if all_threads else threading.get_ident()
+            stacks = await asyncio.to_thread(sample_stacks, seconds, interval, thread_id, keep_idle)
+        finally:
+            self._busy.release()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+profiler = Profiler(
+    enabled=get_bool_setting("profiler_enabled", False),
+    max_seconds=get_int_setting("profiler_max_seconds", 60),
+)
+
+
+def install_profiler(app: FastAPI) -> None:
+    """GET /debug/profile on `app` (404 with profiler_enabled=0)."""
+
+    @app.get("/debug/profile", response_class=PlainTextResponse)
+    async def debug_profile(
+        seconds: float = Query(10.0, gt=0.0),
+        interval_ms: float = Query(5.0, ge=1.0, le=1000.0),
+        threads: str = Query("loop", pattern="^(loop|all)$"),
+        idle: bool = False,
+    ):
+        """Collapsed stacks sampled for `seconds` (text/plain, for flame graphs)."""
+        if not profiler.enabled:
+            raise HTTPException(status_code=404, detail="profiler disabled")
+        seconds = min(seconds, profiler.max_seconds)
+        return await profiler.profile(seconds, interval_ms / 1000.0, threads == "all", idle)
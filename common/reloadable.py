@@ -0,0 +1,56 @@
+from __future__ import annotations
+from contextlib import AsyncExitStack
+from typing import Callable, Iterable
+
+from fastapi import FastAPI
+
+from common.config import Settings, config
+
+# Every service picks its OOP vs procedural wiring from this switch.
+REBUILD_KEYS = ("oop_enabled",)
+
+
+class ReloadableApp:
+    """
+    ASGI wrapper that rebuilds a service's FastAPI app when the config keys it
+    was built from change, without restarting the process.
+
+    The factory (a service's create_app) runs again on the event loop and the
+    new app replaces the old one with a single reference swap: requests that
+    already started finish on the old app, new ones land on the new one.
+
+    The lifespan of the app built at startup owns process-wide resources
+    (HTTP pools, event bus) and is the one that runs; the config watcher is
+    started alongside it.
+    """
+
+    def __init__(self, factory: Callable[[], FastAPI], keys: Iterable[str] = REBUILD_KEYS) -> None:
+        self._factory = factory
+        self.app = factory()
+        self.generation = 0
+        config.on_change(self._rebuild, keys=keys)
+
+    def _rebuild(self, old: Settings, new: Settings, changed) -> None:
+        self.app = self._factory()
+        self.generation += 1
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        await self.app(scope, receive, send)
+
+    async def _lifespan(self, receive, send) -> None:
+        app = self.app
+        await receive()  # lifespan.startup
+        async with AsyncExitStack() as stack:
+            try:
+                await stack.enter_async_context(app.router.lifespan_context(app))
+                config.start_watching()
+                stack.push_async_callback(config.stop_watching)
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": repr(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+            await receive()  # lifespan.shutdown
+        await send({"type": "lifespan.shutdown.complete"})
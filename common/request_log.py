@@ -0,0 +1,163 @@
+from __future__ import annotations
+import atexit
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, TextIO, Tuple
+
+from common.config import get_bool_setting, get_config_value, get_int_setting
+from common.metrics import metrics
+
+metrics.describe("request_log_records_total", "Log records not written, by reason (dropped: buffer full; sampled_out)")
+
+
+class RequestLog:
+    """
+    Structured, non-blocking log sink.
+
+    Callers on the event loop only append a record to a bounded in-memory
+    buffer; a background writer thread drains it in batches and does the
+    formatting and I/O. When the buffer is full new records are dropped and
+    counted instead of blocking the caller.
+
+    In benchmark mode nothing is buffered or written: request timings are
+    only aggregated per route, so the hot path costs a dict update.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 8192,
+        batch_size: int = 256,
+        flush_interval: float = 0.2,
+        sample_rate: float = 1.0,
+        benchmark_mode: bool = False,
+        path: Optional[str] = None,
+    ) -> None:
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample_rate = sample_rate
+        self.benchmark_mode = benchmark_mode
+        self.path = path
+
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+        self._dropped = metrics.counter("request_log_records_total", reason="dropped")
+        self._sampled_out = metrics.counter("request_log_records_total", reason="sampled_out")
+        self.written = 0
+        # route -> (count, total_ms, max_ms); kept in every mode
+        self._timings: Dict[Tuple[str, str], Tuple[int, float, float]] = {}
+
+    # ---- hot path ----
+    def log_request(self, method: str, path: str, status: int, duration_ms: float) -> None:
+        key = (method, path)
+        count, total, worst = self._timings.get(key, (0, 0.0, 0.0))
+        self._timings[key] = (count + 1, total + duration_ms, max(worst, duration_ms))
+        if self.benchmark_mode:
+            return
+        self._push({
+            "kind": "request",
+            "method": method,
+            "path": path,
+            "status": status,
+            "duration_ms": round(duration_ms, 3),
+        })
+
+    def event(self, source: str, message: str, **fields: Any) -> None:
+        if self.benchmark_mode:
+            return
+        record = {"kind": "event", "source": source, "message": message}
+        record.update(fields)
+        self._push(record)
+
+    def write(self, kind: str, record: Dict[str, Any]) -> None:
+        """Buffers a record of another kind (e.g. a kept trace) as one JSON line."""
+        if self.benchmark_mode:
+            return
+        self._push({"kind": kind, **record})
+
+    def _push(self, record: Dict[str, Any]) -> None:
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self._sampled_out.inc()
+            return
+        if len(self._buffer) >= self.capacity:
+            self._dropped.inc()
+            return
+        record["ts"] = time.time()
+        self._buffer.append(record)
+        if self._writer is None:
+            self._start()
+        elif len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    # ---- background writer ----
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._writer is not None:
+                return
+            self._writer = threading.Thread(target=self._run, name="request-log-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
+    def _open(self) -> TextIO:
+        if self.path:
+            return open(self.path, "a", encoding="utf-8")
+        return sys.stdout
+
+    def _run(self) -> None:
+        out = self._open()
+        try:
+            while not self._stop.is_set():
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                self._drain(out)
+            self._drain(out)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+    def _drain(self, out: TextIO) -> None:
+        buf = self._buffer
+        while buf:
+            lines = []
+            for _ in range(min(self.batch_size, len(buf))):
+                lines.append(json.dumps(buf.popleft(), separators=(",", ":")))
+            out.write("\n".join(lines) + "\n")
+            out.flush()
+            self.written += len(lines)
+
+    def close(self, timeout: float = 2.0) -> None:
+        writer = self._writer
+        if writer is None:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        writer.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered": len(self._buffer),
+            "written": self.written,
+            "dropped": self._dropped.value,
+            "sampled_out": self._sampled_out.value,
+            "routes": {
+                f"{m} {p}": {"count": c, "avg_ms": t / c, "max_ms": w}
+                for (m, p), (c, t, w) in self._timings.items()
+            },
+        }
+
+
+# Process-wide log sink, configured from config.txt.
+request_log = RequestLog(
+    capacity=get_int_setting("log_buffer_size", 8192),
+    sample_rate=float(get_config_value("log_sample_rate", "1.0") or 1.0),
+    benchmark_mode=get_bool_setting("log_benchmark_mode", False),
+    path=get_config_value("log_path") or None,
+)
@@ -0,0 +1,292 @@
+"""
+Resilience layer for inter-service calls.
+
+Every pooled client from common.http_client sends through a
+ResilientTransport, so the OOP and the procedural code paths get the same
+protection without changing their call sites:
+
+- end-to-end deadline: the inbound X-Deadline-Ms (or a default budget) is
+  kept in a context variable by DeadlineMiddleware; each outbound call
+  forwards the remaining budget and caps its own timeout to it;
+- per-upstream circuit breaker: after N consecutive failures the upstream
+  is skipped for a while, then a limited number of half-open probes decide
+  whether to close it again;
+- per-upstream bulkhead: a cap on concurrent calls, rejected immediately
+  when full instead of queueing behind a slow upstream.
+
+Rejections raise UpstreamUnavailable (503, with Retry-After) or
+DeadlineExceeded (504); install_resilience() maps them for a service.
+"""
+from __future__ import annotations
+import math
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from common.config import config, get_config_value, get_int_setting
+from common.deadline import DEADLINE_HEADER, Deadline
+from common.metrics import metrics
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_VALUE = {CLOSED: 0.0, OPEN: 1.0, HALF_OPEN: 2.0}
+# Responses held against the upstream that sent them (see CircuitBreaker).
+FAILURE_STATUSES = frozenset((500, 504))
+
+metrics.describe("upstream_circuit_state", "Circuit breaker state per upstream (0 closed, 1 open, 2 half-open)")
+metrics.describe("upstream_rejections_total", "Outbound calls failed fast, per upstream and reason")
+metrics.describe("upstream_in_flight", "Outbound calls currently inside the bulkhead, per upstream")
+
+_DEADLINE_HEADER_KEY = DEADLINE_HEADER.lower().encode("latin-1")
+
+# Deadline of the inbound request being served (None outside a request).
+current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+
+
+class UpstreamUnavailable(httpx.TransportError):
+    """Call not attempted: circuit open or bulkhead full."""
+
+    def __init__(self, message: str, retry_after: float = 1.0) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """The end-to-end budget ran out before the call could be made."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker. Transport errors, timeouts and 500/504
+    responses count as failures; any other response resets the count.
+    502 and 503 are not held against the upstream itself: they mean one of
+    *its* upstreams failed or it shed load, and counting them would let one
+    broken leaf service open every breaker on the way to the gateway.
+    """
+
+    def __init__(self, upstream: str, failure_threshold: int = 5, open_seconds: float = 5.0,
+                 half_open_probes: int = 1) -> None:
+        self.upstream = upstream
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        self._gauge = metrics.gauge("upstream_circuit_state", upstream=upstream)
+        self._rejections = metrics.counter("upstream_rejections_total", upstream=upstream, reason="circuit_open")
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        self._gauge.set(_STATE_VALUE[state])
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def acquire(self) -> bool:
+        """Admits a call, raising UpstreamUnavailable when open. Returns True for a probe."""
+        if self.state == CLOSED:
+            return False
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                self._rejections.inc()
+                raise UpstreamUnavailable(f"Circuit open for {self.upstream}", retry_after=self.retry_after())
+            self._set_state(HALF_OPEN)
+            self._probes = 0
+        if self._probes >= self.half_open_probes:
+            self._rejections.inc()
+            raise UpstreamUnavailable(f"Circuit half-open for {self.upstream}, probe in flight")
+        self._probes += 1
+        return True
+
+    def release(self, probe: bool, success: Optional[bool]) -> None:
+        """success=None: the call was cancelled and says nothing about the upstream."""
+        if probe:
+            self._probes -= 1
+        if success is None:
+            return
+        if success:
+            self.failures = 0
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+
+class Bulkhead:
+    """Caps concurrent calls to one upstream; excess calls fail immediately."""
+
+    def __init__(self, upstream: str, max_concurrent: int) -> None:
+        self.upstream = upstream
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self._gauge = metrics.gauge("upstream_in_flight", upstream=upstream)
+        self._rejections = metrics.counter("upstream_rejections_total", upstream=upstream, reason="bulkhead_full")
+
+    def acquire(self) -> None:
+        if self.in_flight >= self.max_concurrent:
+            self._rejections.inc()
+            raise UpstreamUnavailable(f"Bulkhead full for {self.upstream} ({self.max_concurrent} in flight)")
+        self.in_flight += 1
+        self._gauge.inc()
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._gauge.dec()
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """httpx transport wrapper applying deadline, breaker and bulkhead to one upstream."""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, breaker: CircuitBreaker, bulkhead: Bulkhead) -> None:
+        self.inner = inner
+        self.breaker = breaker
+        self.bulkhead = bulkhead
+        self._deadline_rejections = metrics.counter(
+            "upstream_rejections_total", upstream=breaker.upstream, reason="deadline"
+        )
+
+    def _apply_deadline(self, request: httpx.Request) -> None:
+        deadline = current_deadline.get()
+        if deadline is None:
+            return
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            self._deadline_rejections.inc()
+            raise DeadlineExceeded(f"Deadline exceeded before calling {self.breaker.upstream}", request=request)
+        request.headers[DEADLINE_HEADER] = str(int(remaining * 1000.0))
+        timeout = request.extensions.get("timeout")
+        if timeout:
+            request.extensions["timeout"] = {
+                k: remaining if v is None else min(v, remaining) for k, v in timeout.items()
+            }
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._apply_deadline(request)
+        probe = self.breaker.acquire()
+        try:
+            self.bulkhead.acquire()
+        except UpstreamUnavailable:
+            self.breaker.release(probe, None)
+            raise
+        success: Optional[bool] = None
+        try:
+            response = await self.inner.handle_async_request(request)
+            success = response.status_code not in FAILURE_STATUSES
+            return response
+        except httpx.TransportError:
+            success = False
+            raise
+        finally:
+            self.bulkhead.release()
+            self.breaker.release(probe, success)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+class ResilienceRegistry:
+    """One breaker and one bulkhead per upstream base URL, shared by all its clients."""
+
+    def __init__(self, failure_threshold: int, open_seconds: float, half_open_probes: int,
+                 max_concurrent: int) -> None:
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.max_concurrent = max_concurrent
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.bulkheads: Dict[str, Bulkhead] = {}
+
+    def wrap(self, upstream: str, inner: httpx.AsyncBaseTransport) -> ResilientTransport:
+        breaker = self.breakers.get(upstream)
+        if breaker is None:
+            breaker = self.breakers[upstream] = CircuitBreaker(
+                upstream, self.failure_threshold, self.open_seconds, self.half_open_probes
+            )
+        bulkhead = self.bulkheads.get(upstream)
+        if bulkhead is None:
+            bulkhead = self.bulkheads[upstream] = Bulkhead(upstream, self.max_concurrent)
+        return ResilientTransport(inner, breaker, bulkhead)
+
+
+resilience = ResilienceRegistry(
+    failure_threshold=get_int_setting("breaker_failure_threshold", 5),
+    open_seconds=float(get_config_value("breaker_open_seconds", "5") or 5),
+    half_open_probes=get_int_setting("breaker_half_open_probes", 1),
+    max_concurrent=get_int_setting("bulkhead_max_concurrent", 200),
+)
+
+
+def upstream_error_status(exc: httpx.HTTPError) -> int:
+    """HTTP status a service should answer with when an upstream call failed."""
+    if isinstance(exc, UpstreamUnavailable):
+        return 503
+    if isinstance(exc, httpx.TimeoutException):
+        return 504
+    if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code in (503, 504):
+        # Pass the upstream's fast-fail through instead of masking it as 502.
+        return exc.response.status_code
+    return 502
+
+
+def upstream_error_headers(exc: httpx.HTTPError) -> Optional[Dict[str, str]]:
+    if isinstance(exc, UpstreamUnavailable):
+        return {"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+    if isinstance(exc, httpx.HTTPStatusError) and "retry-after" in exc.response.headers:
+        return {"Retry-After": exc.response.headers["retry-after"]}
+    return None
+
+
+class DeadlineMiddleware:
+    """
+    Raw ASGI middleware: starts the request's deadline from X-Deadline-Ms,
+    or from http_timeout_seconds when the caller sent none. At the edge
+    (`edge=True`) the header comes from clients and is capped at
+    http_timeout_seconds.
+    """
+
+    def __init__(self, app: ASGIApp, edge: bool = False) -> None:
+        self.app = app
+        self.edge = edge
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = None
+        for name, value in scope["headers"]:
+            if name == _DEADLINE_HEADER_KEY:
+                header = value.decode("latin-1")
+                break
+        default_s = config.current.http_timeout_seconds
+        deadline = Deadline.from_header(header, default_s, default_s if self.edge else None)
+        token = current_deadline.set(deadline)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_deadline.reset(token)
+
+
+def install_resilience(app: FastAPI, edge: bool = False) -> None:
+    """
+    Deadline tracking plus 502/503/504 answers for upstream failures that
+    reach the app. `edge` marks a service that takes client traffic.
+    """
+    app.add_middleware(DeadlineMiddleware, edge=edge)
+
+    async def _upstream_error(request: Request, exc: httpx.HTTPError) -> JSONResponse:
+        return JSONResponse(
+            {"detail": str(exc)},
+            status_code=upstream_error_status(exc),
+            headers=upstream_error_headers(exc),
+        )
+
+    app.add_exception_handler(httpx.HTTPError, _upstream_error)
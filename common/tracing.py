@@ -0,0 +1,374 @@
+"""
+Request tracing across services (W3C Trace Context).
+
+TracingMiddleware continues the trace of an incoming `traceparent` header,
+or starts a new one, and opens a server span for the request. Calls made
+through common.http_client get a client span and pass `traceparent` on, so
+one checkout shows up under the same trace id in every service it touches.
+span() and @traced add spans for the work in between (CheckoutBuilder
+steps, request validation, ...).
+
+Sampling:
+- head: a new trace is sampled with probability trace_sample_rate; the
+  decision travels downstream in the traceparent flags, and a service
+  follows its caller's decision.
+- tail: with trace_tail_ms > 0 every request is recorded, and one that was
+  not head-sampled is still kept when it took at least trace_tail_ms or
+  answered 5xx. The decision is per service: each keeps its own slow part.
+
+Kept traces go to an in-memory ring buffer (GET /debug/traces) and, with
+trace_export_path, to a JSON lines file written by a background thread.
+
+Spans are only created inside a recorded request: elsewhere span() is one
+ContextVar lookup returning a shared no-op. With tracing_enabled=0 (needs a
+restart) neither the middleware nor the client wrapper is installed and
+@traced returns the function unchanged.
+"""
+from __future__ import annotations
+import functools
+import random
+import time
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, Query
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from common.config import config, get_bool_setting, get_config_value, get_int_setting
+from common.metrics import metrics
+from common.request_log import RequestLog
+
+TRACEPARENT_HEADER = "traceparent"
+TRACE_ID_HEADER = "X-Trace-Id"
+_TRACEPARENT_KEY = TRACEPARENT_HEADER.encode("latin-1")
+
+metrics.describe("traces_total", "Requests recorded for tracing, by outcome (kept, dropped)")
+
+
+def _new_trace_id() -> str:
+    return f"{random.getrandbits(128):032x}"
+
+
+def _new_span_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, parent span id, sampled) from a traceparent header; None if absent or malformed."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+        return None
+    trace_id, span_id, flags = parts[1], parts[2], parts[3]
+    if len(trace_id) != 32 or len(span_id) != 16 or len(flags) != 2:
+        return None
+    try:
+        if int(trace_id, 16) == 0 or int(span_id, 16) == 0:
+            return None
+        return trace_id.lower(), span_id.lower(), bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+
+
+class LocalTrace:
+    """The spans one service records for one request."""
+
+    __slots__ = ("sampled", "spans")
+
+    def __init__(self, sampled: bool) -> None:
+        self.sampled = sampled
+        self.spans: List[Span] = []
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "_t0", "duration_ns",
+                 "attrs", "error", "local")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, kind: str, local: LocalTrace,
+                 attrs: Optional[Dict[str, Any]] = None) -> None:
+        self.trace_id = trace_id
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self._t0 = time.perf_counter_ns()
+        self.duration_ns = 0
+        self.attrs = attrs
+        self.error: Optional[str] = None
+        self.local = local
+
+    def child(self, name: str, kind: str = "internal", attrs: Optional[Dict[str, Any]] = None) -> "Span":
+        return Span(self.trace_id, self.span_id, name, kind, self.local, attrs)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.local.sampled else '00'}"
+
+    def set(self, key: str, value: Any) -> None:
+        if self.attrs is None:
+            self.attrs = {}
+        self.attrs[key] = value
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.duration_ns = time.perf_counter_ns() - self._t0
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.local.spans.append(self)
+
+    def to_dict(self, root_start_ns: int) -> Dict[str, Any]:
+        d = {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "offset_ms": (self.start_ns - root_start_ns) / 1e6,
+            "duration_ms": self.duration_ns / 1e6,
+        }
+        if self.attrs:
+            d["attrs"] = self.attrs
+        if self.error:
+            d["error"] = self.error
+        return d
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class _SpanScope:
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span: Span) -> None:
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self._token = current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        current_span.reset(self._token)
+        self.span.finish(exc)
+
+
+_NOOP = nullcontext()
+
+
+def span(name: str, **attrs: Any):
+    """`with span("name"):` records a child of the current span; a no-op outside a recorded request."""
+    parent = current_span.get()
+    if parent is None:
+        return _NOOP
+    return _SpanScope(parent.child(name, attrs=attrs or None))
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False, sample_rate: float = 0.01, tail_ms: float = 0.0,
+                 buffer_size: int = 1000, exporter: Optional[RequestLog] = None) -> None:
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.tail_ms = tail_ms
+        self.exporter = exporter
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=buffer_size)
+        self._kept = metrics.counter("traces_total", outcome="kept")
+        self._dropped = metrics.counter("traces_total", outcome="dropped")
+
+    def start(self, traceparent: Optional[str]) -> Optional[Tuple[str, Optional[str], LocalTrace]]:
+        """(trace_id, parent span id, local trace) for a request to record; None to not record it."""
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = None, None
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and self.tail_ms <= 0:
+            return None
+        return trace_id or _new_trace_id(), parent_id, LocalTrace(sampled)
+
+    def end(self, service: str, root: Span, failed: bool) -> None:
+        local = root.local
+        if not (local.sampled or failed or root.duration_ns >= self.tail_ms * 1e6):
+            self._dropped.inc()
+            return
+        self._kept.inc()
+        trace = {
+            "trace_id": root.trace_id,
+            "service": service,
+            "name": root.name,
+            "start": root.start_ns / 1e9,
+            "duration_ms": root.duration_ns / 1e6,
+            "sampled": local.sampled,
+            "error": failed,
+            "spans": [s.to_dict(root.start_ns) for s in local.spans],
+        }
+        self.recent.append(trace)
+        if self.exporter is not None:
+            self.exporter.write("trace", trace)
+
+    def find(self, trace_id: Optional[str] = None, service: Optional[str] = None, min_ms: float = 0.0,
+             limit: int = 50) -> List[Dict[str, Any]]:
+        """Kept traces, newest first."""
+        out = []
+        for t in reversed(list(self.recent)):  # snapshot: the loop keeps appending
+            if trace_id is not None and t["trace_id"] != trace_id:
+                continue
+            if service is not None and t["service"] != service:
+                continue
+            if t["duration_ms"] < min_ms:
+                continue
+            out.append(t)
+            if len(out) >= limit:
+                break
+        return out
+
+
+def tracer_from_config() -> Tracer:
+    enabled = get_bool_setting("tracing_enabled", False)
+    path = get_config_value("trace_export_path", "")
+    exporter = None
+    if enabled and path:
+        if not Path(path).is_absolute():
+            path = str(config.path.parent / path)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        exporter = RequestLog(path=path)
+    return Tracer(
+        enabled=enabled,
+        sample_rate=float(get_config_value("trace_sample_rate", "0.01") or 0.0),
+        tail_ms=float(get_config_value("trace_tail_ms", "0") or 0.0),
+        buffer_size=get_int_setting("trace_buffer_size", 1000),
+        exporter=exporter,
+    )
+
+
+# Process-wide: kept traces survive a rebuild of the app.
+tracer = tracer_from_config()
+
+
+def traced(name: Optional[str] = None):
+    """Decorator recording an async function as a span (named after it by default)."""
+
+    def decorate(fn):
+        if not tracer.enabled:
+            return fn
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            parent = current_span.get()
+            if parent is None:
+                return await fn(*args, **kwargs)
+            with _SpanScope(parent.child(span_name)):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+# ---- Incoming requests ----
+class TracingMiddleware:
+    """Raw ASGI middleware: one server span per recorded request, with the trace id in X-Trace-Id."""
+
+    def __init__(self, app: ASGIApp, service: str) -> None:
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = None
+        for name, value in scope["headers"]:
+            if name == _TRACEPARENT_KEY:
+                header = value.decode("latin-1")
+                break
+        started = tracer.start(header)
+        if started is None:
+            await self.app(scope, receive, send)
+            return
+        trace_id, parent_id, local = started
+        root = Span(trace_id, parent_id, scope["method"], "server", local)
+        status = 500
+        trace_header = (TRACE_ID_HEADER.encode("latin-1"), trace_id.encode("latin-1"))
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", ()), trace_header]
+            await send(message)
+
+        token = current_span.set(root)
+        error: Optional[BaseException] = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            current_span.reset(token)
+            route = scope.get("route")
+            root.name = f"{scope['method']} {getattr(route, 'path', None) or scope['path']}"
+            root.set("http.status_code", status)
+            root.finish(error)
+            tracer.end(self.service, root, failed=error is not None or status >= 500)
+
+
+# ---- Outgoing requests ----
+class TracingTransport(httpx.AsyncBaseTransport):
+    """httpx transport wrapper: a client span per call made inside a recorded request, plus traceparent."""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, upstream: str) -> None:
+        self.inner = inner
+        self.upstream = upstream
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        parent = current_span.get()
+        if parent is None:
+            return await self.inner.handle_async_request(request)
+        s = parent.child(f"{request.method} {request.url.path}", "client", {"upstream": self.upstream})
+        request.headers[TRACEPARENT_HEADER] = s.traceparent()
+        error: Optional[BaseException] = None
+        try:
+            response = await self.inner.handle_async_request(request)
+            s.set("http.status_code", response.status_code)
+            return response
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            s.finish(error)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+def install_tracing(app: FastAPI, service: str) -> None:
+    """Server spans for `app` (when tracing is enabled) and GET /debug/traces."""
+    if tracer.enabled:
+        app.add_middleware(TracingMiddleware, service=service)
+
+    @app.get("/debug/traces")
+    async def debug_traces(
+        trace_id: Optional[str] = None,
+        service_name: Optional[str] = Query(None, alias="service"),
+        min_ms: float = Query(0.0, ge=0.0),
+        limit: int = Query(50, ge=1, le=1000),
+        spans: bool = False,
+    ):
+        """
+        Recently kept traces, newest first. Spans are included with
+        ?spans=1 or when asking for one trace_id.
+        """
+        found = tracer.find(trace_id, service_name, min_ms, limit)
+        if not (spans or trace_id):
+            found = [{k: v for k, v in t.items() if k != "spans"} | {"span_count": len(t["spans"])} for t in found]
+        return {
+            "enabled": tracer.enabled,
+            "sample_rate": tracer.sample_rate,
+            "tail_ms": tracer.tail_ms,
+            "traces": found,
+        }
@@ -0,0 +1,265 @@
+from __future__ import annotations
+import csv
+import hashlib
+import math
+import mmap
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Binary catalog (.skucat), written by write_binary():
+#   header  "<8sQQ": magic, SKU count n, length of the id blob
+#   prices  n little-endian float64
+#   stock   n little-endian int64
+#   ids     UTF-8 product ids, "\n"-separated
+# Prices are served straight from the mapping; nothing is parsed per SKU
+# except the id blob.
+MAGIC = b"SKUCAT01"
+_HEADER = struct.Struct("<8sQQ")
+
+
+class CatalogSnapshot:
+    """
+    One immutable version of the price catalog.
+
+    `slots` maps product id -> slot; `prices[slot]` is the unit price and
+    `ids[slot]` the id. Readers grab `store.catalog` once and use it without
+    locks; writers never mutate a published snapshot, they build a new one
+    with with_delta() and swap the reference.
+
+    `version` is a content hash chained through every delta, so processes
+    that loaded the same file and applied the same deltas agree on it.
+    """
+
+    __slots__ = ("version", "slots", "ids", "prices", "_mapping")
+
+    def __init__(self, version: str, slots: Dict[str, int], ids: List[str], prices: Sequence[float],
+                 mapping: Optional[mmap.mmap] = None) -> None:
+        self.version = version
+        self.slots = slots
+        self.ids = ids
+        # array("d") or a float64 memoryview over a mapped .skucat file
+        self.prices = prices
+        self._mapping = mapping  # keeps the mapping alive as long as the snapshot
+
+    @classmethod
+    def empty(cls) -> "CatalogSnapshot":
+        return cls(hashlib.blake2b(b"", digest_size=8).hexdigest(), {}, [], array("d"))
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def price(self, product_id: str) -> Optional[float]:
+        slot = self.slots.get(product_id)
+        return None if slot is None else self.prices[slot]
+
+    def with_delta(self, upserts: Iterable[Tuple[str, float]], removes: Iterable[str] = ()) -> "CatalogSnapshot":
+        """
+        Returns a new snapshot with prices set (new ids get new slots) and
+        ids removed. The price column is copied; the id map only when ids
+        are added or removed, so price-only deltas stay cheap.
+        """
+        h = hashlib.blake2b(self.version.encode("ascii"), digest_size=8)
+        prices = array("d")
+        prices.frombytes(memoryview(self.prices).cast("B"))
+        slots, ids = self.slots, self.ids
+        copied = False
+        for product_id, price in upserts:
+            price = float(price)
+            h.update(f"+{product_id}\t{price!r}\n".encode("utf-8"))
+            slot = slots.get(product_id)
+            if slot is None:
+                if not copied:
+                    slots, ids, copied = dict(slots), list(ids), True
+                pid = sys.intern(product_id)
+                slot = slots[pid] = len(ids)
+                ids.append(pid)
+                prices.append(price)
+            else:
+                prices[slot] = price
+        for product_id in removes:
+            if product_id not in slots:
+                continue
+            h.update(f"-{product_id}\n".encode("utf-8"))
+            if not copied:
+                slots, ids, copied = dict(slots), list(ids), True
+            # The slot stays allocated (stock rows are indexed by it); it is
+            # just no longer reachable by id.
+            prices[slots.pop(product_id)] = math.nan
+        return CatalogSnapshot(h.hexdigest(), slots, ids, prices)
+
+    def memory_bytes(self) -> int:
+        """Approximate bytes held by the id map and price column."""
+        n = sys.getsizeof(self.slots) + sys.getsizeof(self.ids) + len(self.ids) * 8
+        n += sum(sys.getsizeof(pid) for pid in self.ids)
+        return n
+
+
+def _snapshot(version: str, ids: List[str], prices: Sequence[float],
+              mapping: Optional[mmap.mmap] = None) -> CatalogSnapshot:
+    # No sys.intern here: for millions of ids it costs as much as the map itself.
+    slots = dict(zip(ids, range(len(ids))))
+    if len(slots) != len(ids):
+        raise ValueError("catalog contains duplicate product ids")
+    return CatalogSnapshot(version, slots, ids, prices, mapping)
+
+
+# ---- Loaders: each returns (snapshot, stock column or None) ----
+def load_rows(rows: Iterable[Tuple[str, float, Optional[int]]]) -> Tuple[CatalogSnapshot, Optional[array]]:
+    """Builds a snapshot from (product_id, price, stock-or-None) rows."""
+    h = hashlib.blake2b(digest_size=8)
+    ids: List[str] = []
+    prices = array("d")
+    stock = array("q")
+    has_stock = False
+    for product_id, price, qty in rows:
+        h.update(f"{product_id}\t{float(price)!r}\n".encode("utf-8"))
+        ids.append(product_id)
+        prices.append(float(price))
+        if qty is not None:
+            has_stock = True
+        stock.append(-1 if qty is None else int(qty))
+    return _snapshot(h.hexdigest(), ids, prices), stock if has_stock else None
+
+
+def read_csv(path: Path) -> Iterator[Tuple[str, float, Optional[int]]]:
+    """
+    Rows of `product_id,price[,stock]`; a header line is skipped. An empty
+    price marks a removal, which only delta files use.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        for n, row in enumerate(reader):
+            if not row:
+                continue
+            if n == 0 and row[0].strip().lower() in ("product_id", "sku", "id"):
+                continue
+            stock = int(row[2]) if len(row) > 2 and row[2] else None
+            yield row[0], float(row[1]) if row[1] else math.nan, stock
+
+
+def load_csv(path: Path) -> Tuple[CatalogSnapshot, Optional[array]]:
+    return load_rows(read_csv(path))
+
+
+def load_binary(path: Path) -> Tuple[CatalogSnapshot, Optional[array]]:
+    """
+    Maps a .skucat file. The price column is used in place (on little-endian
+    hosts); the stock column is copied since stock is mutated.
+    """
+    with open(path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, n, ids_len = _HEADER.unpack_from(mapping, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path}: not a catalog file")
+    view = memoryview(mapping)
+    off = _HEADER.size
+    version = hashlib.blake2b(view, digest_size=8).hexdigest()
+    if sys.byteorder == "little":
+        prices = view[off:off + 8 * n].cast("d")
+    else:
+        prices = array("d")
+        prices.frombytes(view[off:off + 8 * n])
+        prices.byteswap()
+    off += 8 * n
+    stock = array("q")
+    stock.frombytes(view[off:off + 8 * n])
+    if sys.byteorder != "little":
+        stock.byteswap()
+    off += 8 * n
+    ids = str(view[off:off + ids_len], "utf-8").split("\n") if n else []
+    return _snapshot(version, ids, prices, mapping), stock
+
+
+def write_binary(path: Path, rows: Iterable[Tuple[str, float, Optional[int]]], default_stock: int = 0) -> int:
+    """Writes rows as a .skucat file; returns the number of SKUs."""
+    ids: List[str] = []
+    prices = array("d")
+    stock = array("q")
+    for product_id, price, qty in rows:
+        if "\n" in product_id:
+            raise ValueError(f"product id contains a newline: {product_id!r}")
+        ids.append(product_id)
+        prices.append(float(price))
+        stock.append(default_stock if qty is None else int(qty))
+    blob = "\n".join(ids).encode("utf-8")
+    if sys.byteorder != "little":
+        prices.byteswap()
+        stock.byteswap()
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(ids), len(blob)))
+        prices.tofile(f)
+        stock.tofile(f)
+        f.write(blob)
+    return len(ids)
+
+
+def read_delta(path: Path) -> Tuple[List[Tuple[str, float, Optional[int]]], List[str]]:
+    """Splits a delta CSV into (upserts, removes); rows with an empty price are removes."""
+    upserts: List[Tuple[str, float, Optional[int]]] = []
+    removes: List[str] = []
+    for product_id, price, stock in read_csv(path):
+        if math.isnan(price):
+            removes.append(product_id)
+        else:
+            upserts.append((product_id, price, stock))
+    return upserts, removes
+
+
+class DeltaDirectory:
+    """
+    A directory the catalog feed drops delta files into (`*.csv`, written
+    elsewhere and renamed in). Files are applied once each, in name order;
+    a file that fails is retried when it changes, and later files wait for it.
+    Every worker polling the same directory ends up on the same version.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._done: set = set()
+        self._failed: Dict[str, int] = {}  # name -> mtime of the failed attempt
+
+    def pending(self) -> List[Path]:
+        out: List[Path] = []
+        for path in sorted(self.path.glob("*.csv")):
+            if path.name in self._done:
+                continue
+            try:
+                mtime = path.stat().st_mtime_ns
+            except FileNotFoundError:
+                continue  # removed since the listing
+            if self._failed.get(path.name) == mtime:
+                break
+            out.append(path)
+        return out
+
+    def mark_done(self, path: Path) -> None:
+        self._done.add(path.name)
+        self._failed.pop(path.name, None)
+
+    def mark_failed(self, path: Path) -> None:
+        try:
+            self._failed[path.name] = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            pass  # gone: nothing left to retry or to wait for
+
+
+def load_file(path: Path) -> Tuple[CatalogSnapshot, Optional[array]]:
+    """Loads a .skucat file (detected by its magic) or a CSV file."""
+    with open(path, "rb") as f:
+        binary = f.read(len(MAGIC)) == MAGIC
+    return load_binary(path) if binary else load_csv(path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert a CSV price catalog to the binary .skucat format.")
+    parser.add_argument("csv", type=Path)
+    parser.add_argument("out", type=Path)
+    parser.add_argument("--default-stock", type=int, default=0)
+    args = parser.parse_args()
+    count = write_binary(args.out, read_csv(args.csv), args.default_stock)
+    print(f"wrote {count} SKUs to {args.out}")
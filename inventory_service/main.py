@@ -1,22 +1,28 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from typing import List
+from contextlib import asynccontextmanager
+import asyncio
+import hmac
 
-from common.config import get_oop_enabled
-from common.middleware import LoggingMiddleware, install_logging_middleware
-
-app = FastAPI(title="Inventory Service")
-
-# Middleware selection
-if get_oop_enabled(default=True):
-    app.add_middleware(LoggingMiddleware)
-else:
-    install_logging_middleware(app)
+from fastapi import FastAPI, Header, HTTPException
+from pathlib import Path
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
+from common.config import config, get_config_value, get_int_setting, get_oop_enabled
+from common.metrics import install_metrics
+from common.models import DEFAULT_RESPONSE_CLASS, json_body
+from common.middleware import install_timing_middleware
+from common.resilience import install_resilience
+from common.tracing import install_tracing
+from common.profiling import install_profiler
+from common.reloadable import ReloadableApp
+from common.request_log import request_log
+from .catalog import CatalogSnapshot, DeltaDirectory, load_file, read_delta
+from .pricing import PricingEngine, PricingRules
+from .store import InsufficientStock, InventoryStore, UnknownProduct
 
 class Item(BaseModel):
     product_id: str
-    quantity: int
+    quantity: int = Field(gt=0)
 
 
 class InventoryCheckRequest(BaseModel):
@@ -26,20 +32,200 @@ class InventoryCheckRequest(BaseModel):
 class InventoryCheckResponse(BaseModel):
     ok: bool
     total_amount: float
+    # Catalog snapshot the total was priced from; callers key cached quotes on it.
+    catalog_version: Optional[str] = None
+
+
+class InventoryBatchRequest(BaseModel):
+    requests: List[InventoryCheckRequest]
+
+
+class InventoryBatchResponse(BaseModel):
+    results: List[InventoryCheckResponse]
+
+
+class ReserveRequest(BaseModel):
+    items: List[Item]
+    ttl_seconds: Optional[float] = None
+
+
+class ReserveResponse(BaseModel):
+    ok: bool
+    reservation_id: Optional[str] = None
+    total_amount: float = 0.0
+    detail: Optional[str] = None
+
+
+class ReservationResult(BaseModel):
+    ok: bool
+
+
+class CatalogUpsert(BaseModel):
+    product_id: str
+    price: float
+    stock: Optional[int] = None
+
+
+class CatalogDelta(BaseModel):
+    upserts: List[CatalogUpsert] = []
+    removes: List[str] = []
 
 
-# Hard-coded price table
+class CatalogInfo(BaseModel):
+    version: str
+    skus: int
+
+
+# Built-in price table, used when no catalog_path is configured
 PRICES = {
     "p1": 10.0,
     "p2": 20.0,
     "p3": 5.0,
 }
 
+_default_stock = get_int_setting("inventory_default_stock", 1_000_000_000)
+store = InventoryStore(
+    stripes=get_int_setting("inventory_lock_stripes", 64),
+    reservation_ttl=float(get_int_setting("inventory_reservation_ttl_seconds", 30)),
+)
+# Bulk-load the catalog (CSV or binary .skucat) at import, before serving.
+_catalog_path = get_config_value("catalog_path")
+if _catalog_path:
+    store.load(*load_file(config.path.parent / _catalog_path), default_stock=_default_stock)
+else:
+    store.bulk_load((pid, price, _default_stock) for pid, price in PRICES.items())
+
+_delta_dir = get_config_value("catalog_delta_dir")
+# Process-wide, so a lifespan restart does not apply the same files twice.
+catalog_deltas = DeltaDirectory(config.path.parent / _delta_dir) if _delta_dir else None
+
+# Discounts / tiered prices; large carts are priced with NumPy when available.
+_rules_path = get_config_value("pricing_rules_path")
+pricing = PricingEngine(
+    store,
+    rules=PricingRules.load(Path(_rules_path)) if _rules_path else None,
+    vector_threshold=get_int_setting("pricing_vector_threshold", 128),
+)
+
+
+def _price_cart(req: InventoryCheckRequest, catalog: CatalogSnapshot) -> InventoryCheckResponse:
+    ok, total = pricing.price_cart([(item.product_id, item.quantity) for item in req.items], catalog)
+    return InventoryCheckResponse(ok=ok, total_amount=total, catalog_version=catalog.version)
+
+
+def _apply_delta_file(path: Path) -> None:
+    upserts, removes = read_delta(path)
+    catalog = store.apply_delta(upserts, removes, default_stock=_default_stock)
+    request_log.event("Inventory", "catalog delta applied", file=path.name, version=catalog.version,
+                      upserts=len(upserts), removes=len(removes))
+
+
+async def _watch_catalog_deltas(deltas: DeltaDirectory, interval: float) -> None:
+    while True:
+        for path in await asyncio.to_thread(deltas.pending):
+            try:
+                await asyncio.to_thread(_apply_delta_file, path)
+            except Exception as e:
+                deltas.mark_failed(path)
+                request_log.event("Inventory", "catalog delta failed", file=path.name, error=repr(e))
+                break
+            deltas.mark_done(path)
+        await asyncio.sleep(interval)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    watcher = None
+    if catalog_deltas is not None:
+        interval = get_int_setting("catalog_delta_poll_ms", 1000) / 1000.0
+        watcher = asyncio.get_running_loop().create_task(_watch_catalog_deltas(catalog_deltas, interval))
+    yield
+    if watcher is not None:
+        watcher.cancel()
+        try:
+            await watcher
+        except asyncio.CancelledError:
+            pass
+
+
+def create_app(oop_enabled: Optional[bool] = None) -> FastAPI:
+    if oop_enabled is None:
+        oop_enabled = get_oop_enabled(default=True)
+
+    app = FastAPI(title="Inventory Service", lifespan=lifespan, default_response_class=DEFAULT_RESPONSE_CLASS)
+
+    # Middleware selection
+    install_timing_middleware(app, oop_enabled)
+    install_metrics(app)
+    install_resilience(app)
+    install_tracing(app, "inventory_service")
+    install_profiler(app)
+
+    @app.post("/check", response_model=InventoryCheckResponse)
+    def check_inventory(req: InventoryCheckRequest = json_body(InventoryCheckRequest)):
+        return _price_cart(req, store.catalog)
+
+    @app.post("/check/batch", response_model=InventoryBatchResponse)
+    def check_inventory_batch(req: InventoryBatchRequest = json_body(InventoryBatchRequest)):
+        catalog = store.catalog
+        return InventoryBatchResponse(results=[_price_cart(r, catalog) for r in req.requests])
+
+    @app.post("/reserve", response_model=ReserveResponse)
+    def reserve(req: ReserveRequest = json_body(ReserveRequest)):
+        try:
+            rid, total = store.reserve(
+                [(item.product_id, item.quantity) for item in req.items],
+                ttl=req.ttl_seconds,
+            )
+        except UnknownProduct as e:
+            return ReserveResponse(ok=False, detail=f"Unknown product: {e.args[0]}")
+        except InsufficientStock as e:
+            return ReserveResponse(ok=False, detail=str(e))
+        return ReserveResponse(ok=True, reservation_id=rid, total_amount=total)
+
+    @app.post("/reservations/{reservation_id}/commit", response_model=ReservationResult)
+    def commit_reservation(reservation_id: str):
+        if not store.commit(reservation_id):
+            raise HTTPException(status_code=404, detail="Reservation not found or expired")
+        return ReservationResult(ok=True)
+
+    @app.post("/reservations/{reservation_id}/release", response_model=ReservationResult)
+    def release_reservation(reservation_id: str):
+        if not store.release(reservation_id):
+            raise HTTPException(status_code=404, detail="Reservation not found or expired")
+        return ReservationResult(ok=True)
+
+    @app.get("/catalog", response_model=CatalogInfo)
+    def catalog_info():
+        catalog = store.catalog
+        return CatalogInfo(version=catalog.version, skus=len(catalog))
+
+    @app.post("/catalog/delta", response_model=CatalogInfo)
+    def apply_catalog_delta(
+        delta: CatalogDelta = json_body(CatalogDelta),
+        admin_token: Optional[str] = Header(None, alias="X-Admin-Token"),
+    ):
+        # Off unless catalog_delta_token is set; callers send it as X-Admin-Token.
+        token = get_config_value("catalog_delta_token")
+        if not token:
+            raise HTTPException(status_code=404, detail="catalog delta endpoint disabled")
+        if admin_token is None or not hmac.compare_digest(admin_token.encode(), token.encode()):
+            raise HTTPException(status_code=403, detail="invalid admin token")
+        # Applies to this process only; multi-worker deployments should use
+        # catalog_delta_dir so every worker sees the same deltas.
+        catalog = store.apply_delta(
+            ((u.product_id, u.price, u.stock) for u in delta.upserts),
+            delta.removes,
+            default_stock=_default_stock,
+        )
+        return CatalogInfo(version=catalog.version, skus=len(catalog))
+
+    @app.get("/stats")
+    def stats():
+        return store.stats()
+
+    return app
 
-@app.post("/check", response_model=InventoryCheckResponse)
-def check_inventory(req: InventoryCheckRequest):
-    total = 0.0
-    for item in req.items:
-        total += PRICES.get(item.product_id, 0.0) * item.quantity
 
-    return InventoryCheckResponse(ok=True, total_amount=total)
+# Rebuilt in place when oop_enabled changes.
+app = ReloadableApp(create_app)
@@ -0,0 +1,165 @@
+from __future__ import annotations
+import bisect
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .catalog import CatalogSnapshot
+from .store import InventoryStore
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python pricing only
+    np = None
+
+
+class PricingRules:
+    """
+    Per-SKU discounts and quantity tiers.
+
+    File format (JSON):
+        {
+          "discounts": {"p1": 0.10},
+          "tiers": {"p2": [[10, 18.0], [100, 15.0]]}
+        }
+    A discount is a fraction taken off the unit price. A tier [min_qty, price]
+    replaces the base unit price for lines of at least min_qty.
+    """
+
+    def __init__(
+        self,
+        discounts: Optional[Dict[str, float]] = None,
+        tiers: Optional[Dict[str, List[Tuple[int, float]]]] = None,
+    ) -> None:
+        self.discounts = dict(discounts or {})
+        self.tiers: Dict[str, Tuple[List[int], List[float]]] = {}
+        for pid, table in (tiers or {}).items():
+            rows = sorted((int(q), float(p)) for q, p in table)
+            self.tiers[pid] = ([q for q, _ in rows], [p for _, p in rows])
+
+    @classmethod
+    def load(cls, path: Path) -> "PricingRules":
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return cls(discounts=data.get("discounts"), tiers=data.get("tiers"))
+
+    def unit_price(self, product_id: str, base: float, quantity: int) -> float:
+        tier = self.tiers.get(product_id)
+        if tier is not None:
+            i = bisect.bisect_right(tier[0], quantity) - 1
+            if i >= 0:
+                base = tier[1][i]
+        return base * (1.0 - self.discounts.get(product_id, 0.0))
+
+
+class PricingEngine:
+    """
+    Prices carts against an InventoryStore.
+
+    Carts with at least `vector_threshold` lines are priced with NumPy:
+    product ids are resolved to slots in one pass, then prices, discounts and
+    stock are gathered and reduced as arrays. Smaller carts (or installs
+    without NumPy) use a plain Python loop, which is faster at that size.
+    Both paths return the same result.
+    """
+
+    def __init__(
+        self,
+        store: InventoryStore,
+        rules: Optional[PricingRules] = None,
+        vector_threshold: int = 128,
+    ) -> None:
+        self.store = store
+        self.rules = rules or PricingRules()
+        self.vector_threshold = vector_threshold
+        # Per-slot (1 - discount) and "has tiers" columns, built lazily and
+        # rebuilt for each new catalog snapshot.
+        self._rule_cols: Optional[Tuple[str, object, object, Dict[int, str]]] = None
+
+    def price_cart(
+        self, items: Sequence[Tuple[str, int]], catalog: Optional[CatalogSnapshot] = None
+    ) -> Tuple[bool, float]:
+        """
+        Returns (all lines known and in stock, total). Prices come from
+        `catalog` when given (e.g. to report the version used), else from the
+        store's current snapshot.
+        """
+        if np is not None and len(items) >= self.vector_threshold:
+            return self.price_cart_vectorized(items, catalog)
+        return self.price_cart_python(items, catalog)
+
+    def price_cart_python(
+        self, items: Sequence[Tuple[str, int]], catalog: Optional[CatalogSnapshot] = None
+    ) -> Tuple[bool, float]:
+        current, stock = self.store.columns()
+        catalog = catalog or current
+        slots, prices = catalog.slots, catalog.prices
+        rules = self.rules
+        ok = True
+        total = 0.0
+        wanted: Dict[int, int] = {}
+        for product_id, quantity in items:
+            slot = slots.get(product_id)
+            if slot is None:
+                ok = False
+                continue
+            total += rules.unit_price(product_id, prices[slot], quantity) * quantity
+            wanted[slot] = wanted.get(slot, 0) + quantity
+        if ok:
+            ok = all(stock[slot] >= q for slot, q in wanted.items())
+        return ok, total
+
+    def _rule_columns(self, catalog: CatalogSnapshot):
+        cols = self._rule_cols
+        if cols is not None and cols[0] == catalog.version:
+            return cols
+        slots = catalog.slots
+        n_skus = len(catalog.ids)
+        mult = np.ones(n_skus, dtype=np.float64)
+        for pid, d in self.rules.discounts.items():
+            slot = slots.get(pid)
+            if slot is not None:
+                mult[slot] = 1.0 - d
+        tiered_slots = {slots[pid]: pid for pid in self.rules.tiers if pid in slots}
+        tiered = np.zeros(n_skus, dtype=np.bool_)
+        tiered[list(tiered_slots)] = True
+        # One tuple, swapped whole: concurrent callers never mix versions.
+        cols = self._rule_cols = (catalog.version, mult, tiered, tiered_slots)
+        return cols
+
+    def price_cart_vectorized(
+        self, items: Sequence[Tuple[str, int]], catalog: Optional[CatalogSnapshot] = None
+    ) -> Tuple[bool, float]:
+        current, stock = self.store.columns()
+        # An older snapshot is fine: the stock column never shrinks.
+        catalog = catalog or current
+        slots, prices = catalog.slots, catalog.prices
+        # Views over the snapshot's price column and the stock column: no
+        # copy. The store replaces rather than resizes both, so holding
+        # views is safe.
+        price_col = np.frombuffer(prices, dtype=np.float64)
+        stock_col = np.frombuffer(stock, dtype=np.int64)
+        _, multiplier, tiered_mask, tiered_slots = self._rule_columns(catalog)
+
+        get = slots.get
+        idx = np.fromiter((get(pid, -1) for pid, _ in items), dtype=np.int64, count=len(items))
+        qty = np.fromiter((q for _, q in items), dtype=np.int64, count=len(items))
+
+        known = idx >= 0
+        ok = bool(known.all())
+        if not ok:
+            idx = idx[known]
+            qty = qty[known]
+
+        unit = price_col[idx] * multiplier[idx]
+        if tiered_slots:
+            # Tiered SKUs are rare; price just those lines individually.
+            for i in np.flatnonzero(tiered_mask[idx]):
+                slot = int(idx[i])
+                unit[i] = self.rules.unit_price(tiered_slots[slot], prices[slot], int(qty[i]))
+        total = float(np.dot(unit, qty))
+
+        if ok:
+            uniq, inverse = np.unique(idx, return_inverse=True)
+            wanted = np.bincount(inverse, weights=qty, minlength=len(uniq))
+            ok = bool((stock_col[uniq] >= wanted).all())
+        return ok, total
@@ -0,0 +1,253 @@
+from __future__ import annotations
+import heapq
+import threading
+import time
+import uuid
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from common.metrics import metrics
+from .catalog import CatalogSnapshot
+
+metrics.describe("inventory_catalog_swaps_total", "Catalog snapshots published (bulk loads and deltas)")
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id: str, requested: int, available: int) -> None:
+        super().__init__(f"Insufficient stock for {product_id}: requested {requested}, available {available}")
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+
+
+class UnknownProduct(KeyError):
+    pass
+
+
+@dataclass
+class Reservation:
+    reservation_id: str
+    lines: Tuple[Tuple[int, int], ...]  # (slot, quantity)
+    expires_at: float
+
+
+class InventoryStore:
+    """
+    In-process stock and price store sized for millions of SKUs.
+
+    Prices live in an immutable CatalogSnapshot (product id -> slot, price
+    column) that is replaced wholesale on every catalog change, so readers
+    never lock. Available stock lives in a flat array indexed by the same
+    slots; stock updates take only the locks of the stripes their slots fall
+    into, so requests touching different SKUs do not serialize on one lock.
+
+    Reservations hold stock until committed, released, or their TTL passes.
+    """
+
+    def __init__(self, stripes: int = 64, reservation_ttl: float = 30.0) -> None:
+        self.reservation_ttl = reservation_ttl
+        self._catalog = CatalogSnapshot.empty()
+        self._stock = array("q")
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._write_lock = threading.Lock()
+
+        self._reservations: Dict[str, Reservation] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._reservations_lock = threading.Lock()
+        self._published = metrics.counter("inventory_catalog_swaps_total")
+
+    # ---- catalog ----
+    def __len__(self) -> int:
+        return len(self._catalog)
+
+    @property
+    def catalog(self) -> CatalogSnapshot:
+        return self._catalog
+
+    def load(self, snapshot: CatalogSnapshot, stock: Optional[array] = None, default_stock: int = 0) -> None:
+        """
+        Installs a bulk-loaded catalog into an empty store. `stock` is taken
+        over as the stock column; missing (negative) entries get default_stock.
+        """
+        with self._write_lock:
+            if len(self._catalog.ids):
+                raise RuntimeError("catalog already loaded; apply deltas instead")
+            n = len(snapshot.ids)
+            if stock is None:
+                stock = array("q", [default_stock]) * n
+            elif len(stock) != n:
+                raise ValueError(f"stock column has {len(stock)} rows for {n} SKUs")
+            elif min(stock, default=0) < 0:
+                stock = array("q", (default_stock if q < 0 else q for q in stock))
+            self._stock = stock
+            self._catalog = snapshot
+        self._published.inc()
+
+    def apply_delta(
+        self,
+        upserts: Iterable[Tuple[str, float, Optional[int]]],
+        removes: Iterable[str] = (),
+        default_stock: int = 0,
+    ) -> CatalogSnapshot:
+        """
+        Sets prices (and stock, when not None) and removes ids, then swaps in
+        the resulting snapshot. New SKUs start at default_stock. Batch
+        updates: each call copies the price column.
+        """
+        upserts = list(upserts)
+        with self._write_lock:
+            new = self._catalog.with_delta(((pid, price) for pid, price, _ in upserts), removes)
+            self._grow_stock(len(new.ids), default_stock)
+            for product_id, _, qty in upserts:
+                if qty is not None:
+                    slot = new.slots[product_id]
+                    with self._stripe(slot):
+                        self._stock[slot] = qty
+            # Stock rows exist before any reader can see the new slots.
+            self._catalog = new
+        self._published.inc()
+        return new
+
+    def _grow_stock(self, n: int, default_stock: int) -> None:
+        if n <= len(self._stock):
+            return
+        # Copy rather than append: readers may hold buffer views of the old
+        # column (see PricingEngine), and appending to an exported array fails.
+        for lock in self._stripes:
+            lock.acquire()
+        try:
+            grown = array("q")
+            grown.frombytes(memoryview(self._stock).cast("B"))
+            grown += array("q", [default_stock]) * (n - len(grown))
+            self._stock = grown
+        finally:
+            for lock in reversed(self._stripes):
+                lock.release()
+
+    def upsert(self, product_id: str, price: float, stock: int) -> int:
+        return self.apply_delta([(product_id, price, stock)]).slots[product_id]
+
+    def bulk_load(self, rows: Iterable[Tuple[str, float, int]]) -> None:
+        """Appends many new SKUs at once; existing ids are updated in place."""
+        self.apply_delta(rows)
+
+    def columns(self) -> Tuple[CatalogSnapshot, array]:
+        """
+        Exposes (catalog snapshot, stock) for bulk readers such as the pricing
+        engine. The stock column is at least as long as the snapshot's price
+        column. Callers must treat both as read-only.
+        """
+        catalog = self._catalog
+        return catalog, self._stock
+
+    def slot_of(self, product_id: str, catalog: Optional[CatalogSnapshot] = None) -> int:
+        try:
+            return (catalog or self._catalog).slots[product_id]
+        except KeyError:
+            raise UnknownProduct(product_id) from None
+
+    def price(self, product_id: str) -> float:
+        catalog = self._catalog
+        return catalog.prices[self.slot_of(product_id, catalog)]
+
+    def available(self, product_id: str) -> int:
+        return self._stock[self.slot_of(product_id)]
+
+    # ---- stock checks and reservations ----
+    def _stripe(self, slot: int) -> threading.Lock:
+        return self._stripes[slot % len(self._stripes)]
+
+    def _resolve(self, catalog: CatalogSnapshot, items: Sequence[Tuple[str, int]]) -> List[Tuple[int, int]]:
+        """Maps (product_id, quantity) to (slot, quantity), merging repeated ids."""
+        merged: Dict[int, int] = {}
+        for product_id, quantity in items:
+            if quantity <= 0:
+                # A negative line would add stock back when committed.
+                raise ValueError(f"quantity must be positive, got {quantity} for {product_id}")
+            slot = self.slot_of(product_id, catalog)
+            merged[slot] = merged.get(slot, 0) + quantity
+        return list(merged.items())
+
+    def reserve(self, items: Sequence[Tuple[str, int]], ttl: Optional[float] = None) -> Tuple[str, float]:
+        """
+        Atomically takes stock for every line or none of them.
+        Returns (reservation_id, total price).
+        """
+        self.expire_reservations()
+        catalog = self._catalog
+        lines = self._resolve(catalog, items)
+        # Acquire stripe locks in a fixed order so multi-item reservations
+        # cannot deadlock against each other.
+        locks = [self._stripes[i] for i in sorted({slot % len(self._stripes) for slot, _ in lines})]
+        for lock in locks:
+            lock.acquire()
+        try:
+            stock = self._stock
+            for slot, quantity in lines:
+                if stock[slot] < quantity:
+                    raise InsufficientStock(catalog.ids[slot], quantity, stock[slot])
+            for slot, quantity in lines:
+                stock[slot] -= quantity
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+        total = sum(catalog.prices[slot] * quantity for slot, quantity in lines)
+        rid = uuid.uuid4().hex
+        expires_at = time.monotonic() + (self.reservation_ttl if ttl is None else ttl)
+        with self._reservations_lock:
+            self._reservations[rid] = Reservation(rid, tuple(lines), expires_at)
+            heapq.heappush(self._expiry_heap, (expires_at, rid))
+        return rid, total
+
+    def commit(self, reservation_id: str) -> bool:
+        """Makes the reservation permanent: the stock stays taken."""
+        with self._reservations_lock:
+            return self._reservations.pop(reservation_id, None) is not None
+
+    def release(self, reservation_id: str) -> bool:
+        """Returns the reserved stock."""
+        with self._reservations_lock:
+            res = self._reservations.pop(reservation_id, None)
+        if res is None:
+            return False
+        self._restock(res.lines)
+        return True
+
+    def _restock(self, lines: Iterable[Tuple[int, int]]) -> None:
+        for slot, quantity in lines:
+            with self._stripe(slot):
+                self._stock[slot] += quantity
+
+    def expire_reservations(self, now: Optional[float] = None) -> int:
+        now = time.monotonic() if now is None else now
+        heap = self._expiry_heap
+        if not heap or heap[0][0] > now:
+            return 0
+        expired: List[Reservation] = []
+        with self._reservations_lock:
+            while heap and heap[0][0] <= now:
+                _, rid = heapq.heappop(heap)
+                res = self._reservations.pop(rid, None)
+                if res is not None:
+                    expired.append(res)
+        for res in expired:
+            self._restock(res.lines)
+        return len(expired)
+
+    # ---- introspection ----
+    def memory_bytes(self) -> int:
+        """Approximate bytes held by the SKU tables (not reservations)."""
+        return self._catalog.memory_bytes() + len(self._stock) * self._stock.itemsize
+
+    def stats(self) -> Dict[str, object]:
+        skus = len(self)
+        mem = self.memory_bytes()
+        return {
+            "skus": skus,
+            "memory_bytes": mem,
+            "bytes_per_sku": mem / skus if skus else 0.0,
+            "open_reservations": len(self._reservations),
+            "catalog_version": self._catalog.version,
+        }
@@ -0,0 +1,539 @@
+"""
+Linux launcher and supervisor for the five services.
+
+    python -m launcher                         # worker counts from config.txt / CPU count
+    python -m launcher --workers 4 --uds-dir /run/checkout
+    python -m launcher wait --timeout 60       # blocks until the readiness gate opens
+
+Each service runs N uvicorn worker processes: uvloop + httptools when they
+are installed, no reload watcher. Each worker either binds its own
+SO_REUSEPORT socket, so the kernel spreads connections across workers
+(--bind reuseport), or they all accept on one socket bound here
+(--bind shared). With --uds-dir the four internal services also listen on
+a Unix domain socket, and every worker reaches them through it
+(http+unix:// base URLs, see common.http_client), so local hops skip the
+TCP stack. The gateway stays on TCP.
+
+Crashed workers are restarted with exponential backoff. --autoscale adds
+workers to a busy service, and removes them again, based on CPU use.
+The control port serves a readiness gate: GET /ready answers 200 only once
+every worker has finished its lifespan startup and each service has
+answered /healthz. GET /status lists workers, restarts and CPU share.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from common.config import get_bool_setting, get_config_value, get_int_setting
+from common.http_client import unix_socket_url
+from common.request_log import request_log
+
+ROOT = Path(__file__).resolve().parent
+
+# (package, TCP port, share of the CPUs under --workers auto)
+SERVICES = [
+    ("api_gateway", 8000, 2),
+    ("order_service", 8001, 2),
+    ("payment_service", 8002, 1),
+    ("inventory_service", 8003, 1),
+    ("notification_service", 8004, 1),
+]
+
+# Services other services call, and the config key holding their URL.
+INTERNAL_URL_KEYS = {
+    "order_service": "order_service_url",
+    "payment_service": "payment_service_url",
+    "inventory_service": "inventory_service_url",
+    "notification_service": "notification_service_url",
+}
+
+MONITOR_INTERVAL_S = 0.5
+STABLE_UPTIME_S = 30.0
+MAX_BACKOFF_S = 30.0
+SHUTDOWN_GRACE_S = 10.0
+SCALE_UP_CPU = 0.75
+SCALE_DOWN_CPU = 0.25
+
+
+def available_cpus() -> List[int]:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux
+        return list(range(os.cpu_count() or 1))
+
+
+def worker_counts(spec: str, cpus: int) -> Dict[str, int]:
+    """
+    Worker count per service. spec is "auto" (CPUs split by each service's
+    share, at least one each), a number for every service, or overrides
+    like "api_gateway:4,order_service:3" with "auto" for the rest.
+    """
+    total_share = sum(share for _, _, share in SERVICES)
+    counts = {name: max(1, round(cpus * share / total_share)) for name, _, share in SERVICES}
+    spec = spec.strip()
+    if spec in ("", "auto"):
+        return counts
+    if spec.isdigit():
+        return {name: max(1, int(spec)) for name in counts}
+    for part in spec.split(","):
+        name, _, n = part.partition(":")
+        if name.strip() not in counts or not n.strip().isdigit():
+            raise ValueError(f"Bad worker spec {part!r}; expected <service>:<count>")
+        counts[name.strip()] = max(1, int(n))
+    return counts
+
+
+def _cpu_ticks(pid: int) -> int:
+    """utime + stime of a process (Linux /proc only)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return int(fields[11]) + int(fields[12])
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+# ---- Supervisor side ----
+class Worker:
+    """One uvicorn process of a service, with its restart and CPU bookkeeping."""
+
+    __slots__ = (
+        "index", "proc", "ready", "stopping", "started_at", "restart_at",
+        "restarts", "failures", "cpu_ticks", "cpu_share",
+    )
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.proc: Optional[subprocess.Popen] = None
+        self.ready = False
+        self.stopping = False
+        self.started_at = 0.0
+        self.restart_at: Optional[float] = 0.0
+        self.restarts = 0
+        self.failures = 0
+        self.cpu_ticks = 0
+        self.cpu_share = 0.0
+
+
+class ServiceGroup:
+    def __init__(self, name: str, port: int, workers: int, max_workers: int) -> None:
+        self.name = name
+        self.port = port
+        self.min_workers = workers
+        self.max_workers = max(workers, max_workers)
+        self.workers = [Worker(i) for i in range(workers)]
+        self.sockets: List[socket.socket] = []
+        self.uds_path: Optional[Path] = None
+        self._next_index = workers
+
+    def add_worker(self) -> Worker:
+        worker = Worker(self._next_index)
+        self._next_index += 1
+        self.workers.append(worker)
+        return worker
+
+    @property
+    def active(self) -> List[Worker]:
+        return [w for w in self.workers if not w.stopping]
+
+
+class Supervisor:
+    def __init__(
+        self,
+        groups: List[ServiceGroup],
+        host: str,
+        bind: str,
+        uds_dir: Optional[Path],
+        control_port: int,
+        autoscale_interval: float,
+        pin_cpus: bool,
+        log_level: str,
+    ) -> None:
+        self.groups = groups
+        self.host = host
+        self.bind = bind
+        self.uds_dir = uds_dir
+        self.control_port = control_port
+        self.autoscale_interval = autoscale_interval
+        self.pin_cpus = pin_cpus
+        self.log_level = log_level
+        self.warm = False
+        self._cpus = available_cpus()
+        self._next_cpu = 0
+        self._ticks_per_s = os.sysconf("SC_CLK_TCK")
+        self._stop: Optional[asyncio.Event] = None
+        self._env: Dict[str, str] = {}
+
+    # -- sockets --
+    def _bind_sockets(self) -> None:
+        for group in self.groups:
+            if self.bind == "shared":
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind((self.host, group.port))
+                group.sockets.append(sock)
+            if self.uds_dir is not None and group.name in INTERNAL_URL_KEYS:
+                path = self.uds_dir / f"{group.name}.sock"
+                path.unlink(missing_ok=True)
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.bind(str(path))
+                os.chmod(path, 0o660)
+                group.sockets.append(sock)
+                group.uds_path = path
+
+    def _worker_env(self) -> Dict[str, str]:
+        env = dict(os.environ)
+        for group in self.groups:
+            if group.uds_path is not None:
+                url = unix_socket_url(str(group.uds_path))
+                env[INTERNAL_URL_KEYS[group.name].upper()] = url
+                if group.name == "order_service":
+                    # A static replica list would bypass the socket.
+                    env["ORDER_SERVICE_URLS"] = url
+        return env
+
+    # -- workers --
+    def _spawn(self, group: ServiceGroup, worker: Worker) -> None:
+        read_fd, write_fd = os.pipe()
+        fds = [s.fileno() for s in group.sockets]
+        cmd = [
+            sys.executable, "-m", "launcher", "worker",
+            "--service", group.name,
+            "--host", self.host,
+            "--ready-fd", str(write_fd),
+            "--log-level", self.log_level,
+        ]
+        if self.bind == "reuseport":
+            cmd += ["--port", str(group.port)]
+        for fd in fds:
+            cmd += ["--listen-fd", str(fd)]
+        try:
+            # Own session: a terminal Ctrl-C reaches only the supervisor, which stops workers in order.
+            worker.proc = subprocess.Popen(
+                cmd, env=self._env, cwd=ROOT, pass_fds=(write_fd, *fds), start_new_session=True
+            )
+        except OSError:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        worker.ready = False
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        worker.cpu_ticks = 0
+        if self.pin_cpus:
+            os.sched_setaffinity(worker.proc.pid, {self._cpus[self._next_cpu % len(self._cpus)]})
+            self._next_cpu += 1
+        asyncio.get_running_loop().add_reader(read_fd, self._on_ready_pipe, group, worker, read_fd)
+        request_log.event("Launcher", "worker started", service=group.name, worker=worker.index, pid=worker.proc.pid)
+
+    def _on_ready_pipe(self, group: ServiceGroup, worker: Worker, fd: int) -> None:
+        # One byte after lifespan startup; EOF without it means the worker died first.
+        asyncio.get_running_loop().remove_reader(fd)
+        try:
+            data = os.read(fd, 1)
+        finally:
+            os.close(fd)
+        if data:
+            worker.ready = True
+            request_log.event("Launcher", "worker ready", service=group.name, worker=worker.index,
+                              startup_ms=round((time.monotonic() - worker.started_at) * 1000.0, 1))
+
+    def _reap(self, group: ServiceGroup, worker: Worker, now: float) -> None:
+        code = worker.proc.returncode
+        worker.proc = None
+        worker.ready = False
+        if worker.stopping:
+            group.workers.remove(worker)
+            return
+        # Backoff grows with crashes in a row; a worker that ran for a while starts over.
+        worker.failures = 1 if now - worker.started_at > STABLE_UPTIME_S else worker.failures + 1
+        delay = min(MAX_BACKOFF_S, 0.5 * 2 ** (worker.failures - 1)) if worker.failures > 1 else 0.0
+        worker.restart_at = now + delay
+        worker.restarts += 1
+        request_log.event("Launcher", "worker exited", service=group.name, worker=worker.index,
+                          exit_code=code, restart_in_s=delay)
+
+    def _stop_worker(self, worker: Worker) -> None:
+        worker.stopping = True
+        if worker.proc is not None and worker.proc.poll() is None:
+            worker.proc.send_signal(signal.SIGTERM)
+
+    def _monitor(self) -> None:
+        now = time.monotonic()
+        for group in self.groups:
+            for worker in list(group.workers):
+                if worker.proc is not None and worker.proc.poll() is not None:
+                    self._reap(group, worker, now)
+                elif worker.proc is None and worker.stopping:
+                    group.workers.remove(worker)
+                if worker.proc is None and not worker.stopping and worker.restart_at is not None \
+                        and now >= worker.restart_at:
+                    self._spawn(group, worker)
+
+    # -- autoscaling --
+    def _autoscale(self) -> None:
+        for group in self.groups:
+            live = [w for w in group.active if w.proc is not None and w.ready]
+            first_sample = False
+            for w in live:
+                ticks = _cpu_ticks(w.proc.pid)
+                first_sample |= not w.cpu_ticks
+                w.cpu_share = (ticks - w.cpu_ticks) / self._ticks_per_s / self.autoscale_interval if w.cpu_ticks else 0.0
+                w.cpu_ticks = ticks
+            if not live or first_sample or len(live) < len(group.active):
+                continue  # starting, restarting or not sampled yet: no decision on partial data
+            load = sum(w.cpu_share for w in live) / len(live)
+            if load > SCALE_UP_CPU and len(live) < group.max_workers:
+                worker = group.add_worker()
+                self._spawn(group, worker)
+                request_log.event("Launcher", "scaled up", service=group.name, workers=len(group.active),
+                                  cpu=round(load, 2))
+            elif load < SCALE_DOWN_CPU and len(live) > group.min_workers:
+                self._stop_worker(live[-1])
+                request_log.event("Launcher", "scaled down", service=group.name, workers=len(group.active),
+                                  cpu=round(load, 2))
+
+    # -- readiness --
+    def ready(self) -> bool:
+        return self.warm and all(
+            sum(1 for w in g.active if w.ready) >= len(g.active) for g in self.groups
+        )
+
+    async def _warm_up(self) -> None:
+        """Once all workers report ready, hits every service's /healthz until each answers."""
+        limits = httpx.Limits(max_keepalive_connections=0)  # new connection each time: spread over workers
+        async with httpx.AsyncClient(limits=limits, timeout=2.0) as client:
+            for group in self.groups:
+                url = f"http://{self.host}:{group.port}/healthz"
+                for _ in range(len(group.active) * 4):
+                    try:
+                        (await client.get(url)).raise_for_status()
+                    except httpx.HTTPError as e:
+                        request_log.event("Launcher", "warm-up failed", service=group.name, error=repr(e))
+                        return
+        self.warm = True
+        request_log.event("Launcher", "ready", workers={g.name: len(g.active) for g in self.groups})
+
+    def status(self) -> Dict:
+        return {
+            "ready": self.ready(),
+            "services": {
+                g.name: {
+                    "port": g.port,
+                    "uds": str(g.uds_path) if g.uds_path else None,
+                    "workers": [
+                        {
+                            "index": w.index,
+                            "pid": w.proc.pid if w.proc else None,
+                            "ready": w.ready,
+                            "restarts": w.restarts,
+                            "cpu": round(w.cpu_share, 3),
+                        }
+                        for w in g.active
+                    ],
+                }
+                for g in self.groups
+            },
+        }
+
+    async def _control(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Minimal HTTP/1.0 responder for GET /ready and GET /status."""
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            path = request_line[1] if len(request_line) > 1 else ""
+            if path == "/ready":
+                ok = self.ready()
+                status, body = (200 if ok else 503), {"ready": ok}
+            elif path == "/status":
+                status, body = 200, self.status()
+            else:
+                status, body = 404, {"detail": "Not Found"}
+            payload = json.dumps(body).encode("utf-8")
+            reason = {200: "OK", 503: "Service Unavailable", 404: "Not Found"}[status]
+            writer.write(
+                f"HTTP/1.0 {status} {reason}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    # -- main loop --
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stop.set)
+
+        if self.uds_dir is not None:
+            self.uds_dir.mkdir(parents=True, exist_ok=True)
+        self._bind_sockets()
+        self._env = self._worker_env()
+        control = await asyncio.start_server(self._control, "127.0.0.1", self.control_port)
+        try:
+            last_scale = time.monotonic()
+            while not self._stop.is_set():
+                self._monitor()
+                if not self.warm and all(w.ready for g in self.groups for w in g.workers):
+                    await self._warm_up()
+                if self.autoscale_interval > 0 and time.monotonic() - last_scale >= self.autoscale_interval:
+                    self._autoscale()
+                    last_scale = time.monotonic()
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=MONITOR_INTERVAL_S)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            control.close()
+            await self._shutdown()
+
+    async def _shutdown(self) -> None:
+        procs = [w.proc for g in self.groups for w in g.workers if w.proc is not None]
+        for g in self.groups:
+            for w in g.workers:
+                self._stop_worker(w)
+        deadline = time.monotonic() + SHUTDOWN_GRACE_S
+        while any(p.poll() is None for p in procs) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for p in procs:
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+        for g in self.groups:
+            for s in g.sockets:
+                s.close()
+            if g.uds_path is not None:
+                g.uds_path.unlink(missing_ok=True)
+        request_log.event("Launcher", "stopped")
+
+
+# ---- Worker side ----
+def _reuseport_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def _installed(module: str) -> bool:
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+def run_worker(args: argparse.Namespace) -> None:
+    import uvicorn
+
+    sockets = [socket.socket(fileno=fd) for fd in args.listen_fd]
+    if args.port:
+        sockets.append(_reuseport_socket(args.host, args.port))
+    ready_fd = args.ready_fd
+
+    class Server(uvicorn.Server):
+        async def startup(self, sockets=None) -> None:
+            await super().startup(sockets=sockets)
+            if self.started:
+                os.write(ready_fd, b"R")
+                os.close(ready_fd)
+
+    config = uvicorn.Config(
+        f"{args.service}.main:app",
+        loop="uvloop" if _installed("uvloop") else "asyncio",
+        http="httptools" if _installed("httptools") else "h11",
+        lifespan="on",
+        access_log=False,
+        log_level=args.log_level,
+        backlog=get_int_setting("launcher_backlog", 2048),
+    )
+    Server(config).run(sockets=sockets)
+
+
+# ---- Readiness gate client ----
+def wait_ready(url: str, timeout: float) -> bool:
+    """Polls the launcher's /ready until it answers 200 or the timeout passes."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    return False
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    sub = parser.add_subparsers(dest="command")
+
+    wait = sub.add_parser("wait", help="block until the readiness gate opens (exit 1 on timeout)")
+    wait.add_argument("--control-port", type=int, default=get_int_setting("launcher_control_port", 8009))
+    wait.add_argument("--timeout", type=float, default=60.0)
+
+    worker = sub.add_parser("worker", help="internal: one uvicorn worker")
+    worker.add_argument("--service", required=True, choices=[name for name, _, _ in SERVICES])
+    worker.add_argument("--host", default="127.0.0.1")
+    worker.add_argument("--port", type=int, default=0)
+    worker.add_argument("--listen-fd", type=int, action="append", default=[])
+    worker.add_argument("--ready-fd", type=int, required=True)
+    worker.add_argument("--log-level", default="warning")
+
+    parser.add_argument("--workers", default=get_config_value("launcher_workers", "auto"),
+                        help='"auto", a number, or e.g. "api_gateway:4,order_service:3"')
+    parser.add_argument("--max-workers", type=int, default=get_int_setting("launcher_max_workers", 0),
+                        help="autoscaling ceiling per service (0 = CPU count)")
+    parser.add_argument("--autoscale", type=float, default=float(get_int_setting("launcher_autoscale_seconds", 0)),
+                        help="seconds between autoscaling decisions (0 = fixed worker counts)")
+    parser.add_argument("--bind", choices=["reuseport", "shared"], default=get_config_value("launcher_bind", "reuseport"))
+    parser.add_argument("--uds-dir", default=get_config_value("launcher_uds_dir", ""),
+                        help="Unix socket directory for internal hops (empty = TCP)")
+    parser.add_argument("--host", default=get_config_value("launcher_host", "127.0.0.1"))
+    parser.add_argument("--control-port", type=int, default=get_int_setting("launcher_control_port", 8009))
+    parser.add_argument("--pin-cpus", action="store_true", default=get_bool_setting("launcher_pin_cpus", False),
+                        help="pin each worker to one CPU, round-robin")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        run_worker(args)
+        return
+    if args.command == "wait":
+        sys.exit(0 if wait_ready(f"http://127.0.0.1:{args.control_port}/ready", args.timeout) else 1)
+
+    if args.bind == "reuseport" and not hasattr(socket, "SO_REUSEPORT"):
+        parser.error("SO_REUSEPORT is not available on this platform; use --bind shared")
+    cpus = len(available_cpus())
+    counts = worker_counts(args.workers, cpus)
+    groups = [ServiceGroup(name, port, counts[name], args.max_workers or cpus) for name, port, _ in SERVICES]
+    supervisor = Supervisor(
+        groups,
+        host=args.host,
+        bind=args.bind,
+        uds_dir=Path(args.uds_dir) if args.uds_dir else None,
+        control_port=args.control_port,
+        autoscale_interval=args.autoscale,
+        pin_cpus=args.pin_cpus,
+        log_level=args.log_level,
+    )
+    asyncio.run(supervisor.run())
+
+
+if __name__ == "__main__":
+    main()
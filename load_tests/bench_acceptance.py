@@ -0,0 +1,102 @@
+"""
+Benchmark: a flash-sale burst against /checkout, synchronous vs
+asynchronous acceptance.
+
+--burst checkouts are sent at once (at most --concurrency in flight). For
+each mode it reports how fast the gateway answered them (ingress rate,
+p50/p99 time to the response) and, for async, how long the workers took
+to finish all of them (drain) and how many completed.
+
+Run from the project root:
+    python -m load_tests.bench_acceptance --burst 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+import api_gateway.main as gateway
+from api_gateway.acceptance import async_checkouts_from_config
+from common.config import config
+from common.request_log import request_log
+from load_tests.bench_harness import InProcessDeployment, percentile
+from load_tests.payloads import make_checkout_payload
+
+
+async def run_burst(deployment: InProcessDeployment, burst: int, concurrency: int, seed: int) -> Dict[str, float]:
+    client = deployment.client(8000)
+    rng = random.Random(seed)
+    payloads = [make_checkout_payload(rng) for _ in range(burst)]
+    gate = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    order_ids: List[str] = []
+    errors = 0
+
+    async def one(payload) -> None:
+        nonlocal errors
+        async with gate:
+            start = time.perf_counter()
+            try:
+                r = await client.post("/checkout", json=payload)
+            except httpx.HTTPError:
+                errors += 1
+                return
+            if r.status_code >= 400:
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            if r.status_code == 202:
+                order_ids.append(r.json()["order_id"])
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(p) for p in payloads))
+    ingress_s = time.perf_counter() - t0
+
+    completed = len(latencies)
+    if order_ids:
+        async def wait(order_id: str) -> bool:
+            async with gate:
+                while True:
+                    state = (await client.get(f"/checkout/{order_id}", params={"wait": 30})).json()
+                    if state["status"] in ("COMPLETED", "FAILED"):
+                        return state["status"] == "COMPLETED"
+
+        completed = sum(await asyncio.gather(*(wait(i) for i in order_ids)))
+    latencies.sort()
+    return {
+        "ingress_rps": len(latencies) / ingress_s,
+        "p50_ms": percentile(latencies, 0.50),
+        "p99_ms": percentile(latencies, 0.99),
+        "drain_s": time.perf_counter() - t0,
+        "completed": completed,
+        "errors": errors,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    request_log.benchmark_mode = True
+    cols = ["ingress_rps", "p50_ms", "p99_ms", "drain_s", "completed", "errors"]
+    print(f"{'acceptance':<12}" + "".join(f"{c:>14}" for c in cols))
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["CHECKOUT_QUEUE_PATH"] = str(Path(directory) / "checkout_queue.db")
+        for mode in ("sync", "async"):
+            os.environ["CHECKOUT_ACCEPTANCE"] = mode
+            config.reload()
+            gateway.async_checkouts = async_checkouts_from_config()
+            async with InProcessDeployment(oop_enabled=True) as deployment:
+                r = await run_burst(deployment, args.burst, args.concurrency, args.seed)
+            print(f"{mode:<12}" + "".join(f"{r[c]:>14.1f}" for c in cols))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--burst", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+"""
+Benchmark: gateway goodput and p99 as offered load rises past capacity,
+with and without admission control.
+
+For each concurrency level, that many closed-loop clients send checkouts
+to the in-process deployment for --seconds. A client that gets 429/503
+waits for Retry-After (capped at --max-backoff, with jitter) before its
+next request. Reports goodput (successful checkouts/s), p50/p99 of
+successful checkouts, the share rejected on arrival, other errors, and
+the limit the gateway settled on.
+
+Run from the project root:
+    python -m load_tests.bench_admission --levels 8 32 128 512
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import Dict, List
+
+import httpx
+
+import api_gateway.main as gateway
+from api_gateway.admission import admission_from_config
+from common.config import config
+from common.request_log import request_log
+from load_tests.bench_harness import InProcessDeployment, percentile
+from load_tests.payloads import make_checkout_payload
+
+
+async def run_level(deployment: InProcessDeployment, clients: int, seconds: float, max_backoff: float,
+                    seed: int) -> Dict[str, float]:
+    client = deployment.client(8000)
+    latencies: List[float] = []
+    rejected = errors = 0
+    stop_at = time.perf_counter() + seconds
+
+    async def worker(i: int) -> None:
+        nonlocal rejected, errors
+        rng = random.Random(seed + i)
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                r = await client.post("/checkout", json=make_checkout_payload(rng))
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            if r.status_code < 400:
+                latencies.append((time.perf_counter() - start) * 1000.0)
+            elif r.status_code in (429, 503) and "retry-after" in r.headers:
+                rejected += 1
+                await asyncio.sleep(min(max_backoff, float(r.headers["retry-after"])) * rng.uniform(0.5, 1.0))
+            else:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(clients)))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    total = len(latencies) + rejected + errors
+    return {
+        "goodput_rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50),
+        "p99_ms": percentile(latencies, 0.99),
+        "rejected_pct": 100.0 * rejected / total if total else 0.0,
+        "errors": errors,
+        "limit": gateway.admission.limit.limit,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    request_log.benchmark_mode = True
+    cols = ["goodput_rps", "p50_ms", "p99_ms", "rejected_pct", "errors", "limit"]
+    print(f"{'admission':<11}{'clients':>8}" + "".join(f"{c:>14}" for c in cols))
+    for enabled in (False, True):
+        os.environ["GATEWAY_ADMISSION"] = "1" if enabled else "0"
+        config.reload()
+        # A fresh controller per run, so the second run does not start from a learned limit.
+        gateway.admission = admission_from_config()
+        async with InProcessDeployment(oop_enabled=True) as deployment:
+            for clients in args.levels:
+                r = await run_level(deployment, clients, args.seconds, args.max_backoff, args.seed)
+                print(f"{'on' if enabled else 'off':<11}{clients:>8}" + "".join(f"{r[c]:>14.1f}" for c in cols))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--levels", type=int, nargs="+", default=[8, 32, 128, 512])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--max-backoff", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
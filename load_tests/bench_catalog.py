@@ -0,0 +1,104 @@
+"""
+Benchmark: catalog bulk load, lock-free lookups and delta swaps.
+
+Writes a synthetic catalog of --skus SKUs as CSV and as binary .skucat,
+then times:
+
+  load csv / load binary   file -> snapshot + stock column in an InventoryStore
+  lookup                   price lookups against the current snapshot
+  delta                    apply --delta-size price updates (and as many new
+                           SKUs) as one new snapshot, while a reader thread
+                           keeps pricing carts; reports the swap time and the
+                           reader's throughput during the swaps
+
+Run from the project root:
+    python -m load_tests.bench_catalog --skus 2000000
+"""
+import argparse
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from inventory_service.catalog import load_csv, load_binary, write_binary
+from inventory_service.pricing import PricingEngine
+from inventory_service.store import InventoryStore
+
+
+def write_csv(path: Path, n: int) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("product_id,price,stock\n")
+        for i in range(n):
+            f.write(f"sku-{i},{1.0 + (i % 100)},1000000\n")
+
+
+def timed_load(loader, path: Path):
+    start = time.perf_counter()
+    store = InventoryStore()
+    store.load(*loader(path), default_stock=1_000_000)
+    return store, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--skus", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=1_000_000)
+    parser.add_argument("--delta-size", type=int, default=1000)
+    parser.add_argument("--deltas", type=int, default=20)
+    parser.add_argument("--dir", default=None, help="where to write the catalog files (default: system temp)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        csv_path = Path(directory) / "catalog.csv"
+        bin_path = Path(directory) / "catalog.skucat"
+        write_csv(csv_path, args.skus)
+        write_binary(bin_path, ((f"sku-{i}", 1.0 + (i % 100), 1_000_000) for i in range(args.skus)))
+
+        _, csv_s = timed_load(load_csv, csv_path)
+        store, bin_s = timed_load(load_binary, bin_path)
+        print(f"{'skus':>10}{'csv load s':>12}{'binary load s':>15}{'csv MB':>9}{'binary MB':>11}")
+        print(f"{args.skus:>10}{csv_s:>12.2f}{bin_s:>15.2f}"
+              f"{csv_path.stat().st_size / 1e6:>9.1f}{bin_path.stat().st_size / 1e6:>11.1f}")
+
+        ids = [f"sku-{rng.randrange(args.skus)}" for _ in range(args.lookups)]
+        start = time.perf_counter()
+        for pid in ids:
+            store.price(pid)
+        print(f"\nlookups/s: {args.lookups / (time.perf_counter() - start):,.0f}")
+
+        engine = PricingEngine(store)
+        stop = threading.Event()
+        priced = [0]
+
+        def reader() -> None:
+            r = random.Random(args.seed + 1)
+            while not stop.is_set():
+                engine.price_cart([(f"sku-{r.randrange(args.skus)}", 1) for _ in range(3)])
+                priced[0] += 1
+
+        t = threading.Thread(target=reader)
+        t.start()
+        time.sleep(0.2)
+        swaps = []
+        carts0, t0 = priced[0], time.perf_counter()
+        for d in range(args.deltas):
+            upserts = [(f"sku-{rng.randrange(args.skus)}", rng.uniform(1, 100), None) for _ in range(args.delta_size)]
+            upserts += [(f"new-{d}-{i}", 9.99, None) for i in range(args.delta_size)]
+            start = time.perf_counter()
+            store.apply_delta(upserts, default_stock=1_000_000)
+            swaps.append((time.perf_counter() - start) * 1000.0)
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        t.join()
+        swaps.sort()
+        print(f"delta swaps: {args.deltas} x {2 * args.delta_size} rows, "
+              f"median {swaps[len(swaps) // 2]:.1f} ms, max {swaps[-1]:.1f} ms; "
+              f"reader priced {(priced[0] - carts0) / elapsed:,.0f} carts/s meanwhile; "
+              f"version {store.catalog.version}, {len(store)} SKUs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Reproducible OOP-vs-procedural benchmark.
+
+Boots all five services and drives a fixed-seed workload against them,
+once per oop_enabled mode, without restarting anything by hand:
+
+  --transport asgi     every app runs in this process; inter-service calls
+                       go through httpx.ASGITransport (no sockets). CPU per
+                       request covers the whole system.
+  --transport uvicorn  each service runs as a local uvicorn process started
+                       with OOP_ENABLED=0/1; CPU is read from /proc (Linux).
+  --transport launcher the multi-worker Linux launcher (python -m launcher);
+                       the run starts once its readiness gate opens.
+
+Results are written as JSON and printed as a comparison table.
+
+Run from the project root:
+    python -m load_tests.bench_harness --workload checkout --requests 2000
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from contextlib import AsyncExitStack
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from common.http_client import http_clients
+from common.request_log import request_log
+from load_tests.payloads import (
+    make_checkout_payload,
+    make_inventory_payload,
+    make_notification_payload,
+    make_payment_payload,
+)
+
+SERVICES = [
+    ("api_gateway", 8000),
+    ("order_service", 8001),
+    ("payment_service", 8002),
+    ("inventory_service", 8003),
+    ("notification_service", 8004),
+]
+
+# workload -> (port, path, payload builder)
+WORKLOADS: Dict[str, Tuple[int, str, Callable[[random.Random], Dict[str, Any]]]] = {
+    "checkout": (8000, "/checkout", make_checkout_payload),
+    "order": (8001, "/orders", make_checkout_payload),
+    "payment": (8002, "/charge", make_payment_payload),
+    "inventory": (8003, "/check", make_inventory_payload),
+    "notification": (8004, "/order-created", make_notification_payload),
+}
+
+
+def base_url(port: int) -> str:
+    return f"http://localhost:{port}"
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))
+    return sorted_values[i]
+
+
+# ---- Deployments ----
+class InProcessDeployment:
+    """All five apps in this process, wired together with ASGITransport."""
+
+    def __init__(self, oop_enabled: bool) -> None:
+        self.oop_enabled = oop_enabled
+        self._stack = AsyncExitStack()
+
+    async def __aenter__(self) -> "InProcessDeployment":
+        await http_clients.aclose()
+        http_clients.unmount_all()
+        for name, port in SERVICES:
+            module = importlib.import_module(f"{name}.main")
+            app = module.create_app(oop_enabled=self.oop_enabled)
+            await self._stack.enter_async_context(app.router.lifespan_context(app))
+            http_clients.mount(base_url(port), httpx.ASGITransport(app=app))
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._stack.aclose()
+        await http_clients.aclose()
+        http_clients.unmount_all()
+
+    def client(self, port: int) -> httpx.AsyncClient:
+        return http_clients.get(base_url(port))
+
+    def cpu_seconds(self) -> float:
+        return time.process_time()
+
+
+class UvicornDeployment:
+    """One local uvicorn process per service, mode selected via OOP_ENABLED."""
+
+    def __init__(self, oop_enabled: bool) -> None:
+        self.oop_enabled = oop_enabled
+        self._procs: List[subprocess.Popen] = []
+        self._clients: Dict[int, httpx.AsyncClient] = {}
+
+    async def __aenter__(self) -> "UvicornDeployment":
+        env = dict(os.environ, OOP_ENABLED="1" if self.oop_enabled else "0", LOG_BENCHMARK_MODE="1")
+        for name, port in SERVICES:
+            self._procs.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", f"{name}.main:app", "--port", str(port), "--log-level", "warning"],
+                env=env,
+            ))
+        for _, port in SERVICES:
+            await self._wait_ready(port)
+        return self
+
+    async def _wait_ready(self, port: int, timeout: float = 30.0) -> None:
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as probe:
+            while time.monotonic() < deadline:
+                try:
+                    if (await probe.get(f"{base_url(port)}/metrics")).status_code == 200:
+                        return
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError(f"Service on port {port} did not become ready")
+
+    async def __aexit__(self, *exc) -> None:
+        for c in self._clients.values():
+            await c.aclose()
+        for p in self._procs:
+            p.terminate()
+        for p in self._procs:
+            p.wait(timeout=10)
+
+    def client(self, port: int) -> httpx.AsyncClient:
+        if port not in self._clients:
+            self._clients[port] = httpx.AsyncClient(base_url=base_url(port), timeout=30.0)
+        return self._clients[port]
+
+    def cpu_seconds(self) -> float:
+        """utime + stime of all service processes (Linux /proc only)."""
+        ticks = os.sysconf("SC_CLK_TCK")
+        total = 0.0
+        for p in self._procs:
+            with open(f"/proc/{p.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / ticks
+        return total
+
+
+class LauncherDeployment(UvicornDeployment):
+    """All services under `python -m launcher`, N workers each; waits on its readiness gate."""
+
+    def __init__(self, oop_enabled: bool, workers: str = "auto", control_port: int = 8009) -> None:
+        super().__init__(oop_enabled)
+        self.workers = workers
+        self.control_port = control_port
+        self._worker_pids: List[int] = []
+
+    async def __aenter__(self) -> "LauncherDeployment":
+        env = dict(os.environ, OOP_ENABLED="1" if self.oop_enabled else "0", LOG_BENCHMARK_MODE="1")
+        self._procs.append(subprocess.Popen(
+            [sys.executable, "-m", "launcher", "--workers", self.workers, "--control-port", str(self.control_port)],
+            env=env,
+        ))
+        deadline = time.monotonic() + 60.0
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{self.control_port}") as control:
+            while time.monotonic() < deadline:
+                try:
+                    if (await control.get("/ready")).status_code == 200:
+                        status = (await control.get("/status")).json()
+                        self._worker_pids = [
+                            w["pid"] for s in status["services"].values() for w in s["workers"] if w["pid"]
+                        ]
+                        return self
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.25)
+        await self.__aexit__()
+        raise RuntimeError("Launcher did not become ready")
+
+    def cpu_seconds(self) -> float:
+        """utime + stime of the workers that were up when the gate opened."""
+        ticks = os.sysconf("SC_CLK_TCK")
+        total = 0.0
+        for pid in self._worker_pids:
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            total += (int(fields[11]) + int(fields[12])) / ticks
+        return total
+
+
+def create_deployment(transport: str, oop_enabled: bool, workers: str = "auto"):
+    if transport == "asgi":
+        return InProcessDeployment(oop_enabled)
+    if transport == "uvicorn":
+        return UvicornDeployment(oop_enabled)
+    return LauncherDeployment(oop_enabled, workers=workers)
+
+
+# ---- Workload driver ----
+async def drive(deployment, workload: str, requests: int, warmup: int, concurrency: int, seed: int) -> Dict[str, Any]:
+    port, path, builder = WORKLOADS[workload]
+    rng = random.Random(seed)
+    payloads = [builder(rng) for _ in range(warmup + requests)]
+    client = deployment.client(port)
+
+    for p in payloads[:warmup]:
+        await client.post(path, json=p)
+
+    latencies: List[float] = []
+    errors = 0
+    queue = iter(payloads[warmup:])
+
+    async def worker() -> None:
+        nonlocal errors
+        for p in queue:
+            start = time.perf_counter()
+            try:
+                r = await client.post(path, json=p)
+                ok = r.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            if not ok:
+                errors += 1
+
+    cpu0 = deployment.cpu_seconds()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    cpu = deployment.cpu_seconds() - cpu0
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "cpu_ms_per_request": cpu * 1000.0 / requests,
+    }
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    cols = ["throughput_rps", "p50_ms", "p95_ms", "p99_ms", "cpu_ms_per_request"]
+    print(f"{'workload':<14}{'mode':<12}" + "".join(f"{c:>20}" for c in cols))
+    for r in results:
+        print(f"{r['workload']:<14}{r['mode']:<12}" + "".join(f"{r[c]:>20.3f}" for c in cols))
+
+    by_key = {(r["workload"], r["mode"]): r for r in results}
+    for workload in dict.fromkeys(r["workload"] for r in results):
+        oop, proc = by_key.get((workload, "oop")), by_key.get((workload, "procedural"))
+        if oop and proc:
+            deltas = "".join(
+                f"{(oop[c] - proc[c]) / proc[c] * 100.0 if proc[c] else 0.0:>19.1f}%" for c in cols
+            )
+            print(f"{workload:<14}{'oop vs proc':<12}" + deltas)
+
+
+async def main(args: argparse.Namespace) -> None:
+    # Logging I/O would dominate the comparison; keep timings only.
+    request_log.benchmark_mode = True
+    results = []
+    for mode in args.modes:
+        async with create_deployment(args.transport, mode == "oop", args.workers) as deployment:
+            for workload in args.workload:
+                r = await drive(deployment, workload, args.requests, args.warmup, args.concurrency, args.seed)
+                r.update(workload=workload, mode=mode, transport=args.transport)
+                results.append(r)
+
+    report = {
+        "seed": args.seed,
+        "concurrency": args.concurrency,
+        "transport": args.transport,
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print_table(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workload", nargs="+", choices=list(WORKLOADS), default=["checkout"])
+    parser.add_argument("--modes", nargs="+", choices=["oop", "procedural"], default=["oop", "procedural"])
+    parser.add_argument("--transport", choices=["asgi", "uvicorn", "launcher"], default="asgi")
+    parser.add_argument("--workers", default="auto", help="worker spec for --transport launcher")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", default="bench_results.json")
+    asyncio.run(main(parser.parse_args()))
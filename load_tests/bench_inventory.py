@@ -0,0 +1,62 @@
+"""
+Benchmark: InventoryStore reserve/release throughput and memory per SKU.
+
+For each catalog size, random 3-line carts are reserved and released
+again by a pool of threads (lock striping lets carts on different SKUs
+proceed in parallel; the GIL still bounds pure-Python throughput).
+
+Run from the project root:
+    python -m load_tests.bench_inventory --sizes 1000 100000 1000000
+"""
+import argparse
+import random
+import threading
+import time
+
+from inventory_service.store import InventoryStore
+
+
+def build_store(n_skus: int) -> InventoryStore:
+    store = InventoryStore()
+    store.bulk_load((f"sku-{i}", 1.0 + (i % 100), 1_000_000) for i in range(n_skus))
+    return store
+
+
+def run(store: InventoryStore, n_skus: int, ops: int, threads: int, seed: int) -> float:
+    per_thread = ops // threads
+
+    def worker(tid: int) -> None:
+        rng = random.Random(seed + tid)
+        for _ in range(per_thread):
+            cart = [(f"sku-{rng.randrange(n_skus)}", rng.randint(1, 3)) for _ in range(3)]
+            rid, _ = store.reserve(cart)
+            store.release(rid)
+
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--ops", type=int, default=50_000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'skus':>10}{'load s':>9}{'bytes/sku':>11}{'reserve+release/s':>19}")
+    for n in args.sizes:
+        t0 = time.perf_counter()
+        store = build_store(n)
+        load_s = time.perf_counter() - t0
+        rate = run(store, n, args.ops, args.threads, args.seed)
+        print(f"{n:>10}{load_s:>9.2f}{store.stats()['bytes_per_sku']:>11.1f}{rate:>19.0f}")
+
+
+if __name__ == "__main__":
+    main()
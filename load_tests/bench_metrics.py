@@ -0,0 +1,143 @@
+"""
+Metrics check and overhead benchmark.
+
+First checks what the registry records and renders: counter, gauge and
+histogram values (bucket placement, sum, count, quantiles) and the
+Prometheus text exposition. Any mismatch is printed and the exit status is
+non-zero.
+
+Then measures Counter.inc, Histogram.observe and Histogram.observe_since
+through pre-resolved handles (how the services record on the hot path).
+The timings are informational: they are compared with a 1 us budget in the
+output but never fail the run, since they depend on the machine and its load.
+
+Run from the project root:
+    python -m load_tests.bench_metrics
+"""
+import argparse
+import math
+import random
+import sys
+import time
+from typing import List
+
+from common.metrics import Histogram, MetricsRegistry
+
+BUDGET_NS = 1000.0
+
+
+def _expect(failures: List[str], what: str, got, want) -> None:
+    if got != want:
+        failures.append(f"{what}: got {got!r}, want {want!r}")
+
+
+def check_values() -> List[str]:
+    """Deterministic checks of recorded values and rendering; returns the failures."""
+    failures: List[str] = []
+    registry = MetricsRegistry()
+
+    counter = registry.counter("req_total", route="/a", mode="oop")
+    counter.inc()
+    counter.inc(2)
+    _expect(failures, "counter value", counter.value, 3)
+    _expect(failures, "counter handle reused regardless of label order",
+            registry.counter("req_total", mode="oop", route="/a") is counter, True)
+    _expect(failures, "counter with other labels starts at 0", registry.counter("req_total", route="/b").value, 0)
+
+    gauge = registry.gauge("depth")
+    gauge.set(5.0)
+    gauge.inc()
+    gauge.dec(3.5)
+    _expect(failures, "gauge value", gauge.value, 2.5)
+
+    h = Histogram([1.0, 5.0, 10.0])
+    for v in (0.5, 1.0, 1.5, 5.0, 11.0):
+        h.observe(v)
+    # A value equal to a bound belongs to that bucket (le); above the last bound -> +Inf slot.
+    _expect(failures, "histogram bucket counts", h.counts, [2, 2, 0, 1])
+    _expect(failures, "histogram count", h.count, 5)
+    _expect(failures, "histogram sum", h.sum, 19.0)
+    _expect(failures, "histogram p50", h.quantile(0.5), 5.0)
+    _expect(failures, "histogram p40", h.quantile(0.4), 1.0)
+    _expect(failures, "histogram max", h.quantile(1.0), math.inf)
+    _expect(failures, "empty histogram quantile", Histogram([1.0]).quantile(0.99), 0.0)
+
+    registry.describe("req_total", "Requests")
+    lat = registry.histogram("lat_ms", route="/a")
+    for v in (0.5, 1.0, 250.0, 1e6):
+        lat.observe(v)
+    lines = registry.render().splitlines()
+    _expect(failures, "rendered counter and gauge", lines[:6], [
+        "# HELP req_total Requests",
+        "# TYPE req_total counter",
+        'req_total{mode="oop",route="/a"} 3',
+        'req_total{route="/b"} 0',
+        "# TYPE depth gauge",
+        "depth 2.5",
+    ])
+    for line in (
+        "# TYPE lat_ms histogram",
+        'lat_ms_bucket{route="/a",le="0.8"} 1',
+        'lat_ms_bucket{route="/a",le="1.0"} 2',
+        'lat_ms_bucket{route="/a",le="250.0"} 3',
+        'lat_ms_bucket{route="/a",le="100000.0"} 3',
+        'lat_ms_bucket{route="/a",le="+Inf"} 4',
+        'lat_ms_sum{route="/a"} 1000251.5',
+        'lat_ms_count{route="/a"} 4',
+    ):
+        if line not in lines:
+            failures.append(f"rendered histogram: missing {line!r}")
+    buckets = [int(ln.rsplit(" ", 1)[1]) for ln in lines if ln.startswith("lat_ms_bucket")]
+    _expect(failures, "rendered buckets are cumulative", buckets, sorted(buckets))
+    return failures
+
+
+def per_call_ns(fn, args_list, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        for a in args_list:
+            fn(a)
+        best = min(best, (time.perf_counter_ns() - start) / len(args_list))
+    return best
+
+
+def loop_overhead_ns(args_list, repeats: int) -> float:
+    return per_call_ns(lambda a: None, args_list, repeats)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    failures = check_values()
+    for f in failures:
+        print(f"FAIL {f}")
+    print(f"value checks: {'FAILED' if failures else 'ok'}")
+
+    registry = MetricsRegistry()
+    counter = registry.counter("bench_total", route="/checkout", mode="oop")
+    hist = registry.histogram("bench_duration_ms", route="/checkout", mode="oop")
+
+    rng = random.Random(1)
+    values = [rng.lognormvariate(0.0, 1.5) for _ in range(args.events)]
+    starts = [time.perf_counter_ns()] * args.events
+    ones = [1] * args.events
+
+    base = loop_overhead_ns(values, args.repeats)
+    results = {
+        "Counter.inc": per_call_ns(counter.inc, ones, args.repeats) - base,
+        "Histogram.observe": per_call_ns(hist.observe, values, args.repeats) - base,
+        "Histogram.observe_since": per_call_ns(hist.observe_since, starts, args.repeats) - base,
+    }
+
+    for name, ns in results.items():
+        status = "ok" if ns < BUDGET_NS else "over the 1 us budget"
+        print(f"{name:<26}{ns:>8.0f} ns/event  {status}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
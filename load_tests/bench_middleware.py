@@ -0,0 +1,107 @@
+"""
+Microbenchmark: per-request overhead of the request-timing middleware.
+
+Compares the BaseHTTPMiddleware-based variants (LoggingMiddleware and
+@app.middleware("http")) with the pure ASGI ones (TimingMiddleware and
+timing_middleware) under both oop_enabled settings. Requests are driven
+straight into the ASGI app, so no socket or HTTP client cost is included.
+
+Run from the project root:
+    python -m load_tests.bench_middleware --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+
+from common.middleware import (
+    LoggingMiddleware,
+    TimingMiddleware,
+    install_logging_middleware,
+    timing_middleware,
+)
+from common.request_log import request_log
+
+
+def _base_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+def build_app(variant: str) -> FastAPI:
+    app = _base_app()
+    if variant == "oop/base_http":
+        app.add_middleware(LoggingMiddleware)
+    elif variant == "oop/asgi":
+        app.add_middleware(TimingMiddleware)
+    elif variant == "procedural/base_http":
+        install_logging_middleware(app)
+    elif variant == "procedural/asgi":
+        app.add_middleware(timing_middleware)
+    return app
+
+
+VARIANTS = ["none", "oop/base_http", "oop/asgi", "procedural/base_http", "procedural/asgi"]
+
+
+async def drive(app: FastAPI, n: int) -> float:
+    """Returns mean microseconds per request."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/ping",
+        "raw_path": b"/ping",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    # warm-up: the middleware stack is built lazily on the first request
+    for _ in range(200):
+        await app(dict(scope), receive, send)
+
+    start = time.perf_counter_ns()
+    for _ in range(n):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter_ns() - start) / n / 1000.0
+
+
+async def main(n: int, repeats: int) -> None:
+    # Isolate middleware cost from log I/O.
+    request_log.benchmark_mode = True
+
+    results = {}
+    for variant in VARIANTS:
+        app = build_app(variant)
+        results[variant] = min([await drive(app, n) for _ in range(repeats)])
+
+    baseline = results["none"]
+    print(f"{'variant':<24}{'us/request':>12}{'overhead us':>14}")
+    for variant in VARIANTS:
+        us = results[variant]
+        print(f"{variant:<24}{us:>12.2f}{us - baseline:>14.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.repeats))
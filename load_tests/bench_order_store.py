@@ -0,0 +1,93 @@
+"""
+Benchmark: order persistence with and without write-behind batching.
+
+Saves the same orders from concurrent "checkouts" into a fresh SQLite file
+(WAL) through OrderStore, per configuration:
+
+  per-order   save() commits each order before returning (write_behind=0)
+  batched     save() queues; the flusher group-commits up to --batch-size
+              orders per transaction (write_behind=1)
+
+each with synchronous=FULL (fsync per commit) and NORMAL. Reports orders/s,
+save() latency as seen by the checkout, and the number of commits.
+
+Run from the project root:
+    python -m load_tests.bench_order_store --orders 5000 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import uuid
+from typing import Dict, List
+
+from common.models import CreateOrderRequest
+from load_tests.bench_harness import percentile
+from load_tests.payloads import make_checkout_payload
+from order_service.store import OrderStore, SqliteOrderRepository, order_record
+
+
+async def run(orders: List[CreateOrderRequest], concurrency: int, write_behind: bool, synchronous: str,
+              batch_size: int, flush_interval_ms: float, directory: str) -> Dict[str, float]:
+    path = os.path.join(directory, f"orders-{uuid.uuid4().hex}.db")
+    store = OrderStore(
+        SqliteOrderRepository(path, synchronous=synchronous),
+        write_behind=write_behind,
+        batch_size=batch_size,
+        flush_interval_ms=flush_interval_ms,
+    )
+    await store.start()
+    commits0 = store.stats()["commits"]
+    latencies: List[float] = []
+    queue = iter(orders)
+
+    async def checkout() -> None:
+        for req in queue:
+            start = time.perf_counter()
+            await store.save(order_record(str(uuid.uuid4()), req, 10.0))
+            latencies.append((time.perf_counter() - start) * 1000.0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(checkout() for _ in range(concurrency)))
+    accepted = time.perf_counter() - t0
+    await store.flush()
+    durable = time.perf_counter() - t0
+    commits = store.stats()["commits"] - commits0
+    await store.close()
+
+    latencies.sort()
+    return {
+        "accepted_per_s": len(orders) / accepted,
+        "committed_per_s": len(orders) / durable,
+        "p50_ms": percentile(latencies, 0.50),
+        "p99_ms": percentile(latencies, 0.99),
+        "commits": commits,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    orders = [CreateOrderRequest(**make_checkout_payload(rng)) for _ in range(args.orders)]
+    cols = ["accepted_per_s", "committed_per_s", "p50_ms", "p99_ms", "commits"]
+    print(f"{'mode':<12}{'synchronous':<13}" + "".join(f"{c:>17}" for c in cols))
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        for synchronous in args.synchronous:
+            for write_behind in (False, True):
+                r = await run(orders, args.concurrency, write_behind, synchronous,
+                              args.batch_size, args.flush_interval_ms, directory)
+                mode = "batched" if write_behind else "per-order"
+                print(f"{mode:<12}{synchronous:<13}" + "".join(f"{r[c]:>17.2f}" for c in cols))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--flush-interval-ms", type=float, default=5.0)
+    parser.add_argument("--synchronous", nargs="+", choices=["FULL", "NORMAL"], default=["FULL", "NORMAL"])
+    parser.add_argument("--dir", default=None, help="where to create the database files (default: system temp)")
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
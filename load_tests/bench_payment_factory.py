@@ -0,0 +1,93 @@
+"""
+Benchmark: cost of resolving and calling a payment provider.
+
+Compares, per call:
+  - procedural   _PROCEDURAL_DISPATCH.get(method) + call
+  - per-request  a new provider instance every call (the old factory)
+  - flyweight    PaymentProviderFactory.create(method), shared instances
+for the lookup alone and for lookup + charge. Async charges are driven by
+one coroutine so the numbers exclude event-loop scheduling.
+
+Run from the project root:
+    python -m load_tests.bench_payment_factory
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from common.request_log import request_log
+from payment_service.factories import payment_providers
+from payment_service.main import _PROCEDURAL_DISPATCH
+from payment_service.providers import CreditCardProvider, PayPalProvider
+
+_CLASSES = {"credit_card": CreditCardProvider, "paypal": PayPalProvider}
+
+
+def per_request_create(method: str):
+    # What PaymentProviderFactory.create did before it cached instances.
+    cls = _CLASSES.get(method)
+    if cls is None:
+        raise ValueError(f"Unsupported payment method: {method}")
+    return cls()
+
+
+def best_ns(fn, methods, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        for m in methods:
+            fn(m)
+        best = min(best, (time.perf_counter_ns() - start) / len(methods))
+    return best
+
+
+async def best_ns_async(fn, methods, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        for m in methods:
+            await fn(m)
+        best = min(best, (time.perf_counter_ns() - start) / len(methods))
+    return best
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    # Keep the provider's log line from dominating the comparison.
+    request_log.benchmark_mode = True
+    await payment_providers.warm_up()
+    rng = random.Random(args.seed)
+    methods = [rng.choice(["credit_card", "paypal"]) for _ in range(args.calls)]
+
+    async def procedural_charge(m):
+        return await _PROCEDURAL_DISPATCH[m]("u1", 10.0)
+
+    async def per_request_charge(m):
+        return await per_request_create(m).charge("u1", 10.0)
+
+    async def flyweight_charge(m):
+        return await payment_providers.create(m).charge("u1", 10.0)
+
+    rows = [
+        ("procedural", best_ns(_PROCEDURAL_DISPATCH.get, methods, args.repeats),
+         await best_ns_async(procedural_charge, methods, args.repeats)),
+        ("per-request", best_ns(per_request_create, methods, args.repeats),
+         await best_ns_async(per_request_charge, methods, args.repeats)),
+        ("flyweight", best_ns(payment_providers.create, methods, args.repeats),
+         await best_ns_async(flyweight_charge, methods, args.repeats)),
+    ]
+    base_lookup, base_charge = rows[0][1], rows[0][2]
+    print(f"{'variant':<14}{'lookup ns':>12}{'vs proc':>10}{'charge ns':>12}{'vs proc':>10}")
+    for name, lookup, charge in rows:
+        print(f"{name:<14}{lookup:>12.1f}{lookup / base_lookup:>9.2f}x{charge:>12.1f}{charge / base_charge:>9.2f}x")
+    await payment_providers.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
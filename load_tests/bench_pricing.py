@@ -0,0 +1,67 @@
+"""
+Benchmark: pure-Python vs NumPy cart pricing in inventory_service.
+
+Prices random carts of 1..10,000 lines against a 100k-SKU store with a few
+discounts and tiers, through both PricingEngine paths, and checks that the
+two agree.
+
+Run from the project root:
+    python -m load_tests.bench_pricing
+"""
+import argparse
+import math
+import random
+import time
+
+from inventory_service.pricing import PricingEngine, PricingRules, np
+from inventory_service.store import InventoryStore
+
+
+def build_engine(n_skus: int) -> PricingEngine:
+    store = InventoryStore()
+    store.bulk_load((f"sku-{i}", 1.0 + (i % 100), 1_000_000) for i in range(n_skus))
+    rules = PricingRules(
+        discounts={f"sku-{i}": 0.1 for i in range(0, n_skus, 97)},
+        tiers={f"sku-{i}": [(10, 0.5), (100, 0.25)] for i in range(0, n_skus, 1009)},
+    )
+    return PricingEngine(store, rules)
+
+
+def time_call(fn, cart, repeats: int) -> float:
+    """Best-of mean microseconds per call."""
+    best = math.inf
+    for _ in range(3):
+        start = time.perf_counter_ns()
+        for _ in range(repeats):
+            fn(cart)
+        best = min(best, (time.perf_counter_ns() - start) / repeats / 1000.0)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--skus", type=int, default=100_000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 3, 10, 30, 100, 300, 1000, 3000, 10000])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if np is None:
+        raise SystemExit("numpy is not installed; only the Python path is available")
+
+    engine = build_engine(args.skus)
+    rng = random.Random(args.seed)
+    print(f"{'lines':>7}{'python us':>12}{'numpy us':>12}{'speedup':>9}")
+    for size in args.sizes:
+        cart = [(f"sku-{rng.randrange(args.skus)}", rng.randint(1, 150)) for _ in range(size)]
+        ok_py, total_py = engine.price_cart_python(cart)
+        ok_np, total_np = engine.price_cart_vectorized(cart)
+        assert ok_py == ok_np and math.isclose(total_py, total_np, rel_tol=1e-9), (size, total_py, total_np)
+
+        repeats = max(1, 20_000 // size)
+        py_us = time_call(engine.price_cart_python, cart, repeats)
+        np_us = time_call(engine.price_cart_vectorized, cart, repeats)
+        print(f"{size:>7}{py_us:>12.1f}{np_us:>12.1f}{py_us / np_us:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark: per-hop JSON encode/decode cost, stdlib path vs common.models.
+
+For carts of a few lines up to 1,000 lines, times each step a checkout
+body goes through on one gateway -> order_service hop, the way the
+services did it before (json.dumps(model_dump()), json.loads + validation,
+OrderResponse(**json)) and the way they do it now (dumps(), single-pass
+model_validate_json, orjson loads), plus the trusted pass-through, which
+skips the gateway's re-encode and response validation (trusted_internal=1).
+
+Run from the project root:
+    python -m load_tests.bench_serialization
+"""
+import argparse
+import json
+import math
+import random
+import time
+
+from common.models import CreateOrderRequest, OrderItem, OrderResponse, dumps, loads, orjson
+
+
+def time_call(fn, repeats: int) -> float:
+    """Best-of mean microseconds per call."""
+    best = math.inf
+    for _ in range(3):
+        start = time.perf_counter_ns()
+        for _ in range(repeats):
+            fn()
+        best = min(best, (time.perf_counter_ns() - start) / repeats / 1000.0)
+    return best
+
+
+def make_cart(rng: random.Random, lines: int) -> CreateOrderRequest:
+    return CreateOrderRequest(
+        user_id=f"user-{rng.randrange(10_000)}",
+        items=[OrderItem(product_id=f"sku-{rng.randrange(100_000)}", quantity=rng.randint(1, 5)) for _ in range(lines)],
+        payment_method="credit_card",
+    )
+
+
+def steps(req: CreateOrderRequest):
+    """(step, old, new, done_in_trusted_mode) for one cart."""
+    body = json.dumps(req.model_dump()).encode("utf-8")
+    resp = OrderResponse(order_id="order-1", status="completed", total_amount=123.45)
+    resp_body = resp.model_dump_json().encode("utf-8")
+    inventory = {"ok": True, "total_amount": 123.45, "items": [i.model_dump() for i in req.items]}
+    inventory_body = json.dumps(inventory).encode("utf-8")
+    return [
+        ("gateway encode request", lambda: json.dumps(req.model_dump()).encode("utf-8"), lambda: dumps(req), False),
+        ("parse+validate request", lambda: CreateOrderRequest(**json.loads(body)),
+         lambda: CreateOrderRequest.model_validate_json(body), True),
+        ("decode upstream dict", lambda: json.loads(inventory_body), lambda: loads(inventory_body), True),
+        ("render dict response", lambda: json.dumps(inventory).encode("utf-8"), lambda: dumps(inventory), True),
+        ("gateway validate response", lambda: OrderResponse(**json.loads(resp_body)),
+         lambda: OrderResponse.model_validate_json(resp_body), False),
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 3, 10, 100, 1000])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if orjson is None:
+        print("orjson is not installed; 'new' numbers use pydantic-core only")
+
+    rng = random.Random(args.seed)
+    print(f"{'lines':>6}  {'step':<30}{'old us':>10}{'new us':>10}{'speedup':>9}{'trusted us':>12}")
+    for size in args.sizes:
+        req = make_cart(rng, size)
+        assert CreateOrderRequest.model_validate_json(dumps(req)) == req
+        repeats = max(20, 20_000 // size)
+        old_total = new_total = trusted_total = 0.0
+        for name, old, new, in_trusted in steps(req):
+            old_us = time_call(old, repeats)
+            new_us = time_call(new, repeats)
+            trusted_us = new_us if in_trusted else 0.0
+            old_total += old_us
+            new_total += new_us
+            trusted_total += trusted_us
+            print(f"{size:>6}  {name:<30}{old_us:>10.1f}{new_us:>10.1f}{old_us / new_us:>8.1f}x{trusted_us:>12.1f}")
+        print(f"{size:>6}  {'total per hop':<30}{old_total:>10.1f}{new_total:>10.1f}"
+              f"{old_total / new_total:>8.1f}x{trusted_total:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+HDR histogram for load-test latencies.
+
+Values are recorded as integers (microseconds here) into log-linear
+buckets: exact below `sub_buckets`, then every power of two is split into
+sub_buckets / 2 equal steps, so any recorded value is reproduced within
+1 / (sub_buckets / 2) of itself (0.1% with the default 2048) from 1 us up
+to hours, in a few hundred KB at most. Histograms with the same
+sub_buckets merge by adding counts, and serialise to a sparse dict so
+result files of different runs can be compared bucket by bucket.
+"""
+from __future__ import annotations
+from typing import Dict, Iterator, List, Tuple
+
+
+class HdrHistogram:
+    __slots__ = ("sub_buckets", "_half", "_shift", "counts", "count", "total", "min", "max")
+
+    def __init__(self, sub_buckets: int = 2048) -> None:
+        if sub_buckets < 2 or sub_buckets & (sub_buckets - 1):
+            raise ValueError("sub_buckets must be a power of two")
+        self.sub_buckets = sub_buckets
+        self._half = sub_buckets // 2
+        self._shift = sub_buckets.bit_length() - 1  # log2(sub_buckets)
+        self.counts: List[int] = [0] * sub_buckets
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    # -- bucket arithmetic --
+    def _index(self, value: int) -> int:
+        if value < self.sub_buckets:
+            return value
+        exponent = value.bit_length() - self._shift  # >= 1
+        return self.sub_buckets + (exponent - 1) * self._half + ((value >> exponent) - self._half)
+
+    def _value_at(self, index: int) -> int:
+        """Highest value that lands in bucket `index`."""
+        if index < self.sub_buckets:
+            return index
+        exponent, offset = divmod(index - self.sub_buckets, self._half)
+        exponent += 1
+        return ((self._half + offset + 1) << exponent) - 1
+
+    # -- recording --
+    def record(self, value: int, n: int = 1) -> None:
+        value = max(0, int(value))
+        i = self._index(value)
+        counts = self.counts
+        if i >= len(counts):
+            counts.extend([0] * (i + 1 - len(counts)))
+        counts[i] += n
+        if not self.count or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += n
+        self.total += value * n
+
+    def merge(self, other: "HdrHistogram") -> None:
+        if other.sub_buckets != self.sub_buckets:
+            raise ValueError("cannot merge histograms with different precision")
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        if other.count:
+            self.min = other.min if not self.count else min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+
+    # -- reading --
+    def percentile(self, q: float) -> int:
+        """Value at quantile q (0..1): the highest value of the bucket holding that rank."""
+        if not self.count:
+            return 0
+        rank = max(1, round(q * self.count))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(self._value_at(i), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def buckets(self) -> Iterator[Tuple[int, int]]:
+        """(highest value in bucket, count) for non-empty buckets, ascending."""
+        for i, c in enumerate(self.counts):
+            if c:
+                yield self._value_at(i), c
+
+    # -- serialisation --
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "sub_buckets": self.sub_buckets,
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "total": self.total,
+            "counts": {str(i): c for i, c in enumerate(self.counts) if c},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, object]) -> "HdrHistogram":
+        h = cls(int(data["sub_buckets"]))
+        size = max((int(i) for i in data["counts"]), default=-1) + 1
+        if size > len(h.counts):
+            h.counts.extend([0] * (size - len(h.counts)))
+        for i, c in data["counts"].items():
+            h.counts[int(i)] = int(c)
+        h.count, h.min, h.max, h.total = (int(data[k]) for k in ("count", "min", "max", "total"))
+        return h
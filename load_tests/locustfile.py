@@ -1,46 +1,16 @@
+# Closed-loop: each user waits for its answer (plus wait_time) before the
+# next request, so offered load drops when the services slow down. For fixed
+# arrival rates and latency corrected for coordinated omission use
+# load_tests/open_loop.py.
 from locust import HttpUser, task, between, tag
-import random
-import uuid
 
-# --- Helper functions to create payloads ----------------------------------
-
-
-def random_items():
-    product_ids = ["p1", "p2", "p3"]
-    return [
-        {
-            "product_id": random.choice(product_ids),
-            "quantity": random.randint(1, 3),
-        }
-        for _ in range(random.randint(1, 3))
-    ]
-
-
-def make_checkout_payload():
-    return {
-        "user_id": str(uuid.uuid4()),
-        "payment_method": random.choice(["credit_card", "paypal"]),
-        "items": random_items(),
-    }
-
-
-def make_payment_payload():
-    return {
-        "user_id": str(uuid.uuid4()),
-        "amount": random.uniform(5.0, 100.0),
-        "method": random.choice(["credit_card", "paypal"]),
-    }
-
-
-def make_inventory_payload():
-    return {"items": random_items()}
-
-
-def make_notification_payload():
-    return {
-        "order_id": str(uuid.uuid4()),
-        "user_id": str(uuid.uuid4()),
-    }
+# Payload builders live in payloads.py (Locust puts this directory on sys.path)
+from payloads import (
+    make_checkout_payload,
+    make_inventory_payload,
+    make_notification_payload,
+    make_payment_payload,
+)
 
 
 # --- 1. Full system test via API Gateway ----------------------------------
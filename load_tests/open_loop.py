@@ -0,0 +1,272 @@
+"""
+Open-loop load generator, corrected for coordinated omission.
+
+locustfile.py and bench_harness.py are closed-loop: a client sends its
+next request only after the previous answer, so when the services slow
+down the offered load drops with them and the slow period is sampled
+less. Here requests go out on a schedule of intended send times that does
+not wait for answers, and latency is measured from the intended send time:
+a request that could not even be sent on time (generator behind, or
+--max-in-flight reached) is charged for the wait. The uncorrected service
+time (from the actual send) is reported next to it for comparison.
+
+Arrival rate profiles:
+  constant  --rate R
+  step      --rate R, then + --step every --step-seconds
+  ramp      linear from --rate to --to over --duration
+Arrivals are evenly spaced at the current rate, or Poisson (--arrivals
+poisson: exponential gaps at the current rate).
+
+--find-max searches for the highest constant rate the deployment sustains
+within --slo-p99-ms (corrected p99), at most --max-error-pct errors and at
+least 95% of the target rate achieved: the rate grows by 1.5x until a
+trial fails, then is bisected.
+
+Latencies go into HDR histograms (load_tests/hdr.py, microseconds). One
+result file per oop_enabled mode, open_loop_<workload>_<mode>.json in
+--out-dir, with the same layout, so runs and modes can be compared.
+
+Run from the project root:
+    python -m load_tests.open_loop --workload checkout --rate 150 --duration 30
+    python -m load_tests.open_loop --workload checkout --find-max --slo-p99-ms 250
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from common.request_log import request_log
+from load_tests.bench_harness import WORKLOADS, create_deployment
+from load_tests.hdr import HdrHistogram
+
+PROFILES = ("constant", "step", "ramp")
+
+
+# ---- Schedules ----
+def rate_function(args: argparse.Namespace) -> Callable[[float], float]:
+    """Target requests/s at t seconds into the run."""
+    if args.profile == "step":
+        return lambda t: args.rate + args.step * int(t // args.step_seconds)
+    if args.profile == "ramp":
+        to = args.rate if args.to is None else args.to
+        return lambda t: args.rate + (to - args.rate) * min(1.0, t / args.duration)
+    return lambda t: args.rate
+
+
+def send_times(rate: Callable[[float], float], duration: float, poisson: bool, rng: random.Random) -> Iterator[float]:
+    """Intended send offsets (seconds from the start) up to `duration`."""
+    t = 0.0
+    while True:
+        r = rate(t)
+        if r <= 0:
+            t += 0.01  # nothing to send at this rate; look again shortly
+        else:
+            t += rng.expovariate(r) if poisson else 1.0 / r
+        if t >= duration:
+            return
+        yield t
+
+
+# ---- Driver ----
+async def run_schedule(deployment, workload: str, schedule: Iterator[float], duration: float, warmup: float,
+                       max_in_flight: int, seed: int) -> Dict[str, Any]:
+    """
+    Sends one request per intended time in `schedule`. Requests intended
+    before `warmup` seconds are sent but not recorded.
+    """
+    port, path, builder = WORKLOADS[workload]
+    client = deployment.client(port)
+    rng = random.Random(seed)
+    corrected = HdrHistogram()
+    service = HdrHistogram()
+    send_lag = HdrHistogram()  # how late the generator itself sent
+    gate = asyncio.Semaphore(max_in_flight)
+    pending: set = set()
+    counts = {"sent": 0, "ok": 0, "errors": 0}
+    last_done = [0.0]
+
+    async def send(intended: float, payload: Dict[str, Any], record: bool) -> None:
+        async with gate:
+            sent = time.perf_counter()
+            try:
+                ok = (await client.post(path, json=payload)).status_code < 400
+            except httpx.HTTPError:
+                ok = False
+        done = time.perf_counter()
+        if not record:
+            return
+        last_done[0] = done
+        counts["ok" if ok else "errors"] += 1
+        if ok:
+            corrected.record(int((done - intended) * 1e6))
+            service.record(int((done - sent) * 1e6))
+        send_lag.record(int((sent - intended) * 1e6))
+
+    start = time.perf_counter()
+    measure_from = start + warmup
+    for offset in schedule:
+        intended = start + offset
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        record = intended >= measure_from
+        counts["sent"] += record
+        task = asyncio.get_running_loop().create_task(send(intended, builder(rng), record))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    await asyncio.gather(*pending)
+
+    measured = counts["ok"] + counts["errors"]
+    window = max(duration - warmup, 1e-9)
+    elapsed = max(last_done[0] - measure_from, window)
+    return {
+        "target_rps": counts["sent"] / window,
+        "achieved_rps": counts["ok"] / elapsed,
+        "requests": measured,
+        "errors": counts["errors"],
+        "error_pct": 100.0 * counts["errors"] / measured if measured else 0.0,
+        **{f"p{q}_ms": corrected.percentile(v) / 1000.0 for q, v in (("50", 0.50), ("90", 0.90), ("99", 0.99),
+                                                                     ("99.9", 0.999))},
+        "max_ms": corrected.max / 1000.0,
+        "service_p99_ms": service.percentile(0.99) / 1000.0,
+        "send_lag_p99_ms": send_lag.percentile(0.99) / 1000.0,
+        "histogram_us": corrected.to_dict(),
+        "service_histogram_us": service.to_dict(),
+    }
+
+
+def sustained(r: Dict[str, Any], args: argparse.Namespace) -> bool:
+    return (
+        r["p99_ms"] <= args.slo_p99_ms
+        and r["error_pct"] <= args.max_error_pct
+        and r["achieved_rps"] >= 0.95 * r["target_rps"]
+    )
+
+
+async def find_max(deployment, args: argparse.Namespace, trials: List[Dict[str, Any]]) -> float:
+    """Highest constant rate that met the SLO; every trial is appended to `trials`."""
+
+    async def trial(rate: float) -> bool:
+        schedule = send_times(lambda t: rate, args.trial_seconds, args.arrivals == "poisson",
+                              random.Random(args.seed))
+        r = await run_schedule(deployment, args.workload, schedule, args.trial_seconds, args.warmup,
+                               args.max_in_flight, args.seed)
+        r["ok"] = sustained(r, args)
+        trials.append(r)
+        print(f"  {rate:>9.1f} rps  achieved {r['achieved_rps']:>8.1f}  p99 {r['p99_ms']:>9.1f} ms  "
+              f"errors {r['error_pct']:>5.1f}%  {'ok' if r['ok'] else 'over SLO'}", flush=True)
+        return r["ok"]
+
+    passed, failed = 0.0, None
+    rate = args.rate
+    while failed is None and rate <= args.max_rate:
+        if await trial(rate):
+            passed, rate = rate, rate * 1.5
+        else:
+            failed = rate
+    if failed is None:
+        return passed
+    while failed - passed > max(1.0, passed * args.precision):
+        mid = (passed + failed) / 2.0
+        if await trial(mid):
+            passed = mid
+        else:
+            failed = mid
+    return passed
+
+
+# ---- Reporting ----
+COLUMNS: List[Tuple[str, str]] = [
+    ("target_rps", "target rps"), ("achieved_rps", "achieved"), ("p50_ms", "p50 ms"), ("p99_ms", "p99 ms"),
+    ("p99.9_ms", "p99.9 ms"), ("service_p99_ms", "svc p99 ms"), ("error_pct", "errors %"),
+]
+
+
+def print_table(reports: List[Dict[str, Any]]) -> None:
+    print(f"{'mode':<12}" + "".join(f"{label:>13}" for _, label in COLUMNS) + f"{'max @ SLO':>13}")
+    for rep in reports:
+        r = rep["runs"][-1] if rep["max_sustainable_rps"] is None else rep["best_run"]
+        best = rep["max_sustainable_rps"]
+        print(f"{rep['mode']:<12}" + "".join(f"{r[k]:>13.1f}" for k, _ in COLUMNS)
+              + (f"{best:>13.1f}" if best is not None else f"{'-':>13}"))
+    # Corrected vs uncorrected is the point of the exercise; make the gap visible.
+    for rep in reports:
+        r = rep["runs"][-1] if rep["max_sustainable_rps"] is None else rep["best_run"]
+        if r["service_p99_ms"] and r["p99_ms"] > 1.5 * r["service_p99_ms"]:
+            print(f"{rep['mode']}: corrected p99 is {r['p99_ms'] / r['service_p99_ms']:.1f}x the service-time p99 "
+                  "(requests waited to be sent)")
+
+
+async def main(args: argparse.Namespace) -> None:
+    request_log.benchmark_mode = True
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    reports = []
+    for mode in args.modes:
+        runs: List[Dict[str, Any]] = []
+        best: Optional[float] = None
+        async with create_deployment(args.transport, mode == "oop", args.workers) as deployment:
+            if args.find_max:
+                print(f"{mode}: searching for the max rate with p99 <= {args.slo_p99_ms} ms", flush=True)
+                best = await find_max(deployment, args, runs)
+            else:
+                schedule = send_times(rate_function(args), args.duration, args.arrivals == "poisson",
+                                      random.Random(args.seed))
+                runs.append(await run_schedule(deployment, args.workload, schedule, args.duration, args.warmup,
+                                               args.max_in_flight, args.seed))
+        report = {
+            "workload": args.workload,
+            "mode": mode,
+            "transport": args.transport,
+            "profile": args.profile if not args.find_max else "find_max",
+            "arrivals": args.arrivals,
+            "rate": args.rate,
+            "duration_s": args.duration if not args.find_max else args.trial_seconds,
+            "warmup_s": args.warmup,
+            "max_in_flight": args.max_in_flight,
+            "slo_p99_ms": args.slo_p99_ms,
+            "seed": args.seed,
+            "python": sys.version.split()[0],
+            "max_sustainable_rps": best,
+            "best_run": max((r for r in runs if r.get("ok")), key=lambda r: r["target_rps"], default=None),
+            "runs": runs,
+        }
+        if args.find_max and report["best_run"] is None:
+            report["best_run"] = runs[0]
+        path = out_dir / f"open_loop_{args.workload}_{mode}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+        reports.append(report)
+    print_table(reports)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workload", choices=list(WORKLOADS), default="checkout")
+    parser.add_argument("--modes", nargs="+", choices=["oop", "procedural"], default=["oop", "procedural"])
+    parser.add_argument("--transport", choices=["asgi", "uvicorn", "launcher"], default="asgi")
+    parser.add_argument("--workers", default="auto", help="worker spec for --transport launcher")
+    parser.add_argument("--profile", choices=PROFILES, default="constant")
+    parser.add_argument("--arrivals", choices=["uniform", "poisson"], default="poisson")
+    parser.add_argument("--rate", type=float, default=50.0, help="requests/s (start rate for step, ramp, find-max)")
+    parser.add_argument("--to", type=float, default=None, help="ramp: final rate")
+    parser.add_argument("--step", type=float, default=25.0, help="step: rate added every --step-seconds")
+    parser.add_argument("--step-seconds", type=float, default=10.0)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds sent but not recorded")
+    parser.add_argument("--max-in-flight", type=int, default=200)
+    parser.add_argument("--find-max", action="store_true")
+    parser.add_argument("--slo-p99-ms", type=float, default=250.0)
+    parser.add_argument("--max-error-pct", type=float, default=1.0)
+    parser.add_argument("--trial-seconds", type=float, default=10.0)
+    parser.add_argument("--max-rate", type=float, default=100_000.0)
+    parser.add_argument("--precision", type=float, default=0.05, help="find-max stops within this fraction")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out-dir", default="open_loop_results")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,54 @@
+"""
+Request payload builders shared by the Locust file and the benchmark tools.
+
+Each builder takes an optional random.Random so workloads can be replayed
+from a fixed seed; by default they use the module-level generator.
+"""
+import random
+import uuid
+
+PRODUCT_IDS = ["p1", "p2", "p3"]
+PAYMENT_METHODS = ["credit_card", "paypal"]
+
+
+def _uuid(rng) -> str:
+    if rng is random:
+        return str(uuid.uuid4())
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def random_items(rng=random):
+    return [
+        {
+            "product_id": rng.choice(PRODUCT_IDS),
+            "quantity": rng.randint(1, 3),
+        }
+        for _ in range(rng.randint(1, 3))
+    ]
+
+
+def make_checkout_payload(rng=random):
+    return {
+        "user_id": _uuid(rng),
+        "payment_method": rng.choice(PAYMENT_METHODS),
+        "items": random_items(rng),
+    }
+
+
+def make_payment_payload(rng=random):
+    return {
+        "user_id": _uuid(rng),
+        "amount": rng.uniform(5.0, 100.0),
+        "method": rng.choice(PAYMENT_METHODS),
+    }
+
+
+def make_inventory_payload(rng=random):
+    return {"items": random_items(rng)}
+
+
+def make_notification_payload(rng=random):
+    return {
+        "order_id": _uuid(rng),
+        "user_id": _uuid(rng),
+    }
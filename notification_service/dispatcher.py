@@ -0,0 +1,379 @@
+from __future__ import annotations
+import asyncio
+import smtplib
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from common.config import config, get_config_value, get_int_setting
+from common.http_client import get_client
+from common.metrics import metrics
+from common.models import dumps
+from common.request_log import request_log
+
+metrics.describe("notification_queue_depth", "Order events buffered in the dispatcher, not yet flushed")
+metrics.describe("notification_flush_size", "Notifications per flush")
+metrics.describe("notification_events_total", "Ingested order events by result (accepted, duplicate, dropped)")
+metrics.describe("notification_sent_total", "Notifications a sink delivered, per sink and kind")
+metrics.describe("notification_sink_failures_total", "Sends a sink failed (each retry counts again)")
+metrics.describe("notification_sink_retrying", "Notifications waiting to be retried on a sink that failed")
+
+ORDER_CREATED = "order_created"
+DIGEST = "digest"
+
+
+@dataclass(frozen=True)
+class Notification:
+    user_id: str
+    order_ids: Tuple[str, ...]
+    created_at: float
+
+    @property
+    def kind(self) -> str:
+        return ORDER_CREATED if len(self.order_ids) == 1 else DIGEST
+
+    def as_dict(self) -> Dict:
+        return {"kind": self.kind, "user_id": self.user_id, "order_ids": list(self.order_ids),
+                "created_at": self.created_at}
+
+
+# ---- Sinks ----
+class NotificationSink(ABC):
+    name = "sink"
+
+    @abstractmethod
+    async def send(self, notifications: List[Notification]) -> None: ...
+
+    async def close(self) -> None:
+        pass
+
+
+class LogSink(NotificationSink):
+    """Writes each notification to the request log (the previous behaviour)."""
+
+    name = "log"
+
+    async def send(self, notifications: List[Notification]) -> None:
+        for n in notifications:
+            request_log.event("Notification", n.kind, user_id=n.user_id, order_ids=list(n.order_ids))
+
+
+class FileSink(NotificationSink):
+    """Appends JSON lines to a file; the write runs off the event loop."""
+
+    name = "file"
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self._file = None
+
+    def _write(self, data: bytes) -> None:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "ab")
+        self._file.write(data)
+        self._file.flush()
+
+    async def send(self, notifications: List[Notification]) -> None:
+        data = b"".join(dumps(n.as_dict()) + b"\n" for n in notifications)
+        await asyncio.to_thread(self._write, data)
+
+    async def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SmtpSink(NotificationSink):
+    """
+    Sends one email per notification over one SMTP session per flush, e.g.
+    to a local stand-in such as `python -m aiosmtpd -n -l 127.0.0.1:1025`.
+    """
+
+    name = "smtp"
+
+    def __init__(self, host: str, port: int, sender: str, domain: str) -> None:
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.domain = domain
+
+    def _message(self, n: Notification) -> EmailMessage:
+        msg = EmailMessage()
+        msg["From"] = self.sender
+        msg["To"] = f"{n.user_id}@{self.domain}"
+        if n.kind == DIGEST:
+            msg["Subject"] = f"{len(n.order_ids)} new orders"
+            msg.set_content("Your orders:\n" + "\n".join(f"- {oid}" for oid in n.order_ids))
+        else:
+            msg["Subject"] = f"Order {n.order_ids[0]} confirmed"
+            msg.set_content(f"Your order {n.order_ids[0]} has been placed.")
+        return msg
+
+    def _send(self, notifications: List[Notification]) -> None:
+        with smtplib.SMTP(self.host, self.port, timeout=config.current.http_timeout_seconds) as smtp:
+            for n in notifications:
+                smtp.send_message(self._message(n))
+
+    async def send(self, notifications: List[Notification]) -> None:
+        await asyncio.to_thread(self._send, notifications)
+
+
+class WebhookSink(NotificationSink):
+    """POSTs each flush as one {"notifications": [...]} body through the pooled client."""
+
+    name = "webhook"
+
+    def __init__(self, url: str) -> None:
+        parts = urlsplit(url)
+        self.base_url = f"{parts.scheme}://{parts.netloc}"
+        self.path = parts.path or "/"
+
+    async def send(self, notifications: List[Notification]) -> None:
+        resp = await get_client(self.base_url).post(
+            self.path,
+            json={"notifications": [n.as_dict() for n in notifications]},
+            timeout=config.current.http_timeout_seconds,
+        )
+        resp.raise_for_status()
+
+
+SINKS: Dict[str, Callable[[], NotificationSink]] = {
+    "log": LogSink,
+    "file": lambda: FileSink(str(config.path.parent / get_config_value("notification_file_path", "data/notifications.jsonl"))),
+    "smtp": lambda: SmtpSink(
+        host=get_config_value("notification_smtp_host", "127.0.0.1"),
+        port=get_int_setting("notification_smtp_port", 1025),
+        sender=get_config_value("notification_smtp_sender", "orders@example.test"),
+        domain=get_config_value("notification_smtp_domain", "example.test"),
+    ),
+    "webhook": lambda: WebhookSink(get_config_value("notification_webhook_url", "http://localhost:8090/hooks/notifications")),
+}
+
+
+def sinks_from_config() -> List[NotificationSink]:
+    names = [n.strip() for n in (get_config_value("notification_sinks", "log") or "").split(",") if n.strip()]
+    unknown = [n for n in names if n not in SINKS]
+    if unknown:
+        raise ValueError(f"Unknown notification sinks: {', '.join(unknown)}; known: {', '.join(SINKS)}")
+    return [SINKS[n]() for n in names]
+
+
+# ---- Dispatcher ----
+@dataclass
+class _UserBuffer:
+    first_at: float
+    order_ids: List[str] = field(default_factory=list)
+
+
+class NotificationDispatcher:
+    """
+    Buffers ingested order events and flushes them to the sinks.
+
+    - dedupe: an order_id seen within the last `dedupe_window` order ids is
+      dropped (at-least-once senders may retry a batch);
+    - coalescing: events of one user are held for `coalesce_window_ms` from
+      that user's first buffered event; two or more become one digest;
+    - flushing: every `flush_interval_ms`, users whose window has passed are
+      sent in chunks of `batch_size` notifications; once `batch_size` events
+      are buffered the flush starts immediately, oldest users first;
+    - bounded: beyond `max_buffered` events, new ones are dropped and counted;
+    - retries: a chunk a sink failed to take is retried on that sink alone
+      (the others already have it) with exponential backoff, up to
+      `sink_max_attempts` sends, then dropped and logged.
+
+    submit() never waits on a sink.
+    """
+
+    def __init__(
+        self,
+        sinks: List[NotificationSink],
+        batch_size: int = 256,
+        flush_interval_ms: float = 50.0,
+        coalesce_window_ms: float = 200.0,
+        dedupe_window: int = 100_000,
+        max_buffered: int = 100_000,
+        sink_max_attempts: int = 5,
+        sink_retry_base_ms: float = 200.0,
+    ) -> None:
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.flush_interval_ms = flush_interval_ms
+        self.coalesce_window_ms = coalesce_window_ms
+        self.dedupe_window = dedupe_window
+        self.max_buffered = max_buffered
+        self.sink_max_attempts = sink_max_attempts
+        self.sink_retry_base_ms = sink_retry_base_ms
+        # (not before, sink, chunk, attempts so far) for chunks a sink failed
+        self._retries: List[Tuple[float, NotificationSink, List[Notification], int]] = []
+        self._retrying = 0
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._users: "OrderedDict[str, _UserBuffer]" = OrderedDict()
+        self._buffered = 0
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self._depth = metrics.gauge("notification_queue_depth")
+        self._flush_size = metrics.histogram("notification_flush_size")
+        self._accepted = metrics.counter("notification_events_total", result="accepted")
+        self._duplicates = metrics.counter("notification_events_total", result="duplicate")
+        self._dropped = metrics.counter("notification_events_total", result="dropped")
+        self._sent = {
+            (s.name, kind): metrics.counter("notification_sent_total", sink=s.name, kind=kind)
+            for s in sinks for kind in (ORDER_CREATED, DIGEST)
+        }
+        self._sink_failures = {s.name: metrics.counter("notification_sink_failures_total", sink=s.name) for s in sinks}
+        self._retrying_gauge = metrics.gauge("notification_sink_retrying")
+
+    # -- lifecycle --
+    async def start(self) -> None:
+        if self._task is None:
+            self._full = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        """Flushes everything buffered, ignoring coalescing windows, then closes the sinks."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush(force=True)
+        for sink in self.sinks:
+            await sink.close()
+
+    # -- ingestion --
+    def submit(self, events: Iterable[Tuple[str, str]]) -> Dict[str, int]:
+        """Buffers (order_id, user_id) pairs; returns accepted/duplicate/dropped counts."""
+        accepted = duplicates = dropped = 0
+        now = time.monotonic()
+        for order_id, user_id in events:
+            if order_id in self._seen:
+                self._seen.move_to_end(order_id)
+                duplicates += 1
+                continue
+            if self._buffered >= self.max_buffered:
+                dropped += 1
+                continue
+            self._seen[order_id] = None
+            if len(self._seen) > self.dedupe_window:
+                self._seen.popitem(last=False)
+            buf = self._users.get(user_id)
+            if buf is None:
+                buf = self._users[user_id] = _UserBuffer(now)
+            buf.order_ids.append(order_id)
+            self._buffered += 1
+            accepted += 1
+
+        self._accepted.inc(accepted)
+        self._duplicates.inc(duplicates)
+        self._dropped.inc(dropped)
+        self._depth.set(self._buffered)
+        if self._buffered >= self.batch_size and self._full is not None:
+            self._full.set()
+        if self._task is None:
+            # Not started (e.g. app used without its lifespan): deliver right away.
+            asyncio.ensure_future(self.flush(force=True))
+        return {"accepted": accepted, "duplicates": duplicates, "dropped": dropped}
+
+    # -- flushing --
+    def _take_due(self, force: bool) -> List[Notification]:
+        cutoff = time.monotonic() - self.coalesce_window_ms / 1000.0
+        now = time.time()
+        due: List[Notification] = []
+        # Users are in first-event order, so the ones due form a prefix.
+        while self._users:
+            user_id, buf = next(iter(self._users.items()))
+            if not (force or buf.first_at <= cutoff or self._buffered >= self.batch_size):
+                break
+            del self._users[user_id]
+            self._buffered -= len(buf.order_ids)
+            due.append(Notification(user_id, tuple(buf.order_ids), now))
+        self._depth.set(self._buffered)
+        return due
+
+    async def _deliver(self, sink: NotificationSink, batch: List[Notification], attempts: int) -> None:
+        try:
+            await sink.send(batch)
+        except Exception as e:
+            attempts += 1
+            self._sink_failures[sink.name].inc()
+            retry = attempts < self.sink_max_attempts and self._retrying + len(batch) <= self.max_buffered
+            if retry:
+                delay = self.sink_retry_base_ms / 1000.0 * 2 ** (attempts - 1)
+                self._retries.append((time.monotonic() + delay, sink, batch, attempts))
+                self._retrying += len(batch)
+                self._retrying_gauge.inc(len(batch))
+            request_log.event("Notification", "sink failed", sink=sink.name, notifications=len(batch),
+                              attempts=attempts, retrying=retry, error=repr(e))
+            return
+        for n in batch:
+            self._sent[sink.name, n.kind].inc()
+
+    async def _send(self, batch: List[Notification]) -> None:
+        await asyncio.gather(*(self._deliver(sink, batch, 0) for sink in self.sinks))
+        self._flush_size.observe(len(batch))
+
+    async def _retry_due(self, force: bool) -> None:
+        now = time.monotonic()
+        due = [r for r in self._retries if force or r[0] <= now]
+        if not due:
+            return
+        self._retries = [r for r in self._retries if not (force or r[0] <= now)]
+        for _, _, batch, _ in due:
+            self._retrying -= len(batch)
+            self._retrying_gauge.dec(len(batch))
+        await asyncio.gather(*(self._deliver(sink, batch, attempts) for _, sink, batch, attempts in due))
+
+    async def flush(self, force: bool = False) -> int:
+        """Sends what is due (everything with force=True); returns the number of notifications."""
+        await self._retry_due(force)
+        due = self._take_due(force)
+        for i in range(0, len(due), self.batch_size):
+            await self._send(due[i:i + self.batch_size])
+        return len(due)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval_ms / 1000.0)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                request_log.event("Notification", "flush failed", error=repr(e))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "buffered": self._buffered,
+            "users_buffered": len(self._users),
+            "dedupe_entries": len(self._seen),
+            "accepted": self._accepted.value,
+            "duplicates": self._duplicates.value,
+            "dropped": self._dropped.value,
+            "flushes": self._flush_size.count,
+            "retrying": self._retrying,
+            **{f"sent_{sink}_{kind}": c.value for (sink, kind), c in self._sent.items()},
+        }
+
+
+def dispatcher_from_config() -> NotificationDispatcher:
+    return NotificationDispatcher(
+        sinks_from_config(),
+        batch_size=get_int_setting("notification_batch_size", 256),
+        flush_interval_ms=float(get_int_setting("notification_flush_interval_ms", 50)),
+        coalesce_window_ms=float(get_int_setting("notification_coalesce_window_ms", 200)),
+        dedupe_window=get_int_setting("notification_dedupe_window", 100_000),
+        max_buffered=get_int_setting("notification_max_buffered", 100_000),
+        sink_max_attempts=get_int_setting("notification_sink_max_attempts", 5),
+        sink_retry_base_ms=float(get_int_setting("notification_sink_retry_base_ms", 200)),
+    )
@@ -1,16 +1,19 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
+from typing import Any, List, Optional
 
 from common.config import get_oop_enabled
-from common.middleware import LoggingMiddleware, install_logging_middleware
-
-app = FastAPI(title="Notification Service")
-
-# Middleware selection
-if get_oop_enabled(default=True):
-    app.add_middleware(LoggingMiddleware)
-else:
-    install_logging_middleware(app)
+from common.http_client import close_http_clients
+from common.metrics import install_metrics
+from common.models import DEFAULT_RESPONSE_CLASS, json_body
+from common.middleware import install_timing_middleware
+from common.resilience import install_resilience
+from common.tracing import install_tracing
+from common.profiling import install_profiler
+from common.reloadable import ReloadableApp
+from .dispatcher import dispatcher_from_config
 
 
 class OrderCreatedEvent(BaseModel):
@@ -18,8 +21,66 @@ class OrderCreatedEvent(BaseModel):
     user_id: str
 
 
-@app.post("/order-created")
-def order_created(event: OrderCreatedEvent):
-    # Minimal side effect for benchmarking
-    print(f"[Notification] Order created: order_id={event.order_id}, user={event.user_id}")
-    return {"status": "ok"}
+class OrderCreatedBatch(BaseModel):
+    events: List[OrderCreatedEvent]
+
+    @model_validator(mode="before")
+    @classmethod
+    def _bare_array(cls, data: Any) -> Any:
+        # Also accept a plain JSON array of events.
+        return {"events": data} if isinstance(data, list) else data
+
+
+class IngestResult(BaseModel):
+    status: str = "ok"
+    count: int
+    accepted: int
+    duplicates: int
+    dropped: int
+
+
+# Buffers, dedupes and coalesces events before handing them to the sinks.
+# Process-wide so buffered events survive a live rebuild.
+dispatcher = dispatcher_from_config()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await dispatcher.start()
+    yield
+    # Flushes what is buffered before the sinks' HTTP clients go away.
+    await dispatcher.close()
+    await close_http_clients()
+
+
+def create_app(oop_enabled: Optional[bool] = None) -> FastAPI:
+    if oop_enabled is None:
+        oop_enabled = get_oop_enabled(default=True)
+
+    app = FastAPI(title="Notification Service", lifespan=lifespan, default_response_class=DEFAULT_RESPONSE_CLASS)
+
+    # Middleware selection
+    install_timing_middleware(app, oop_enabled)
+    install_metrics(app)
+    install_resilience(app)
+    install_tracing(app, "notification_service")
+    install_profiler(app)
+
+    @app.post("/order-created", response_model=IngestResult)
+    async def order_created(event: OrderCreatedEvent = json_body(OrderCreatedEvent)):
+        return IngestResult(count=1, **dispatcher.submit(((event.order_id, event.user_id),)))
+
+    @app.post("/order-created/batch", response_model=IngestResult)
+    async def order_created_batch(batch: OrderCreatedBatch = json_body(OrderCreatedBatch)):
+        result = dispatcher.submit((e.order_id, e.user_id) for e in batch.events)
+        return IngestResult(count=len(batch.events), **result)
+
+    @app.get("/stats")
+    def stats():
+        return dispatcher.stats()
+
+    return app
+
+
+# Rebuilt in place when oop_enabled changes.
+app = ReloadableApp(create_app)
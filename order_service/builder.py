@@ -1,9 +1,26 @@
-from dataclasses import dataclass
-from typing import List
-from common.models import OrderItem, CreateOrderRequest, OrderResponse
-import httpx
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from common.config import config
+from common.event_bus import EventBus
+from common.models import OrderItem, CreateOrderRequest, OrderResponse, loads
+from common.http_client import get_client
+from common.idempotency import IDEMPOTENCY_HEADER, charge_key
+from common.metrics import hop_histogram
+from common.tracing import traced
+from .events import publish_order_created
+from .pipeline import StepTiming, spawn_background
+from .quotes import QuoteCache
+from .store import OrderStore, order_record
+import time
 import uuid
 
+# Downstream hop latency for the OOP/Builder path
+_HOPS = {
+    hop: hop_histogram(hop, oop_enabled=True)
+    for hop in ("inventory", "preauth", "void", "payment", "notify", "inventory_batch", "payment_batch",
+                "notify_batch")
+}
+
 
 @dataclass
 class CheckoutContext:
@@ -11,7 +28,14 @@ class CheckoutContext:
     total_amount: float = 0.0
     inventory_ok: bool = False
     payment_ok: bool = False
+    payment_authorized: Optional[bool] = None
+    # Held pre-authorization; voided if the order then fails
+    authorization_id: Optional[str] = None
     order_id: str | None = None
+    # Id to give the order instead of a fresh uuid4 (X-Order-Id from the gateway)
+    requested_order_id: str | None = None
+    # step name -> StepTiming, filled in by CheckoutGraph
+    step_timings: Dict[str, StepTiming] = field(default_factory=dict)
 
 
 class CheckoutBuilder:
@@ -20,55 +44,226 @@ class CheckoutBuilder:
     involving multiple services (inventory, payment, notification).
     """
 
-    def __init__(self, inventory_url: str, payment_url: str, notify_url: str):
+    def __init__(
+        self,
+        inventory_url: str,
+        payment_url: str,
+        notify_url: str,
+        event_bus: Optional[EventBus] = None,
+        order_store: Optional[OrderStore] = None,
+        quote_cache: Optional[QuoteCache] = None,
+    ):
         self.inventory_url = inventory_url
         self.payment_url = payment_url
         self.notify_url = notify_url
+        # When set, order-created events go to the bus instead of a direct POST.
+        self.event_bus = event_bus
+        # When set, completed orders are recorded (write-behind, no commit on this path).
+        self.order_store = order_store
+        # When set, repeat carts priced under the current catalog version skip the inventory hop.
+        self.quote_cache = quote_cache
 
+    @traced()
     async def check_inventory(self, ctx: CheckoutContext) -> "CheckoutBuilder":
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                f"{self.inventory_url}/check",
-                json={"items": [item.dict() for item in ctx.request.items]},
-                timeout=5.0,
-            )
-            resp.raise_for_status()
-            data = resp.json()
+        if self.quote_cache is not None:
+            total = self.quote_cache.get(ctx.request.items)
+            if total is not None:
+                ctx.inventory_ok = True
+                ctx.total_amount = total
+                return self
+        start = time.perf_counter_ns()
+        resp = await get_client(self.inventory_url).post(
+            "/check",
+            json={"items": ctx.request.items},
+            timeout=config.current.http_timeout_seconds,
+        )
+        _HOPS["inventory"].observe_since(start)
+        resp.raise_for_status()
+        data = loads(resp.content)
         ctx.inventory_ok = data["ok"]
         ctx.total_amount = data["total_amount"]
+        if self.quote_cache is not None:
+            self.quote_cache.put(ctx.request.items, data)
+        return self
+
+    @traced()
+    async def preauthorize_payment(self, ctx: CheckoutContext) -> "CheckoutBuilder":
+        start = time.perf_counter_ns()
+        resp = await get_client(self.payment_url).post(
+            "/authorize",
+            json={
+                "user_id": ctx.request.user_id,
+                "method": ctx.request.payment_method,
+            },
+            timeout=config.current.http_timeout_seconds,
+        )
+        _HOPS["preauth"].observe_since(start)
+        resp.raise_for_status()
+        data = loads(resp.content)
+        ctx.payment_authorized = data["authorized"]
+        ctx.authorization_id = data.get("authorization_id")
         return self
 
+    def release_authorization(self, ctx: CheckoutContext) -> None:
+        """Voids a held pre-authorization off the response path (at most once)."""
+        if ctx.authorization_id is not None:
+            spawn_background(self.void_authorization(ctx, ctx.authorization_id))
+            ctx.authorization_id = None
+
+    @traced()
+    async def void_authorization(self, ctx: CheckoutContext, authorization_id: str) -> None:
+        start = time.perf_counter_ns()
+        resp = await get_client(self.payment_url).post(
+            f"/authorizations/{authorization_id}/void",
+            json={"user_id": ctx.request.user_id, "method": ctx.request.payment_method},
+            timeout=config.current.http_timeout_seconds,
+        )
+        _HOPS["void"].observe_since(start)
+        resp.raise_for_status()
+
+    @traced()
     async def process_payment(self, ctx: CheckoutContext) -> "CheckoutBuilder":
-        if not ctx.inventory_ok:
+        if not ctx.inventory_ok or ctx.payment_authorized is False:
             return self
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                f"{self.payment_url}/charge",
-                json={
-                    "user_id": ctx.request.user_id,
-                    "amount": ctx.total_amount,
-                    "method": ctx.request.payment_method,
-                },
-                timeout=5.0,
-            )
-            resp.raise_for_status()
-            data = resp.json()
+        start = time.perf_counter_ns()
+        resp = await get_client(self.payment_url).post(
+            "/charge",
+            json={
+                "user_id": ctx.request.user_id,
+                "amount": ctx.total_amount,
+                "method": ctx.request.payment_method,
+            },
+            headers=None if ctx.requested_order_id is None else {
+                IDEMPOTENCY_HEADER: charge_key(ctx.requested_order_id)
+            },
+            timeout=config.current.http_timeout_seconds,
+        )
+        _HOPS["payment"].observe_since(start)
+        resp.raise_for_status()
+        data = loads(resp.content)
         ctx.payment_ok = data["success"]
         return self
 
-    async def finalize_order(self, ctx: CheckoutContext) -> "CheckoutBuilder":
+    @traced()
+    async def finalize_order(
+        self, ctx: CheckoutContext, notify_in_background: bool = False
+    ) -> "CheckoutBuilder":
         if not (ctx.inventory_ok and ctx.payment_ok):
+            # Not charged: release the pre-authorization
+            self.release_authorization(ctx)
             return self
-        ctx.order_id = str(uuid.uuid4())
+        ctx.order_id = ctx.requested_order_id or str(uuid.uuid4())
+        if self.order_store is not None:
+            await self.order_store.save(order_record(ctx.order_id, ctx.request, ctx.total_amount))
         # notify service about new order
-        async with httpx.AsyncClient() as client:
-            await client.post(
-                f"{self.notify_url}/order-created",
-                json={"order_id": ctx.order_id, "user_id": ctx.request.user_id},
-                timeout=5.0,
-            )
+        if notify_in_background:
+            spawn_background(self.notify_order_created(ctx))
+        else:
+            await self.notify_order_created(ctx)
         return self
 
+    @traced()
+    async def notify_order_created(self, ctx: CheckoutContext) -> None:
+        if self.event_bus is not None:
+            await publish_order_created(self.event_bus, {"order_id": ctx.order_id, "user_id": ctx.request.user_id})
+            return
+        start = time.perf_counter_ns()
+        await get_client(self.notify_url).post(
+            "/order-created",
+            json={"order_id": ctx.order_id, "user_id": ctx.request.user_id},
+            timeout=config.current.http_timeout_seconds,
+        )
+        _HOPS["notify"].observe_since(start)
+
+    # ---- Batch steps: one round trip per step for many checkouts ----
+    @traced()
+    async def check_inventory_batch(self, ctxs: List[CheckoutContext]) -> "CheckoutBuilder":
+        cache = self.quote_cache
+        if cache is not None:
+            misses = []
+            for ctx in ctxs:
+                total = cache.get(ctx.request.items)
+                if total is None:
+                    misses.append(ctx)
+                else:
+                    ctx.inventory_ok = True
+                    ctx.total_amount = total
+            ctxs = misses
+            if not ctxs:
+                return self
+        start = time.perf_counter_ns()
+        resp = await get_client(self.inventory_url).post(
+            "/check/batch",
+            json={"requests": [{"items": c.request.items} for c in ctxs]},
+            timeout=config.current.http_timeout_seconds,
+        )
+        _HOPS["inventory_batch"].observe_since(start)
+        resp.raise_for_status()
+        for ctx, data in zip(ctxs, loads(resp.content)["results"]):
+            ctx.inventory_ok = data["ok"]
+            ctx.total_amount = data["total_amount"]
+            if cache is not None:
+                cache.put(ctx.request.items, data)
+        return self
+
+    @traced()
+    async def process_payment_batch(self, ctxs: List[CheckoutContext]) -> "CheckoutBuilder":
+        pending = [c for c in ctxs if c.inventory_ok and c.payment_authorized is not False]
+        if not pending:
+            return self
+        start = time.perf_counter_ns()
+        resp = await get_client(self.payment_url).post(
+            "/charge/batch",
+            json={
+                "payments": [
+                    {
+                        "user_id": c.request.user_id,
+                        "amount": c.total_amount,
+                        "method": c.request.payment_method,
+                        "idempotency_key": None if c.requested_order_id is None else charge_key(c.requested_order_id),
+                    }
+                    for c in pending
+                ]
+            },
+            timeout=config.current.http_timeout_seconds,
+        )
+        _HOPS["payment_batch"].observe_since(start)
+        resp.raise_for_status()
+        for ctx, data in zip(pending, loads(resp.content)["results"]):
+            ctx.payment_ok = data["success"]
+        return self
+
+    @traced()
+    async def finalize_orders(
+        self, ctxs: List[CheckoutContext], notify_in_background: bool = False
+    ) -> "CheckoutBuilder":
+        done = [c for c in ctxs if c.inventory_ok and c.payment_ok]
+        if not done:
+            return self
+        for ctx in done:
+            ctx.order_id = str(uuid.uuid4())
+        if self.order_store is not None:
+            await self.order_store.save_many([order_record(c.order_id, c.request, c.total_amount) for c in done])
+        if notify_in_background:
+            spawn_background(self.notify_orders_created(done))
+        else:
+            await self.notify_orders_created(done)
+        return self
+
+    @traced()
+    async def notify_orders_created(self, ctxs: List[CheckoutContext]) -> None:
+        if self.event_bus is not None:
+            for c in ctxs:
+                await publish_order_created(self.event_bus, {"order_id": c.order_id, "user_id": c.request.user_id})
+            return
+        start = time.perf_counter_ns()
+        await get_client(self.notify_url).post(
+            "/order-created/batch",
+            json={"events": [{"order_id": c.order_id, "user_id": c.request.user_id} for c in ctxs]},
+            timeout=config.current.http_timeout_seconds,
+        )
+        _HOPS["notify_batch"].observe_since(start)
+
     def build_response(self, ctx: CheckoutContext) -> OrderResponse:
         status = "FAILED"
         if ctx.inventory_ok and ctx.payment_ok and ctx.order_id:
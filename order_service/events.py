@@ -0,0 +1,53 @@
+from typing import Any, Dict, List
+
+from common.config import config, get_config_value, get_int_setting
+from common.event_bus import BLOCK, EventBus, Subscription
+from common.http_client import get_client
+from common.metrics import metrics
+from common.request_log import request_log
+
+ORDER_CREATED = "order-created"
+# Consumer group of the forwarder: with a shared (redis) transport each event
+# is relayed by one order_service process, not by every one of them.
+FORWARDER_GROUP = "order-events-forwarder"
+
+metrics.describe("order_events_publish_failures_total", "order-created events the bus did not accept")
+_publish_failures = metrics.counter("order_events_publish_failures_total")
+
+
+async def publish_order_created(bus: EventBus, event: Dict[str, Any]) -> None:
+    """
+    Publishes one order-created event. The order is already charged and
+    saved by then, so a failed publish is logged and counted, not raised.
+    """
+    try:
+        await bus.publish(ORDER_CREATED, event)
+    except Exception as e:
+        _publish_failures.inc()
+        request_log.event("OrderEvents", "order-created publish failed", order_id=event.get("order_id"),
+                          error=repr(e))
+
+
+def forward_order_events(bus: EventBus, notify_url: str) -> Subscription:
+    """
+    Subscribes a batching forwarder that relays order-created events from
+    the bus to notification_service, one /order-created/batch call per batch.
+    """
+    async def _forward(events: List[Dict[str, Any]]) -> None:
+        resp = await get_client(notify_url).post(
+            "/order-created/batch",
+            json={"events": events},
+            timeout=config.current.http_timeout_seconds,
+        )
+        resp.raise_for_status()
+
+    return bus.subscribe(
+        ORDER_CREATED,
+        _forward,
+        workers=get_int_setting("order_events_workers", 2),
+        queue_size=get_int_setting("order_events_queue_size", 10000),
+        policy=get_config_value("order_events_policy", BLOCK),
+        batch_size=get_int_setting("order_events_batch_size", 64),
+        block_timeout_ms=float(get_config_value("order_events_block_timeout_ms", "100") or 100),
+        group=FORWARDER_GROUP,
+    )
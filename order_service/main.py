@@ -1,85 +1,427 @@
-from fastapi import FastAPI
-import httpx
+from contextlib import asynccontextmanager
+import asyncio
+import time
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Response
 import uuid
+from typing import AsyncIterator, Optional, Set
 
-from common.config import get_oop_enabled
-from common.middleware import LoggingMiddleware, install_logging_middleware
-from common.models import CreateOrderRequest, OrderResponse
+from common.config import config, get_oop_enabled
+from common.event_bus import event_bus
+from common.http_client import get_client, close_http_clients
+from common.idempotency import IDEMPOTENCY_HEADER, charge_key
+from common.metrics import hop_histogram, install_metrics
+from common.middleware import install_timing_middleware
+from common.models import (
+    DEFAULT_RESPONSE_CLASS,
+    ORDER_ID_HEADER,
+    BatchCreateOrderRequest,
+    BatchOrderResponse,
+    CreateOrderRequest,
+    OrderDetail,
+    OrderResponse,
+    UserOrdersPage,
+    json_body,
+    loads,
+)
+from .events import forward_order_events, publish_order_created
+from common.resilience import install_resilience
+from common.tracing import install_tracing, span, traced
+from common.profiling import install_profiler
+from common.reloadable import REBUILD_KEYS, ReloadableApp
+from .pipeline import StepTiming, drain_background_tasks, format_server_timing, spawn_background
+from .quotes import quote_cache_from_config
+from .store import OrderRecord, order_record, store_from_config
 
-ORDER_INVENTORY_URL = "http://localhost:8003"
-ORDER_PAYMENT_URL = "http://localhost:8002"
-ORDER_NOTIFICATION_URL = "http://localhost:8004"
+# Completed orders: write-behind to SQLite with an LRU of recent ones.
+# Process-wide so pending orders and the cache survive a live rebuild.
+order_store = store_from_config()
 
+# Cart quotes keyed by inventory's catalog version (None when disabled;
+# needs a restart to change).
+quote_cache = quote_cache_from_config()
 
-def create_app() -> FastAPI:
-    oop_enabled = get_oop_enabled(default=True)
 
-    app = FastAPI(title="Order Service")
+def _order_detail(record: OrderRecord) -> OrderDetail:
+    return OrderDetail(
+        order_id=record.order_id,
+        user_id=record.user_id,
+        status=record.status,
+        total_amount=record.total_amount,
+        payment_method=record.payment_method,
+        items=[{"product_id": p, "quantity": q} for p, q in record.items],
+        created_at=record.created_at,
+    )
 
-    if oop_enabled:
-        app.add_middleware(LoggingMiddleware)
-    else:
-        install_logging_middleware(app)
+
+async def _existing_order(order_id: Optional[str]) -> Optional[OrderResponse]:
+    """
+    The stored result for a caller-chosen order id. The gateway re-sends an
+    accepted checkout after a crash with the same X-Order-Id; an order that
+    was already completed is answered from the store, not charged again.
+    """
+    if order_id is None:
+        return None
+    record = await order_store.get(order_id)
+    if record is None:
+        return None
+    return OrderResponse(order_id=record.order_id, status=record.status, total_amount=record.total_amount)
+
+
+# Caller-chosen order ids with a checkout running in this process
+_in_flight: Set[str] = set()
+
+
+async def _claim_order_id(
+    order_id: Optional[str] = Header(None, alias=ORDER_ID_HEADER),
+) -> AsyncIterator[Optional[str]]:
+    """
+    X-Order-Id, held for the duration of the request. A second request for
+    an id whose checkout has not finished yet gets 409 rather than reserving
+    stock and charging a second time; once it has, _existing_order answers it.
+    """
+    if order_id is None:
+        yield None
+        return
+    if order_id in _in_flight:
+        raise HTTPException(status_code=409, detail="Order already in progress", headers={"Retry-After": "1"})
+    _in_flight.add(order_id)
+    try:
+        yield order_id
+    finally:
+        _in_flight.discard(order_id)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await order_store.start()
+    if quote_cache is not None:
+        await quote_cache.start()
+    forwarder = None
+    if app.state.order_events_bus is not None:
+        notify_url = config.current.notification_service_url
+        forwarder = forward_order_events(app.state.order_events_bus, notify_url)
+        await app.state.order_events_bus.start()
+    yield
+    await drain_background_tasks()
+    if forwarder is not None:
+        # close() drains queued events before the HTTP clients go away
+        await app.state.order_events_bus.close()
+        await app.state.order_events_bus.unsubscribe(forwarder)
+    await order_store.close()
+    if quote_cache is not None:
+        await quote_cache.close()
+    await close_http_clients()
+
+
+def create_app(oop_enabled: Optional[bool] = None) -> FastAPI:
+    if oop_enabled is None:
+        oop_enabled = get_oop_enabled(default=True)
+    # "sequential": one hop after another; "concurrent": inventory and payment
+    # pre-authorization in parallel, notification off the response path.
+    settings = config.current
+    concurrent = settings.checkout_mode == "concurrent"
+    # "bus": order-created events are published to the event bus and relayed
+    # to notification_service in batches; "http": POST per order as before.
+    # Needs a restart to change: the relay is subscribed in the lifespan.
+    bus = event_bus if settings.order_events == "bus" else None
+
+    app = FastAPI(title="Order Service", lifespan=lifespan, default_response_class=DEFAULT_RESPONSE_CLASS)
+    app.state.order_events_bus = bus
+
+    install_timing_middleware(app, oop_enabled)
+    install_metrics(app)
+    install_resilience(app)
+    install_tracing(app, "order_service")
+    install_profiler(app)
 
     if oop_enabled:
         # ---- OOP/Builder version (your existing code) ----
         from .builder import CheckoutBuilder, CheckoutContext
+        from .pipeline import default_checkout_graph
 
-        @app.post("/orders", response_model=OrderResponse)
-        async def create_order(req: CreateOrderRequest):
-            ctx = CheckoutContext(request=req)
-            builder = CheckoutBuilder(
-                inventory_url=ORDER_INVENTORY_URL,
-                payment_url=ORDER_PAYMENT_URL,
-                notify_url=ORDER_NOTIFICATION_URL,
+        checkout_graph = default_checkout_graph()
+
+        def _builder() -> CheckoutBuilder:
+            urls = config.current
+            return CheckoutBuilder(
+                inventory_url=urls.inventory_service_url,
+                payment_url=urls.payment_service_url,
+                notify_url=urls.notification_service_url,
+                event_bus=bus,
+                order_store=order_store,
+                quote_cache=quote_cache,
             )
+
+        @app.post("/orders", response_model=OrderResponse)
+        async def create_order(
+            response: Response,
+            req: CreateOrderRequest = json_body(CreateOrderRequest),
+            order_id: Optional[str] = Depends(_claim_order_id),
+        ):
+            existing = await _existing_order(order_id)
+            if existing is not None:
+                return existing
+            ctx = CheckoutContext(request=req, requested_order_id=order_id)
+            builder = _builder()
+            if concurrent:
+                try:
+                    timings = await checkout_graph.run(builder, ctx)
+                finally:
+                    if not ctx.payment_ok:
+                        # A step raised before the charge went through.
+                        builder.release_authorization(ctx)
+                response.headers["Server-Timing"] = format_server_timing(timings)
+                return builder.build_response(ctx)
             await builder.check_inventory(ctx)
             await builder.process_payment(ctx)
             await builder.finalize_order(ctx)
             return builder.build_response(ctx)
 
+        @app.post("/orders/batch", response_model=BatchOrderResponse)
+        async def create_orders_batch(batch: BatchCreateOrderRequest = json_body(BatchCreateOrderRequest)):
+            ctxs = [CheckoutContext(request=r) for r in batch.orders]
+            builder = _builder()
+            if ctxs:
+                await builder.check_inventory_batch(ctxs)
+                await builder.process_payment_batch(ctxs)
+                await builder.finalize_orders(ctxs, notify_in_background=concurrent)
+            return BatchOrderResponse(results=[builder.build_response(c) for c in ctxs])
+
     else:
         # ---- Procedural version (single function orchestration) ----
-        @app.post("/orders", response_model=OrderResponse)
-        async def create_order(req: CreateOrderRequest):
-            async with httpx.AsyncClient() as client:
-                # Step 1: inventory
-                inv = await client.post(
-                    f"{ORDER_INVENTORY_URL}/check",
-                    json={"items": [it.model_dump() for it in req.items]},
-                    timeout=5.0,
+        hops = {hop: hop_histogram(hop, oop_enabled=False) for hop in (
+            "inventory", "preauth", "void", "payment", "notify", "inventory_batch", "payment_batch", "notify_batch"
+        )}
+
+        async def _post(hop: str, base_url: str, path: str, payload, headers=None):
+            start = time.perf_counter_ns()
+            try:
+                return await get_client(base_url).post(
+                    path, json=payload, headers=headers, timeout=config.current.http_timeout_seconds
                 )
-                inv.raise_for_status()
-                inv_data = inv.json()
+            finally:
+                hops[hop].observe_since(start)
+
+        @traced("check_inventory")
+        async def _check(req: CreateOrderRequest) -> dict:
+            if quote_cache is not None:
+                total = quote_cache.get(req.items)
+                if total is not None:
+                    return {"ok": True, "total_amount": total}
+            inv = await _post(
+                "inventory", config.current.inventory_service_url, "/check",
+                {"items": req.items},
+            )
+            inv.raise_for_status()
+            data = loads(inv.content)
+            if quote_cache is not None:
+                quote_cache.put(req.items, data)
+            return data
+
+        @traced("preauthorize_payment")
+        async def _preauthorize(req: CreateOrderRequest):
+            return await _post(
+                "preauth", config.current.payment_service_url, "/authorize",
+                {"user_id": req.user_id, "method": req.payment_method},
+            )
+
+        @traced("void_authorization")
+        async def _void(authorization_id: str, req: CreateOrderRequest):
+            resp = await _post(
+                "void", config.current.payment_service_url, f"/authorizations/{authorization_id}/void",
+                {"user_id": req.user_id, "method": req.payment_method},
+            )
+            resp.raise_for_status()
+
+        async def _timed(coro):
+            start = time.perf_counter()
+            result = await coro
+            return result, (time.perf_counter() - start) * 1000.0
+
+        @traced("notify_order_created")
+        async def _notify(order_id: str, user_id: str):
+            if bus is not None:
+                return await publish_order_created(bus, {"order_id": order_id, "user_id": user_id})
+            return await _post(
+                "notify", config.current.notification_service_url, "/order-created",
+                {"order_id": order_id, "user_id": user_id},
+            )
+
+        @app.post("/orders", response_model=OrderResponse)
+        async def create_order(
+            response: Response,
+            req: CreateOrderRequest = json_body(CreateOrderRequest),
+            order_id: Optional[str] = Depends(_claim_order_id),
+        ):
+            existing = await _existing_order(order_id)
+            if existing is not None:
+                return existing
+            timings = {}
+            authorized = True
+            authorization_id = None
+            pay_ok = False
+            try:
+                # Step 1: inventory (+ payment pre-authorization in concurrent mode)
+                if concurrent:
+                    # return_exceptions: a failed inventory check must not lose
+                    # the authorization_id of a pre-authorization that went through.
+                    inv_res, auth_res = await asyncio.gather(
+                        _timed(_check(req)), _timed(_preauthorize(req)), return_exceptions=True
+                    )
+                    if isinstance(auth_res, BaseException):
+                        raise auth_res
+                    auth, auth_ms = auth_res
+                    auth.raise_for_status()
+                    auth_data = loads(auth.content)
+                    authorized = bool(auth_data.get("authorized", False))
+                    authorization_id = auth_data.get("authorization_id")
+                    if isinstance(inv_res, BaseException):
+                        raise inv_res
+                    inv_data, inv_ms = inv_res
+                    timings["inventory"] = StepTiming(0.0, inv_ms, inv_ms)
+                    timings["preauth"] = StepTiming(0.0, auth_ms, auth_ms)
+                else:
+                    inv_data = await _check(req)
                 inventory_ok = bool(inv_data.get("ok", False))
                 total_amount = float(inv_data.get("total_amount", 0.0))
 
-                if not inventory_ok:
+                if not (inventory_ok and authorized):
                     return OrderResponse(order_id="N/A", status="FAILED", total_amount=total_amount)
 
                 # Step 2: payment
-                pay = await client.post(
-                    f"{ORDER_PAYMENT_URL}/charge",
-                    json={"user_id": req.user_id, "amount": total_amount, "method": req.payment_method},
-                    timeout=5.0,
-                )
+                pay_start = time.perf_counter()
+                with span("process_payment"):
+                    pay = await _post(
+                        "payment", config.current.payment_service_url, "/charge",
+                        {"user_id": req.user_id, "amount": total_amount, "method": req.payment_method},
+                        None if order_id is None else {IDEMPOTENCY_HEADER: charge_key(order_id)},
+                    )
                 pay.raise_for_status()
-                pay_ok = bool(pay.json().get("success", False))
+                if concurrent:
+                    pay_ms = (time.perf_counter() - pay_start) * 1000.0
+                    ready_ms = max(inv_ms, auth_ms)
+                    timings["payment"] = StepTiming(ready_ms, pay_ms, ready_ms + pay_ms)
+                pay_ok = bool(loads(pay.content).get("success", False))
 
                 if not pay_ok:
                     return OrderResponse(order_id="N/A", status="FAILED", total_amount=total_amount)
+            finally:
+                if authorization_id is not None and not pay_ok:
+                    # Not charged (failed, declined or raised): release the
+                    # pre-authorization off the response path
+                    spawn_background(_void(authorization_id, req))
 
-                # Step 3: finalize + notify
-                order_id = str(uuid.uuid4())
-                await client.post(
-                    f"{ORDER_NOTIFICATION_URL}/order-created",
-                    json={"order_id": order_id, "user_id": req.user_id},
-                    timeout=5.0,
+            # Step 3: finalize (record the order) + notify
+            order_id = order_id or str(uuid.uuid4())
+            with span("finalize_order"):
+                await order_store.save(order_record(order_id, req, total_amount))
+            if concurrent:
+                spawn_background(_notify(order_id, req.user_id))
+                response.headers["Server-Timing"] = format_server_timing(timings)
+            else:
+                await _notify(order_id, req.user_id)
+
+            return OrderResponse(order_id=order_id, status="COMPLETED", total_amount=total_amount)
+
+        @traced("notify_orders_created")
+        async def _notify_batch(events):
+            if bus is not None:
+                for event in events:
+                    await publish_order_created(bus, event)
+                return
+            return await _post(
+                "notify_batch", config.current.notification_service_url, "/order-created/batch",
+                {"events": events},
+            )
+
+        @app.post("/orders/batch", response_model=BatchOrderResponse)
+        async def create_orders_batch(batch: BatchCreateOrderRequest = json_body(BatchCreateOrderRequest)):
+            orders = batch.orders
+            if not orders:
+                return BatchOrderResponse(results=[])
+
+            # Step 1: inventory for every cart not quoted from cache, in one call
+            inv_results = [None] * len(orders)
+            if quote_cache is not None:
+                for i, r in enumerate(orders):
+                    total = quote_cache.get(r.items)
+                    if total is not None:
+                        inv_results[i] = {"ok": True, "total_amount": total}
+            misses = [i for i, d in enumerate(inv_results) if d is None]
+            if misses:
+                inv = await _post(
+                    "inventory_batch", config.current.inventory_service_url, "/check/batch",
+                    {"requests": [{"items": orders[i].items} for i in misses]},
                 )
+                inv.raise_for_status()
+                for i, d in zip(misses, loads(inv.content)["results"]):
+                    inv_results[i] = d
+                    if quote_cache is not None:
+                        quote_cache.put(orders[i].items, d)
+            totals = [float(d.get("total_amount", 0.0)) for d in inv_results]
+            to_charge = [i for i, d in enumerate(inv_results) if d.get("ok", False)]
+
+            # Step 2: payment for the carts that passed inventory
+            paid = set()
+            if to_charge:
+                pay = await _post(
+                    "payment_batch", config.current.payment_service_url, "/charge/batch",
+                    {
+                        "payments": [
+                            {"user_id": orders[i].user_id, "amount": totals[i], "method": orders[i].payment_method}
+                            for i in to_charge
+                        ]
+                    },
+                )
+                pay.raise_for_status()
+                for i, d in zip(to_charge, loads(pay.content)["results"]):
+                    if d.get("success", False):
+                        paid.add(i)
+
+            # Step 3: finalize + one notification call for the whole batch
+            results = []
+            events = []
+            records = []
+            for i, r in enumerate(orders):
+                if i in paid:
+                    order_id = str(uuid.uuid4())
+                    records.append(order_record(order_id, r, totals[i]))
+                    events.append({"order_id": order_id, "user_id": r.user_id})
+                    results.append(OrderResponse(order_id=order_id, status="COMPLETED", total_amount=totals[i]))
+                else:
+                    results.append(OrderResponse(order_id="N/A", status="FAILED", total_amount=totals[i]))
+            if records:
+                await order_store.save_many(records)
+            if events:
+                if concurrent:
+                    spawn_background(_notify_batch(events))
+                else:
+                    await _notify_batch(events)
+            return BatchOrderResponse(results=results)
+
+    # ---- Order lookups (same for both versions) ----
+    @app.get("/orders/{order_id}", response_model=OrderDetail)
+    async def get_order(order_id: str):
+        record = await order_store.get(order_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        return _order_detail(record)
 
-                return OrderResponse(order_id=order_id, status="COMPLETED", total_amount=total_amount)
+    @app.get("/users/{user_id}/orders", response_model=UserOrdersPage)
+    async def list_user_orders(
+        user_id: str,
+        limit: int = Query(20, ge=1, le=200),
+        cursor: Optional[str] = None,
+    ):
+        try:
+            records, next_cursor = await order_store.list_by_user(user_id, limit, cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return UserOrdersPage(orders=[_order_detail(r) for r in records], next_cursor=next_cursor)
 
     return app
 
 
-app = create_app()
+# Rebuilt in place when the OOP switch or the checkout mode changes.
+app = ReloadableApp(create_app, keys=REBUILD_KEYS + ("checkout_mode",))
@@ -0,0 +1,143 @@
+from __future__ import annotations
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Awaitable, Callable, Coroutine, Dict, List, Set, Tuple
+
+from common.metrics import metrics
+from common.request_log import request_log
+from common.resilience import current_deadline
+
+if TYPE_CHECKING:
+    from .builder import CheckoutBuilder, CheckoutContext
+
+
+StepFn = Callable[["CheckoutBuilder", "CheckoutContext"], Awaitable[object]]
+
+
+@dataclass
+class StepTiming:
+    start_ms: float  # offset from the start of the pipeline
+    duration_ms: float
+    critical_path_ms: float  # longest dependency chain ending with this step
+
+
+@dataclass
+class Step:
+    name: str
+    fn: StepFn
+    depends_on: Tuple[str, ...] = ()
+
+
+class CheckoutGraph:
+    """
+    Dependency graph of checkout steps. Steps whose dependencies are done run
+    concurrently, so the checkout costs its critical path instead of the sum
+    of every round trip.
+    """
+
+    def __init__(self) -> None:
+        self._steps: List[Step] = []
+
+    def add_step(self, name: str, fn: StepFn, depends_on: Tuple[str, ...] = ()) -> "CheckoutGraph":
+        known = {s.name for s in self._steps}
+        missing = [d for d in depends_on if d not in known]
+        if missing:
+            raise ValueError(f"Step {name!r} depends on unknown steps: {missing}")
+        self._steps.append(Step(name, fn, tuple(depends_on)))
+        return self
+
+    async def run(self, builder: "CheckoutBuilder", ctx: "CheckoutContext") -> Dict[str, StepTiming]:
+        t0 = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_step(step: Step) -> None:
+            if step.depends_on:
+                await asyncio.gather(*(tasks[d] for d in step.depends_on))
+            start = time.perf_counter()
+            await step.fn(builder, ctx)
+            end = time.perf_counter()
+            cp = max((ctx.step_timings[d].critical_path_ms for d in step.depends_on), default=0.0)
+            duration_ms = (end - start) * 1000.0
+            ctx.step_timings[step.name] = StepTiming(
+                start_ms=(start - t0) * 1000.0,
+                duration_ms=duration_ms,
+                critical_path_ms=cp + duration_ms,
+            )
+
+        # Steps are added in dependency order, so every dependency task exists
+        # before its dependents are created.
+        for step in self._steps:
+            tasks[step.name] = asyncio.create_task(run_step(step))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for t in tasks.values():
+                t.cancel()
+            raise
+        return ctx.step_timings
+
+
+def default_checkout_graph() -> CheckoutGraph:
+    """
+    inventory ----+
+                  +--> payment --> finalize (notification detached)
+    preauth ------+
+    """
+    from .builder import CheckoutBuilder
+
+    async def finalize(builder: CheckoutBuilder, ctx: "CheckoutContext") -> None:
+        await builder.finalize_order(ctx, notify_in_background=True)
+
+    return (
+        CheckoutGraph()
+        .add_step("inventory", CheckoutBuilder.check_inventory)
+        .add_step("preauth", CheckoutBuilder.preauthorize_payment)
+        .add_step("payment", CheckoutBuilder.process_payment, depends_on=("inventory", "preauth"))
+        .add_step("finalize", finalize, depends_on=("payment",))
+    )
+
+
+def format_server_timing(timings: Dict[str, StepTiming]) -> str:
+    """Renders step timings as a Server-Timing header value."""
+    return ", ".join(
+        f'{name};dur={t.duration_ms:.2f};desc="cp={t.critical_path_ms:.2f}"'
+        for name, t in timings.items()
+    )
+
+
+# ---- Fire-and-forget work kept off the response path ----
+_background_tasks: Set[asyncio.Task] = set()
+
+metrics.describe("order_background_failures_total", "Background tasks (notify, void) that raised, per task")
+
+
+def _on_background_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if task.cancelled():
+        return
+    # The response has already been sent; all that is left is to record it.
+    exc = task.exception()
+    if exc is not None:
+        name = task.get_name()
+        metrics.counter("order_background_failures_total", task=name).inc()
+        request_log.event("Background", "background task failed", task=name, error=repr(exc))
+
+
+async def _detached(coro: Coroutine):
+    # Runs after the response is sent, so the request's deadline no longer
+    # applies; calls fall back to the plain per-call timeout.
+    current_deadline.set(None)
+    return await coro
+
+
+def spawn_background(coro: Coroutine) -> asyncio.Task:
+    task = asyncio.create_task(_detached(coro), name=coro.__qualname__)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_done)
+    return task
+
+
+async def drain_background_tasks(timeout: float = 5.0) -> None:
+    if _background_tasks:
+        await asyncio.wait(list(_background_tasks), timeout=timeout)
@@ -0,0 +1,133 @@
+from __future__ import annotations
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional, Sequence, Tuple
+
+from common.config import config, get_bool_setting, get_int_setting
+from common.http_client import get_client
+from common.metrics import metrics
+from common.models import OrderItem, loads
+
+metrics.describe("order_quote_cache_total", "Cart quotes by result (hit, miss, stale)")
+metrics.describe("order_quote_cache_version_changes_total", "Catalog version changes seen by the quote cache")
+
+CartKey = Tuple[Tuple[str, int], ...]
+
+
+def cart_key(items: Sequence[OrderItem]) -> CartKey:
+    return tuple((item.product_id, item.quantity) for item in items)
+
+
+class QuoteCache:
+    """
+    Cart totals quoted by inventory_service, keyed by catalog version.
+
+    A poller reads inventory's current catalog version every
+    `poll_interval_ms`; a change drops every cached quote. Quotes are stored
+    only when the /check response was priced from that same version, so a
+    cached total is at most one poll interval behind a price change. If the
+    version cannot be confirmed for `max_staleness_ms` the cache is bypassed.
+
+    Only successful quotes are cached. Stock is not re-checked on a hit; it is
+    advisory on /check as well (nothing is reserved there).
+    """
+
+    def __init__(self, max_entries: int = 10_000, poll_interval_ms: float = 1000.0,
+                 max_staleness_ms: float = 3000.0) -> None:
+        self.max_entries = max_entries
+        self.poll_interval_ms = poll_interval_ms
+        self.max_staleness_ms = max_staleness_ms
+        self.version: Optional[str] = None
+        self._confirmed_at = 0.0
+        self._entries: "OrderedDict[CartKey, float]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+        self._hits = metrics.counter("order_quote_cache_total", result="hit")
+        self._misses = metrics.counter("order_quote_cache_total", result="miss")
+        self._stale = metrics.counter("order_quote_cache_total", result="stale")
+        self._version_changes = metrics.counter("order_quote_cache_version_changes_total")
+
+    # -- lifecycle --
+    async def start(self) -> None:
+        if self._task is None:
+            # The first version read happens one interval in, not here:
+            # inventory_service may not be reachable yet while services start.
+            self._task = asyncio.get_running_loop().create_task(self._poll_loop())
+
+    async def close(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    # -- version tracking --
+    def observe_version(self, version: str) -> None:
+        if version != self.version:
+            self.version = version
+            self._entries.clear()
+            self._version_changes.inc()
+        self._confirmed_at = time.monotonic()
+
+    async def refresh(self) -> bool:
+        """Reads inventory's catalog version; False if it could not be confirmed."""
+        try:
+            resp = await get_client(config.current.inventory_service_url).get(
+                "/catalog", timeout=config.current.http_timeout_seconds
+            )
+            resp.raise_for_status()
+            self.observe_version(loads(resp.content)["version"])
+            return True
+        except Exception:
+            return False
+
+    async def _poll_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval_ms / 1000.0)
+            await self.refresh()
+
+    # -- quotes --
+    def get(self, items: Sequence[OrderItem]) -> Optional[float]:
+        """The cached total for this cart under the current version, if any."""
+        if self.version is None or (time.monotonic() - self._confirmed_at) * 1000.0 > self.max_staleness_ms:
+            self._stale.inc()
+            return None
+        key = cart_key(items)
+        total = self._entries.get(key)
+        if total is None:
+            self._misses.inc()
+            return None
+        self._entries.move_to_end(key)
+        self._hits.inc()
+        return total
+
+    def put(self, items: Sequence[OrderItem], data: dict) -> None:
+        """Caches a /check result (`ok`, `total_amount`, `catalog_version`)."""
+        if not data.get("ok") or data.get("catalog_version") != self.version or self.version is None:
+            return
+        self._entries[cart_key(items)] = float(data["total_amount"])
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            "hits": self._hits.value,
+            "misses": self._misses.value,
+            "stale": self._stale.value,
+        }
+
+
+def quote_cache_from_config() -> Optional[QuoteCache]:
+    if not get_bool_setting("quote_cache_enabled", False):
+        return None
+    poll_ms = float(get_int_setting("quote_cache_poll_ms", 1000))
+    return QuoteCache(
+        max_entries=get_int_setting("quote_cache_size", 10_000),
+        poll_interval_ms=poll_ms,
+        max_staleness_ms=float(get_int_setting("quote_cache_max_staleness_ms", int(3 * poll_ms))),
+    )
@@ -0,0 +1,439 @@
+from __future__ import annotations
+import asyncio
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from common.config import config, get_bool_setting, get_config_value, get_int_setting
+from common.metrics import metrics
+from common.models import CreateOrderRequest, dumps, loads
+from common.request_log import request_log
+
+metrics.describe("order_store_pending", "Orders accepted but not yet committed to the repository")
+metrics.describe("order_store_batch_size", "Orders per group commit")
+metrics.describe("order_store_commit_ms", "Duration of one repository commit")
+metrics.describe("order_store_cache_total", "Order reads by result (cache hit, pending, repository, missing)")
+metrics.describe("order_store_commit_failures_total", "Group commits that failed and were retried")
+
+
+@dataclass(frozen=True)
+class OrderRecord:
+    order_id: str
+    user_id: str
+    status: str
+    total_amount: float
+    payment_method: str
+    items: Tuple[Tuple[str, int], ...]  # (product_id, quantity)
+    created_at: float
+
+    @property
+    def sort_key(self) -> Tuple[float, str]:
+        # Newest first in listings; order_id breaks ties between equal timestamps.
+        return self.created_at, self.order_id
+
+
+def order_record(order_id: str, req: CreateOrderRequest, total_amount: float, status: str = "COMPLETED") -> OrderRecord:
+    return OrderRecord(
+        order_id=order_id,
+        user_id=req.user_id,
+        status=status,
+        total_amount=total_amount,
+        payment_method=req.payment_method,
+        items=tuple((item.product_id, item.quantity) for item in req.items),
+        created_at=time.time(),
+    )
+
+
+def encode_cursor(record: OrderRecord) -> str:
+    return f"{record.created_at!r}:{record.order_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """Inverse of encode_cursor; raises ValueError for anything else."""
+    created_at, sep, order_id = cursor.partition(":")
+    if not sep or not order_id:
+        raise ValueError(f"Bad cursor {cursor!r}")
+    return float(created_at), order_id
+
+
+# ---- Repositories ----
+class OrderRepository(ABC):
+    """Durable storage for orders. put_many() commits all records in one transaction."""
+
+    @abstractmethod
+    async def put_many(self, records: Sequence[OrderRecord]) -> None: ...
+
+    @abstractmethod
+    async def get(self, order_id: str) -> Optional[OrderRecord]: ...
+
+    @abstractmethod
+    async def list_by_user(
+        self, user_id: str, limit: int, before: Optional[Tuple[float, str]] = None
+    ) -> List[OrderRecord]:
+        """Newest first, strictly older than `before` (a sort_key) when given."""
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryOrderRepository(OrderRepository):
+    """Process-local repository; nothing survives a restart."""
+
+    def __init__(self) -> None:
+        self._orders: Dict[str, OrderRecord] = {}
+        self._by_user: Dict[str, List[OrderRecord]] = {}
+
+    async def put_many(self, records: Sequence[OrderRecord]) -> None:
+        for r in records:
+            if r.order_id not in self._orders:
+                self._by_user.setdefault(r.user_id, []).append(r)
+            self._orders[r.order_id] = r
+
+    async def get(self, order_id: str) -> Optional[OrderRecord]:
+        return self._orders.get(order_id)
+
+    async def list_by_user(
+        self, user_id: str, limit: int, before: Optional[Tuple[float, str]] = None
+    ) -> List[OrderRecord]:
+        rows = sorted(self._by_user.get(user_id, ()), key=lambda r: r.sort_key, reverse=True)
+        if before is not None:
+            rows = [r for r in rows if r.sort_key < before]
+        return rows[:limit]
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id       TEXT PRIMARY KEY,
+    user_id        TEXT NOT NULL,
+    status         TEXT NOT NULL,
+    total_amount   REAL NOT NULL,
+    payment_method TEXT NOT NULL,
+    items          TEXT NOT NULL,
+    created_at     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_by_user ON orders (user_id, created_at DESC, order_id DESC);
+"""
+
+_COLUMNS = "order_id, user_id, status, total_amount, payment_method, items, created_at"
+
+
+def _row_to_record(row: tuple) -> OrderRecord:
+    order_id, user_id, status, total_amount, payment_method, items, created_at = row
+    return OrderRecord(
+        order_id, user_id, status, total_amount, payment_method,
+        tuple((p, q) for p, q in loads(items)), created_at,
+    )
+
+
+class SqliteOrderRepository(OrderRepository):
+    """
+    SQLite in WAL mode. All statements run on one dedicated thread that owns
+    the connection, so the event loop never blocks on disk I/O.
+
+    With synchronous=NORMAL (the default here) a WAL commit does not fsync;
+    the log is synced at checkpoints. Committed orders survive a process
+    crash but the last ones can be lost on power failure. synchronous=FULL
+    syncs every commit.
+    """
+
+    def __init__(self, path: str, synchronous: str = "NORMAL") -> None:
+        self.path = path
+        self.synchronous = synchronous
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _open(self) -> None:
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        # Several launcher workers may share the file; wait for the writer lock.
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+
+    async def start(self) -> None:
+        """Opens the database; also done on first use. Reopens after close()."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="order-store")
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._open)
+
+    async def _run(self, fn, *args):
+        if self._executor is None:
+            await self.start()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _put_many(self, records: Sequence[OrderRecord]) -> None:
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO orders ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (r.order_id, r.user_id, r.status, r.total_amount, r.payment_method,
+                     dumps(r.items).decode("utf-8"), r.created_at)
+                    for r in records
+                ],
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _get(self, order_id: str) -> Optional[OrderRecord]:
+        row = self._conn.execute(f"SELECT {_COLUMNS} FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+        return _row_to_record(row) if row else None
+
+    def _list_by_user(self, user_id: str, limit: int, before: Optional[Tuple[float, str]]) -> List[OrderRecord]:
+        if before is None:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM orders WHERE user_id = ? "
+                "ORDER BY created_at DESC, order_id DESC LIMIT ?",
+                (user_id, limit),
+            )
+        else:
+            # Keyset pagination: walks the (user_id, created_at, order_id) index from the cursor.
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM orders WHERE user_id = ? AND (created_at, order_id) < (?, ?) "
+                "ORDER BY created_at DESC, order_id DESC LIMIT ?",
+                (user_id, before[0], before[1], limit),
+            )
+        return [_row_to_record(row) for row in rows]
+
+    async def put_many(self, records: Sequence[OrderRecord]) -> None:
+        await self._run(self._put_many, records)
+
+    async def get(self, order_id: str) -> Optional[OrderRecord]:
+        return await self._run(self._get, order_id)
+
+    async def list_by_user(
+        self, user_id: str, limit: int, before: Optional[Tuple[float, str]] = None
+    ) -> List[OrderRecord]:
+        return await self._run(self._list_by_user, user_id, limit, before)
+
+    async def close(self) -> None:
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            await asyncio.get_running_loop().run_in_executor(executor, conn.close)
+        executor.shutdown(wait=True)
+
+
+# ---- Write-behind store with read-through cache ----
+class OrderStore:
+    """
+    Front of the repository used by the checkout paths.
+
+    save() puts the order in an LRU cache and a pending queue and returns
+    without touching disk. A background flusher takes whatever is queued,
+    up to batch_size orders or flush_interval_ms after the first one, and
+    commits it as one transaction (group commit). Checkout latency therefore
+    never includes a commit, and the disk sees one commit per batch instead
+    of one per order.
+
+    Reads check the cache, then orders still pending, then the repository
+    (filling the cache). A full queue (max_pending) makes save() wait,
+    which pushes back on checkouts instead of growing without bound. With
+    write_behind=False, save() commits the single order before returning
+    (the baseline for bench_order_store).
+
+    Orders pending in another worker process are not visible here until
+    that worker's next commit.
+    """
+
+    def __init__(
+        self,
+        repository: OrderRepository,
+        write_behind: bool = True,
+        batch_size: int = 256,
+        flush_interval_ms: float = 5.0,
+        cache_size: int = 10_000,
+        max_pending: int = 50_000,
+    ) -> None:
+        self.repository = repository
+        self.write_behind = write_behind
+        self.batch_size = batch_size
+        self.flush_interval_ms = flush_interval_ms
+        self.cache_size = cache_size
+        self.max_pending = max_pending
+        self._cache: "OrderedDict[str, OrderRecord]" = OrderedDict()
+        self._pending: Dict[str, OrderRecord] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+        self._pending_gauge = metrics.gauge("order_store_pending")
+        self._batch_size = metrics.histogram("order_store_batch_size")
+        self._commit_ms = metrics.histogram("order_store_commit_ms")
+        self._commit_failures = metrics.counter("order_store_commit_failures_total")
+        self._reads = {
+            result: metrics.counter("order_store_cache_total", result=result)
+            for result in ("hit", "pending", "repository", "missing")
+        }
+
+    # -- lifecycle --
+    async def start(self) -> None:
+        await self.repository.start()
+        if not self.write_behind or self._flusher is not None:
+            return
+        self._queue = asyncio.Queue(self.max_pending)
+        self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Commits everything still pending (waiting up to `timeout`), then closes the repository."""
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            request_log.event("OrderStore", "closed with uncommitted orders", orders=len(self._pending))
+        flusher, self._flusher = self._flusher, None
+        self._queue = None
+        if flusher is not None:
+            flusher.cancel()
+            try:
+                await flusher
+            except asyncio.CancelledError:
+                pass
+        await self.repository.close()
+
+    async def flush(self) -> None:
+        """Waits until every order saved so far is committed."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    # -- writes --
+    async def save(self, record: OrderRecord) -> None:
+        self._cache_put(record)
+        if self._queue is None:
+            await self._commit([record])
+            return
+        self._pending[record.order_id] = record
+        self._pending_gauge.inc()
+        await self._queue.put(record)
+
+    async def save_many(self, records: Sequence[OrderRecord]) -> None:
+        if self._queue is None:
+            for r in records:
+                self._cache_put(r)
+            await self._commit(records)
+            return
+        for r in records:
+            await self.save(r)
+
+    async def _commit(self, batch: Sequence[OrderRecord]) -> None:
+        start = time.perf_counter_ns()
+        await self.repository.put_many(batch)
+        self._commit_ms.observe_since(start)
+        self._batch_size.observe(len(batch))
+
+    async def _flush_loop(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            deadline = time.monotonic() + self.flush_interval_ms / 1000.0
+            while len(batch) < self.batch_size:
+                if queue.empty():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(queue.get_nowait())
+
+            delay = 0.05
+            while True:
+                try:
+                    await self._commit(batch)
+                    break
+                except Exception as e:
+                    # Keep the batch (and the orders readable from _pending) and retry.
+                    self._commit_failures.inc()
+                    request_log.event("OrderStore", "commit failed", orders=len(batch), error=repr(e))
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 2.0)
+
+            for r in batch:
+                self._pending.pop(r.order_id, None)
+                queue.task_done()
+            self._pending_gauge.dec(len(batch))
+
+    # -- reads --
+    def _cache_put(self, record: OrderRecord) -> None:
+        self._cache[record.order_id] = record
+        self._cache.move_to_end(record.order_id)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def get(self, order_id: str) -> Optional[OrderRecord]:
+        record = self._cache.get(order_id)
+        if record is not None:
+            self._cache.move_to_end(order_id)
+            self._reads["hit"].inc()
+            return record
+        record = self._pending.get(order_id)
+        if record is not None:
+            self._reads["pending"].inc()
+            return record
+        record = await self.repository.get(order_id)
+        if record is None:
+            self._reads["missing"].inc()
+            return None
+        self._reads["repository"].inc()
+        self._cache_put(record)
+        return record
+
+    async def list_by_user(
+        self, user_id: str, limit: int, cursor: Optional[str] = None
+    ) -> Tuple[List[OrderRecord], Optional[str]]:
+        """One page, newest first, plus the cursor for the next page (None on the last)."""
+        before = decode_cursor(cursor) if cursor else None
+        rows = await self.repository.list_by_user(user_id, limit + 1, before)
+        pending = [
+            r for r in self._pending.values()
+            if r.user_id == user_id and (before is None or r.sort_key < before)
+        ]
+        if pending:
+            committed = {r.order_id for r in rows}
+            rows = sorted(
+                rows + [r for r in pending if r.order_id not in committed],
+                key=lambda r: r.sort_key, reverse=True,
+            )
+        page = rows[:limit]
+        next_cursor = encode_cursor(page[-1]) if len(rows) > limit else None
+        return page, next_cursor
+
+    def stats(self) -> Dict[str, int]:
+        return {"cached": len(self._cache), "pending": len(self._pending), "commits": self._batch_size.count}
+
+
+def repository_from_config() -> OrderRepository:
+    kind = get_config_value("order_store", "sqlite")
+    if kind == "memory":
+        return MemoryOrderRepository()
+    path = get_config_value("order_store_path", "data/orders.db")
+    if path != ":memory:" and not Path(path).is_absolute():
+        path = str(config.path.parent / path)
+    return SqliteOrderRepository(path, synchronous=get_config_value("order_store_synchronous", "NORMAL").upper())
+
+
+def store_from_config() -> OrderStore:
+    return OrderStore(
+        repository_from_config(),
+        write_behind=get_bool_setting("order_store_write_behind", True),
+        batch_size=get_int_setting("order_store_batch_size", 256),
+        flush_interval_ms=float(get_int_setting("order_store_flush_interval_ms", 5)),
+        cache_size=get_int_setting("order_store_cache_size", 10_000),
+        max_pending=get_int_setting("order_store_max_pending", 50_000),
+    )
@@ -0,0 +1,121 @@
+from __future__ import annotations
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, TypeVar
+
+from common.config import get_int_setting
+from common.deadline import Deadline
+from common.metrics import metrics
+
+T = TypeVar("T")
+
+metrics.describe("payment_provider_duration_ms", "Provider call latency per method, including queueing")
+metrics.describe("payment_provider_timeouts_total", "Provider calls abandoned at the caller's deadline")
+metrics.describe("payment_provider_hedges_total", "Hedged second attempts started for slow authorizations")
+metrics.describe("payment_provider_in_flight", "Provider calls currently holding a concurrency slot")
+
+
+class ProviderTimeout(Exception):
+    """The caller's deadline ran out before the provider answered."""
+
+
+class _MethodSlot:
+    """Per-method semaphore plus pre-resolved metric handles."""
+
+    __slots__ = ("semaphore", "in_flight", "duration", "timeouts", "hedges")
+
+    def __init__(self, method: str, max_concurrency: int) -> None:
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = metrics.gauge("payment_provider_in_flight", method=method)
+        self.duration = metrics.histogram("payment_provider_duration_ms", method=method)
+        self.timeouts = metrics.counter("payment_provider_timeouts_total", method=method)
+        self.hedges = metrics.counter("payment_provider_hedges_total", method=method)
+
+
+class ProviderEngine:
+    """
+    Runs provider calls on the event loop under per-method limits.
+
+    - a semaphore per payment method caps concurrent calls to that provider
+      (queueing for a slot counts against the deadline);
+    - every call is bounded by the caller's remaining Deadline;
+    - idempotent calls (authorization) can be hedged: if the first attempt
+      has not answered after hedge_after_ms and the provider has a free slot,
+      a second one is started and the first result wins.
+
+    Used by both the Factory and the procedural path, so the two are compared
+    under the same limits.
+    """
+
+    def __init__(self, max_concurrency: int = 100, hedge_after_ms: float = 0.0) -> None:
+        self.max_concurrency = max_concurrency
+        self.hedge_after_ms = hedge_after_ms
+        self._slots: Dict[str, _MethodSlot] = {}
+
+    def _slot(self, method: str) -> _MethodSlot:
+        slot = self._slots.get(method)
+        if slot is None:
+            slot = self._slots[method] = _MethodSlot(method, self.max_concurrency)
+        return slot
+
+    @staticmethod
+    async def _limited(slot: _MethodSlot, fn: Callable[[], Awaitable[T]]) -> T:
+        async with slot.semaphore:
+            slot.in_flight.inc()
+            try:
+                return await fn()
+            finally:
+                slot.in_flight.dec()
+
+    async def call(self, method: str, fn: Callable[[], Awaitable[T]], deadline: Deadline) -> T:
+        slot = self._slot(method)
+        start = time.perf_counter_ns()
+        try:
+            return await asyncio.wait_for(self._limited(slot, fn), timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            slot.timeouts.inc()
+            raise ProviderTimeout(f"{method} provider did not answer before the deadline")
+        finally:
+            slot.duration.observe_since(start)
+
+    async def hedged(self, method: str, fn: Callable[[], Awaitable[T]], deadline: Deadline) -> T:
+        """Like call(), with one hedged retry. Only for idempotent calls."""
+        if self.hedge_after_ms <= 0:
+            return await self.call(method, fn, deadline)
+
+        slot = self._slot(method)
+        start = time.perf_counter_ns()
+        attempts = [asyncio.ensure_future(self._limited(slot, fn))]
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=min(self.hedge_after_ms / 1000.0, deadline.remaining()))
+            # Hedge only when a slot is free: behind a full semaphore the
+            # second attempt would just queue and add load.
+            if not done and not deadline.expired and not slot.semaphore.locked():
+                slot.hedges.inc()
+                attempts.append(asyncio.ensure_future(self._limited(slot, fn)))
+
+            pending = set(attempts)
+            error: BaseException = ProviderTimeout(f"{method} provider did not answer before the deadline")
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=deadline.remaining(), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    slot.timeouts.inc()
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in attempts:
+                task.cancel()
+            slot.duration.observe_since(start)
+
+
+def engine_from_config() -> ProviderEngine:
+    return ProviderEngine(
+        max_concurrency=get_int_setting("payment_provider_concurrency", 100),
+        hedge_after_ms=float(get_int_setting("payment_hedge_after_ms", 0)),
+    )
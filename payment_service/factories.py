@@ -1,16 +1,71 @@
+from importlib.metadata import entry_points
+from threading import Lock
+from typing import Callable, Dict, List
+
 from .providers import PaymentProvider, CreditCardProvider, PayPalProvider
 
+# Third-party providers register under this entry-point group, e.g. in their
+# pyproject.toml:  [project.entry-points."payment_service.providers"]
+#                  crypto = "acme_pay:CryptoProvider"
+ENTRY_POINT_GROUP = "payment_service.providers"
+
 
 class PaymentProviderFactory:
     """
-    Factory Method: encapsulates creation of concrete payment providers.
-    In microservices, this could map to selecting external services, configs, etc.
+    Factory Method over a registry of provider classes keyed by method name.
+
+    create() hands out one shared instance per method (flyweight): the
+    provider is built on first use, or up front by warm_up(), and reused for
+    every later request instead of being instantiated per charge.
     """
 
-    @staticmethod
-    def create(method: str) -> PaymentProvider:
-        if method == "credit_card":
-            return CreditCardProvider()
-        if method == "paypal":
-            return PayPalProvider()
-        raise ValueError(f"Unsupported payment method: {method}")
+    def __init__(self) -> None:
+        self._registry: Dict[str, Callable[[], PaymentProvider]] = {}
+        self._instances: Dict[str, PaymentProvider] = {}
+        self._lock = Lock()
+
+    def register(self, method: str, provider_cls: Callable[[], PaymentProvider]) -> None:
+        with self._lock:
+            self._registry[method] = provider_cls
+            self._instances.pop(method, None)
+
+    def load_entry_points(self, group: str = ENTRY_POINT_GROUP) -> None:
+        for ep in entry_points(group=group):
+            self.register(ep.name, ep.load())
+
+    @property
+    def methods(self) -> List[str]:
+        return list(self._registry)
+
+    def create(self, method: str) -> PaymentProvider:
+        provider = self._instances.get(method)
+        if provider is not None:
+            return provider
+        with self._lock:
+            provider = self._instances.get(method)
+            if provider is None:
+                provider_cls = self._registry.get(method)
+                if provider_cls is None:
+                    raise ValueError(f"Unsupported payment method: {method}")
+                provider = provider_cls()
+                self._instances[method] = provider
+            return provider
+
+    async def warm_up(self) -> None:
+        """Instantiates every registered provider and starts it."""
+        for method in self.methods:
+            await self.create(method).start()
+
+    async def close(self) -> None:
+        with self._lock:
+            providers = list(self._instances.values())
+            self._instances.clear()
+        for provider in providers:
+            await provider.close()
+
+
+# Process-wide factory with the built-in providers plus any installed plugins.
+payment_providers = PaymentProviderFactory()
+payment_providers.register("credit_card", CreditCardProvider)
+payment_providers.register("paypal", PayPalProvider)
+payment_providers.load_entry_points()
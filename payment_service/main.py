@@ -1,16 +1,25 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-
-from common.config import get_oop_enabled
-from common.middleware import LoggingMiddleware, install_logging_middleware
+from contextlib import asynccontextmanager
 
-app = FastAPI(title="Payment Service")
-
-oop_enabled = get_oop_enabled(default=True)
-if oop_enabled:
-    app.add_middleware(LoggingMiddleware)
-else:
-    install_logging_middleware(app)
+from fastapi import FastAPI, Header, HTTPException, Response
+from pydantic import BaseModel
+from typing import List, Optional
+
+import asyncio
+import uuid
+
+from common.config import config, get_oop_enabled
+from common.deadline import Deadline
+from common.idempotency import REPLAYED_HEADER, IdempotencyConflict, fingerprint, store_from_config
+from common.metrics import install_metrics
+from common.models import DEFAULT_RESPONSE_CLASS, json_body
+from common.middleware import install_timing_middleware
+from common.resilience import current_deadline, install_resilience
+from common.tracing import install_tracing
+from common.profiling import install_profiler
+from common.reloadable import ReloadableApp
+from .engine import ProviderTimeout, engine_from_config
+from .factories import payment_providers
+from .providers import latency_for
 
 
 class PaymentRequest(BaseModel):
@@ -23,13 +32,58 @@ class PaymentResult(BaseModel):
     success: bool
 
 
+class BatchPayment(PaymentRequest):
+    # A batch has no single Idempotency-Key header; each payment may carry its own.
+    idempotency_key: Optional[str] = None
+
+
+class PaymentBatchRequest(BaseModel):
+    payments: List[BatchPayment]
+
+
+class PaymentBatchResult(BaseModel):
+    results: List[PaymentResult]
+
+
+class AuthorizationRequest(BaseModel):
+    user_id: str
+    method: str
+
+
+class AuthorizationResult(BaseModel):
+    authorized: bool
+    # Pass to POST /authorizations/{id}/void when the order is not charged.
+    authorization_id: Optional[str] = None
+
+
+class VoidRequest(BaseModel):
+    user_id: str
+    method: str
+
+
+class VoidResult(BaseModel):
+    ok: bool
+
+
 # ---- Procedural payment handlers (no Factory/providers) ----
-def _charge_credit_card(user_id: str, amount: float) -> bool:
+# Same simulated gateway latency as the providers, so both modes see it.
+_LATENCY = {method: latency_for(method) for method in ("credit_card", "paypal")}
+
+
+async def _simulate(method: str) -> None:
+    latency = _LATENCY.get(method)
+    if latency is not None:
+        await latency.wait()
+
+
+async def _charge_credit_card(user_id: str, amount: float) -> bool:
     # keep minimal work for benchmarking
+    await _simulate("credit_card")
     return True
 
 
-def _charge_paypal(user_id: str, amount: float) -> bool:
+async def _charge_paypal(user_id: str, amount: float) -> bool:
+    await _simulate("paypal")
     return True
 
 
@@ -38,21 +92,161 @@ _PROCEDURAL_DISPATCH = {
     "paypal": _charge_paypal,
 }
 
+# Idempotency-Key results: a retried charge is never executed twice.
+# Process-wide so cached results survive a live rebuild of the app.
+idempotency = store_from_config("payment_charge")
 
-@app.post("/charge", response_model=PaymentResult)
-def charge(req: PaymentRequest):
-    if oop_enabled:
-        # OOP/Factory Method path
-        from .factories import PaymentProviderFactory
+# Per-method concurrency limits, deadlines and hedged authorizations.
+engine = engine_from_config()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Providers are built and started before the first request.
+    await payment_providers.warm_up()
+    yield
+    await payment_providers.close()
+
+
+def _deadline() -> Deadline:
+    # Set from the caller's X-Deadline-Ms by DeadlineMiddleware.
+    return current_deadline.get() or Deadline(config.current.http_timeout_seconds)
+
+
+def create_app(oop_enabled: Optional[bool] = None) -> FastAPI:
+    if oop_enabled is None:
+        oop_enabled = get_oop_enabled(default=True)
+
+    app = FastAPI(title="Payment Service", lifespan=lifespan, default_response_class=DEFAULT_RESPONSE_CLASS)
+
+    install_timing_middleware(app, oop_enabled)
+    install_metrics(app)
+    install_resilience(app)
+    install_tracing(app, "payment_service")
+    install_profiler(app)
+
+    def _charge_call(p: PaymentRequest):
+        """Zero-arg callable for the engine; ValueError for unknown methods."""
+        if oop_enabled:
+            # OOP/Factory Method path
+            provider = payment_providers.create(p.method)
+            return lambda: provider.charge(p.user_id, p.amount)
+
+        # Procedural path
+        fn = _PROCEDURAL_DISPATCH.get(p.method)
+        if fn is None:
+            raise ValueError(f"Unsupported payment method: {p.method}")
+        return lambda: fn(p.user_id, p.amount)
+
+    async def _charge(req: PaymentRequest, deadline: Deadline) -> PaymentResult:
         try:
-            provider = PaymentProviderFactory.create(req.method)
+            call = _charge_call(req)
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
-        ok = provider.charge(req.user_id, req.amount)
-        return PaymentResult(success=ok)
-
-    # Procedural path
-    fn = _PROCEDURAL_DISPATCH.get(req.method)
-    if fn is None:
-        raise HTTPException(status_code=400, detail=f"Unsupported payment method: {req.method}")
-    return PaymentResult(success=bool(fn(req.user_id, req.amount)))
+        try:
+            ok = await engine.call(req.method, call, deadline)
+        except ProviderTimeout as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        return PaymentResult(success=bool(ok))
+
+    @app.post("/charge", response_model=PaymentResult)
+    async def charge(
+        response: Response,
+        req: PaymentRequest = json_body(PaymentRequest),
+        idempotency_key: Optional[str] = Header(None),
+    ):
+        deadline = _deadline()
+        if idempotency_key is None:
+            return await _charge(req, deadline)
+
+        try:
+            result, replayed = await idempotency.run(
+                idempotency_key, fingerprint(req), lambda: _charge(req, deadline)
+            )
+        except IdempotencyConflict:
+            raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+        if replayed:
+            response.headers[REPLAYED_HEADER] = "true"
+        return result
+
+    @app.post("/charge/batch", response_model=PaymentBatchResult)
+    async def charge_batch(req: PaymentBatchRequest = json_body(PaymentBatchRequest)):
+        # An unsupported method or a timed-out provider fails only its own
+        # payment, not the whole batch. Payments run concurrently, each
+        # method bounded by its own semaphore.
+        deadline = _deadline()
+
+        async def charge_one(p: BatchPayment) -> PaymentResult:
+            return PaymentResult(success=bool(await engine.call(p.method, _charge_call(p), deadline)))
+
+        async def one(p: BatchPayment) -> PaymentResult:
+            try:
+                if p.idempotency_key is None:
+                    return await charge_one(p)
+                # Same fingerprint as a single /charge of this payment.
+                fp = fingerprint(PaymentRequest(user_id=p.user_id, amount=p.amount, method=p.method))
+                result, _ = await idempotency.run(p.idempotency_key, fp, lambda: charge_one(p))
+                return result
+            except (ValueError, ProviderTimeout, IdempotencyConflict):
+                return PaymentResult(success=False)
+
+        return PaymentBatchResult(results=list(await asyncio.gather(*(one(p) for p in req.payments))))
+
+    def _authorize_call(req: AuthorizationRequest):
+        if oop_enabled:
+            provider = payment_providers.create(req.method)
+            return lambda: provider.authorize(req.user_id)
+
+        if req.method not in _PROCEDURAL_DISPATCH:
+            raise ValueError(f"Unsupported payment method: {req.method}")
+
+        async def call() -> bool:
+            await _simulate(req.method)
+            return True
+        return call
+
+    @app.post("/authorize", response_model=AuthorizationResult)
+    async def authorize(req: AuthorizationRequest = json_body(AuthorizationRequest)):
+        try:
+            call = _authorize_call(req)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # Authorization has no side effects, so a slow attempt may be hedged.
+        try:
+            authorized = await engine.hedged(req.method, call, _deadline())
+        except ProviderTimeout as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        if not authorized:
+            return AuthorizationResult(authorized=False)
+        return AuthorizationResult(authorized=True, authorization_id=uuid.uuid4().hex)
+
+    def _void_call(req: VoidRequest, authorization_id: str):
+        if oop_enabled:
+            provider = payment_providers.create(req.method)
+            return lambda: provider.void(req.user_id, authorization_id)
+
+        if req.method not in _PROCEDURAL_DISPATCH:
+            raise ValueError(f"Unsupported payment method: {req.method}")
+
+        async def call() -> bool:
+            await _simulate(req.method)
+            return True
+        return call
+
+    @app.post("/authorizations/{authorization_id}/void", response_model=VoidResult)
+    async def void_authorization(authorization_id: str, req: VoidRequest = json_body(VoidRequest)):
+        try:
+            call = _void_call(req, authorization_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            ok = await engine.call(req.method, call, _deadline())
+        except ProviderTimeout as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        return VoidResult(ok=bool(ok))
+
+    return app
+
+
+# Rebuilt in place when oop_enabled changes.
+app = ReloadableApp(create_app)
@@ -1,20 +1,119 @@
+import asyncio
+import math
+import random
 from abc import ABC, abstractmethod
+from typing import Optional
+
+from common.config import get_config_value
+from common.request_log import request_log
+
+
+class SimulatedLatency:
+    """
+    Artificial provider latency for load-testing without a real gateway.
+
+    Spec strings (milliseconds), as used for payment_simulated_latency /
+    payment_<method>_latency in config.txt:
+        fixed:20            always 20 ms
+        uniform:5,50        uniform between 5 and 50 ms
+        exponential:20      exponential with a 20 ms mean
+        lognormal:20,0.5    log-normal with a 20 ms median and sigma 0.5
+    """
+
+    def __init__(self, kind: str, params: tuple, seed: Optional[int] = None) -> None:
+        self.kind = kind
+        self.params = params
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def from_spec(cls, spec: Optional[str]) -> Optional["SimulatedLatency"]:
+        if not spec:
+            return None
+        kind, _, args = spec.partition(":")
+        kind = kind.strip().lower()
+        params = tuple(float(a) for a in args.split(",") if a.strip())
+        arity = {"fixed": 1, "uniform": 2, "exponential": 1, "lognormal": 2}
+        if arity.get(kind) != len(params):
+            raise ValueError(f"Invalid simulated latency spec: {spec!r}")
+        return cls(kind, params)
+
+    def sample_ms(self) -> float:
+        rng = self._rng
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "exponential":
+            return rng.expovariate(1.0 / self.params[0])
+        median, sigma = self.params
+        return rng.lognormvariate(math.log(median), sigma)
+
+    async def wait(self) -> None:
+        await asyncio.sleep(self.sample_ms() / 1000.0)
+
+
+def latency_for(method: str) -> Optional[SimulatedLatency]:
+    """Per-method spec, falling back to the global one; None when disabled."""
+    return SimulatedLatency.from_spec(
+        get_config_value(f"payment_{method}_latency") or get_config_value("payment_simulated_latency")
+    )
 
 
 class PaymentProvider(ABC):
+    """
+    One payment method. Instances are shared flyweights (see
+    PaymentProviderFactory): one per method per process, used concurrently by
+    every request, so they must not keep per-request state.
+
+    The built-in providers are simulated (see SimulatedLatency). A provider
+    that talks to a real gateway opens its client in start(), which runs
+    during service startup, and closes it in close().
+    """
+
+    name = ""
+
+    def __init__(self) -> None:
+        self.latency = latency_for(self.name)
+
+    async def _simulate(self) -> None:
+        if self.latency is not None:
+            await self.latency.wait()
+
     @abstractmethod
-    def charge(self, user_id: str, amount: float) -> bool:
+    async def charge(self, user_id: str, amount: float) -> bool:
         """Return True if payment succeeded."""
         raise NotImplementedError
 
+    async def authorize(self, user_id: str) -> bool:
+        """Pre-authorize the user for this method before the amount is known."""
+        await self._simulate()
+        return True
+
+    async def void(self, user_id: str, authorization_id: str) -> bool:
+        """Releases a pre-authorization that will not be charged."""
+        await self._simulate()
+        return True
+
+    async def start(self) -> None:
+        """Opens connections to the provider's gateway (no-op for simulated providers)."""
+
+    async def close(self) -> None:
+        """Releases what start() opened."""
+
 
 class CreditCardProvider(PaymentProvider):
-    def charge(self, user_id: str, amount: float) -> bool:
-        print(f"[CreditCard] Charging user={user_id}, amount={amount}")
+    name = "credit_card"
+
+    async def charge(self, user_id: str, amount: float) -> bool:
+        await self._simulate()
+        request_log.event("CreditCard", "charging", user_id=user_id, amount=amount)
         return True  # pretend always succeeds
 
 
 class PayPalProvider(PaymentProvider):
-    def charge(self, user_id: str, amount: float) -> bool:
-        print(f"[PayPal] Charging user={user_id}, amount={amount}")
+    name = "paypal"
+
+    async def charge(self, user_id: str, amount: float) -> bool:
+        await self._simulate()
+        request_log.event("PayPal", "charging", user_id=user_id, amount=amount)
         return True
@@ -0,0 +1,6 @@
+#!/bin/sh
+# Linux: start all services with N workers each under the launcher/supervisor.
+# Options override config.txt, e.g. ./start_services.sh --workers 4 --uds-dir /run/checkout
+# In another shell, `python -m launcher wait` returns once everything is warm.
+cd "$(dirname "$0")" || exit 1
+exec python -m launcher "$@"